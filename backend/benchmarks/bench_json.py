@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import List
+import httpx
+from pydantic import TypeAdapter
+from benchmarks import harness
+def serialization_only(server, outfits: List[dict], repeats: int):
+    adapter = TypeAdapter(List[server.Outfit])
+    def validated():
+        parsed = [dict(o, created_at=server.datetime.fromisoformat(o["created_at"]), last_used=server.datetime.fromisoformat(o["last_used"]) if o["last_used"] else None) for o in outfits]
+        return json.dumps(adapter.dump_python(adapter.validate_python(parsed), mode="json"), ensure_ascii=False, separators=(",", ":")).encode()
+    def fast():
+        return server.dump_json([server.public_outfit(o) for o in outfits])
+    rows = {}
+    for name, encode in (("validated", validated), ("fast", fast)):
+        timings = []
+        for _ in range(repeats):
+            started = time.process_time()
+            payload = encode()
+            timings.append(time.process_time() - started)
+        rows[name] = (statistics.median(timings), len(payload))
+    return rows
+async def end_to_end(server, client, user: dict, path: str, repeats: int):
+    rows = {}
+    for fast in (False, True):
+        server.FAST_JSON_RESPONSES = fast
+        await client.get(path, headers=harness.auth(user))
+        cpu, wall = [], []
+        for _ in range(repeats):
+            cpu_started, wall_started = time.process_time(), time.perf_counter()
+            response = await client.get(path, headers=harness.auth(user))
+            cpu.append(time.process_time() - cpu_started)
+            wall.append(time.perf_counter() - wall_started)
+            response.raise_for_status()
+        rows["fast" if fast else "validated"] = (statistics.median(cpu), harness.percentile(wall, 0.99), len(response.content))
+    return rows
+async def run(args, upload_dir: Path):
+    server = harness.load_app(upload_dir)
+    ctx = await harness.seed(server, args.sizes, groups=1, members_per_group=len(args.sizes), shares_per_member=args.shares, image_ratio=0.5)
+    encoder = "orjson" if server.orjson is not None else "json"
+    print(f"fast path encoder: {encoder}")
+    print(f"\n{'items':>6} {'path':>10} {'cpu ms':>8} {'bytes':>9}   (serialization only)")
+    for user in ctx["users"]:
+        outfits = await server.db.outfits.find({"user_id": user["id"]}, {"_id": 0}).to_list(None)
+        await server.resolve_image_urls(outfits, "http://bench")
+        for name, (cpu, size) in serialization_only(server, outfits, args.repeats).items():
+            print(f"{len(outfits):>6} {name:>10} {cpu * 1000:>8.2f} {size:>9}")
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"\n{'endpoint':>28} {'path':>10} {'cpu ms/req':>11} {'p99 ms':>8} {'bytes':>9}")
+        for user in ctx["users"]:
+            for label, path in ((f"/api/outfits ({user['wardrobe_size']})", "/api/outfits"), ("/api/groups", "/api/groups"), ("/api/groups/{id}", f"/api/groups/{ctx['group_ids'][0]}")):
+                if user is not ctx["users"][-1] and not path.endswith("/api/outfits"):
+                    continue
+                for name, (cpu, p99, size) in (await end_to_end(server, client, user, path, args.repeats)).items():
+                    print(f"{label:>28} {name:>10} {cpu * 1000:>11.2f} {p99 * 1000:>8.1f} {size:>9}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CPU per request for validated versus fast JSON list responses")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--shares", type=int, default=50, help="outfits each member shares to the benchmark group")
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+    harness.configure_environment(0)
+    with harness.temporary_upload_dir() as upload_dir:
+        asyncio.run(run(args, Path(upload_dir)))
@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import time
+from pathlib import Path
+import httpx
+from benchmarks import harness
+MIXES = {
+    "browse": {"outfits": 45, "group": 20, "image": 20, "upload": 5, "suggest_fast": 10},
+    "suggest": {"suggest_fast": 50, "suggest_ai": 25, "suggest_weather": 25},
+    "full": {"outfits": 35, "group": 15, "image": 20, "upload": 5, "suggest_fast": 10, "suggest_ai": 8, "suggest_weather": 7},
+}
+def parse_mix(value: str) -> dict:
+    if value in MIXES:
+        return MIXES[value]
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in harness.SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, choose from {', '.join(harness.SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+async def run(args, upload_dir: Path):
+    server = harness.load_app(upload_dir)
+    started = time.perf_counter()
+    ctx = await harness.seed(server, args.sizes, groups=args.groups, members_per_group=args.members)
+    print(f"seeded {len(ctx['users'])} users ({sum(args.sizes)} outfits), {len(ctx['group_ids'])} groups in {time.perf_counter() - started:.1f}s")
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        await harness.run_mix(client, ctx, args.mix, min(args.requests, 50), args.concurrency)
+        if args.per_scenario:
+            for name in args.mix:
+                result = await harness.run_mix(client, ctx, {name: 1}, args.requests, args.concurrency)
+                harness.report(name, result)
+        result = await harness.run_mix(client, ctx, args.mix, args.requests, args.concurrency)
+        harness.report("mix " + ",".join(f"{name}={weight:g}" for name, weight in args.mix.items()), result)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency of the main API paths against an in-memory Mongo and fake upstreams")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="wardrobe size of each seeded user")
+    parser.add_argument("--users-per-size", type=int, default=3)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--members", type=int, default=6)
+    parser.add_argument("--mix", type=parse_mix, default=MIXES["browse"], help=f"preset ({', '.join(MIXES)}) or scenario=weight,...")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--per-scenario", action="store_true", help="also run each scenario of the mix on its own")
+    parser.add_argument("--port", type=int, default=8776)
+    args = parser.parse_args()
+    args.sizes = [size for size in args.sizes for _ in range(args.users_per_size)]
+    harness.configure_environment(args.port)
+    fake_upstreams = harness.start_fake_upstreams(args.port)
+    try:
+        with harness.temporary_upload_dir() as upload_dir:
+            asyncio.run(run(args, Path(upload_dir)))
+    finally:
+        fake_upstreams.terminate()
+        fake_upstreams.wait()
@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+import httpx
+from fastapi import FastAPI, Request
+from openai import AsyncOpenAI
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+import server
+logging.getLogger("httpx").setLevel(logging.WARNING)
+PREFILL_SECONDS_PER_TOKEN = 0.0004
+BASE_LATENCY_SECONDS = 0.05
+fake_model_app = FastAPI()
+@fake_model_app.post("/v1/chat/completions")
+async def fake_chat_completion(request: Request):
+    body = await request.json()
+    prompt_tokens = sum(server.estimate_tokens(message["content"]) for message in body["messages"])
+    await asyncio.sleep(BASE_LATENCY_SECONDS + prompt_tokens * PREFILL_SECONDS_PER_TOKEN)
+    return {
+        "id": "bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": '{"suggestions": []}'}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 4, "total_tokens": prompt_tokens + 4},
+    }
+COLORS = ["red", "navy", "black", "white", "olive green", "mustard", "pink", "beige", "teal", "grey", "brown", "blue"]
+def synthetic_wardrobe(size: int):
+    rng = random.Random(size)
+    return [
+        {
+            "id": str(i),
+            "name": f"{rng.choice(COLORS).title()} {rng.choice(['shirt', 'dress', 'jacket', 'kurta', 'hoodie', 'trousers'])} {i}",
+            "category": rng.choice(server.RECOMMENDER_CATEGORIES),
+            "season": rng.choice(server.RECOMMENDER_SEASONS),
+            "color": rng.choice(COLORS),
+            "usage_count": rng.randint(0, 40),
+        }
+        for i in range(size)
+    ]
+def describe(outfit):
+    return f"- {outfit['name']} ({outfit['category']}, {outfit['color']}, {outfit['season']} season)"
+INTRO = "The weather in Benchtown is 8°C with light rain. These items in my wardrobe suit it:\n"
+INSTRUCTIONS = "Pick the 3 items best suited to this weather, best first. Reply with a JSON object."
+async def measure(client: AsyncOpenAI, prompt: str, repeats: int):
+    latencies = []
+    prompt_tokens = 0
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = await client.chat.completions.create(model="bench", messages=[{"role": "user", "content": prompt}])
+        latencies.append(time.perf_counter() - started)
+        prompt_tokens = response.usage.prompt_tokens
+    return prompt_tokens, statistics.median(latencies)
+async def run(port: int, sizes, budgets, repeats: int):
+    client = AsyncOpenAI(base_url=f"http://127.0.0.1:{port}/v1", api_key="bench")
+    print(f"{'items':>6} {'prompt':>12} {'tokens':>7} {'listed':>7} {'build ms':>9} {'llm ms':>8}")
+    for size in sizes:
+        outfits = synthetic_wardrobe(size)
+        verbatim = INTRO + "\n".join(describe(o) for o in outfits) + "\n\n" + INSTRUCTIONS
+        tokens, latency = await measure(client, verbatim, repeats)
+        print(f"{size:>6} {'verbatim':>12} {tokens:>7} {size:>7} {0.0:>9.2f} {latency * 1000:>8.1f}")
+        index = server.WardrobeIndex(outfits)
+        for budget in budgets:
+            started = time.perf_counter()
+            prompt, _, stats = server.build_wardrobe_prompt(
+                index.outfits, index.features(), INTRO, INSTRUCTIONS, describe, temperature=8, token_budget=budget
+            )
+            build_ms = (time.perf_counter() - started) * 1000
+            tokens, latency = await measure(client, prompt, repeats)
+            print(f"{size:>6} {f'budget={budget}':>12} {tokens:>7} {stats['items_listed']:>7} {build_ms:>9.2f} {latency * 1000:>8.1f}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM latency versus prompt size against a local fake model server")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--budgets", type=int, nargs="+", default=[200, 600, 1200])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8775)
+    args = parser.parse_args()
+    fake_server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_prompt_budget:fake_model_app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR
+    )
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{args.port}/docs")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        asyncio.run(run(args.port, args.sizes, args.budgets, args.repeats))
+    finally:
+        fake_server.terminate()
+        fake_server.wait()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.harness import BACKEND_DIR
+MODES = {
+    "eager": {"FAST_STARTUP": "false"},
+    "fast": {"FAST_STARTUP": "true", "STARTUP_WARMUP": "false"},
+    "fast+warmup": {"FAST_STARTUP": "true", "STARTUP_WARMUP": "true"},
+}
+def gauge(text: str, name: str) -> float:
+    match = re.search(rf"^{name} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else float("nan")
+def start_once(env: dict, port: int) -> dict:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            try:
+                if httpx.get(f"{base_url}/api/health").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.005)
+        first_request = time.perf_counter() - started
+        first_login_started = time.perf_counter()
+        try:
+            httpx.post(f"{base_url}/api/auth/login", json={"username": "bench", "password": "bench"}, timeout=30)
+        except httpx.HTTPError:
+            pass
+        first_login = time.perf_counter() - first_login_started
+        metrics = httpx.get(f"{base_url}/metrics").text
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "first_request": first_request,
+        "import": gauge(metrics, "startup_import_seconds"),
+        "ready": gauge(metrics, "startup_ready_seconds"),
+        "first_login": first_login,
+    }
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time to first request with and without FAST_STARTUP")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8777)
+    parser.add_argument("--mongo-uri", default="mongodb://127.0.0.1:27017/?serverSelectionTimeoutMS=300", help="point at a real mongod for representative index-creation and login timings")
+    args = parser.parse_args()
+    print(f"{'mode':>12} {'import ms':>10} {'ready ms':>9} {'first req ms':>13} {'first login ms':>15}")
+    for mode in args.modes:
+        env = {**os.environ, "MONGO_URI": args.mongo_uri, "IMAGE_GC_INTERVAL_SECONDS": "0", "METRICS_TOKEN": "", **MODES[mode]}
+        runs = [start_once(env, args.port) for _ in range(args.repeats)]
+        row = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+        print(f"{mode:>12} {row['import']:>10.0f} {row['ready']:>9.0f} {row['first_request']:>13.0f} {row['first_login']:>15.0f}")
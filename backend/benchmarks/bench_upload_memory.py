@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+import httpx
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+from fastapi import FastAPI, File, UploadFile
+from server import UploadSizeLimitMiddleware, read_upload_limited
+buffered_app = FastAPI()
+@buffered_app.post("/upload")
+async def buffered_upload(file: UploadFile = File(...)):
+    content = await file.read()
+    return {"size": len(content)}
+limited_app = FastAPI()
+limited_app.add_middleware(UploadSizeLimitMiddleware)
+@limited_app.post("/upload")
+async def limited_upload(file: UploadFile = File(...)):
+    content = await read_upload_limited(file)
+    return {"size": len(content)}
+def peak_rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status_file:
+        for line in status_file:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+async def multipart_body(size_mb: int):
+    boundary = b"benchboundary"
+    yield b"--" + boundary + b"\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.jpg\"\r\nContent-Type: image/jpeg\r\n\r\n"
+    chunk = b"\xff\xd8\xff" + b"\0" * (1024 * 1024 - 3)
+    for _ in range(size_mb):
+        yield chunk
+    yield b"\r\n--" + boundary + b"--\r\n"
+async def send_upload(client: httpx.AsyncClient, url: str, size_mb: int):
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            url,
+            content=multipart_body(size_mb),
+            headers={"Content-Type": "multipart/form-data; boundary=benchboundary"}
+        )
+        code = response.status_code
+    except httpx.HTTPError:
+        code = "closed"
+    return code, time.perf_counter() - started
+async def run_client(port: int, concurrency: int, size_mb: int):
+    async with httpx.AsyncClient(timeout=120) as client:
+        return await asyncio.gather(*[send_upload(client, f"http://127.0.0.1:{port}/upload", size_mb) for _ in range(concurrency)])
+def bench_mode(mode: str, port: int, concurrency: int, size_mb: int):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"benchmarks.bench_upload_memory:{mode}_app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR
+    )
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/docs")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        idle_kb = peak_rss_kb(server.pid)
+        results = asyncio.run(run_client(port, concurrency, size_mb))
+        peak_kb = peak_rss_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    codes = sorted({str(code) for code, _ in results})
+    slowest = max(elapsed for _, elapsed in results)
+    print(f"{mode:>9}: status={','.join(codes)} idle_rss={idle_kb / 1024:.1f}MB peak_rss={peak_kb / 1024:.1f}MB "
+          f"growth={(peak_kb - idle_kb) / 1024:.1f}MB slowest={slowest:.2f}s")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak server RSS under concurrent oversized uploads")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("BENCH_CONCURRENCY", 10)))
+    parser.add_argument("--size-mb", type=int, default=int(os.environ.get("BENCH_SIZE_MB", 50)))
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    print(f"{args.concurrency} concurrent uploads of {args.size_mb}MB each")
+    bench_mode("buffered", args.port, args.concurrency, args.size_mb)
+    bench_mode("limited", args.port + 1, args.concurrency, args.size_mb)
@@ -0,0 +1,232 @@
+import asyncio
+import io
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import httpx
+from fastapi import FastAPI, Request
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+logging.getLogger("httpx").setLevel(logging.WARNING)
+FAKE_LLM_LATENCY_SECONDS = float(os.environ.get("FAKE_LLM_LATENCY_SECONDS", 0.2))
+FAKE_WEATHER_LATENCY_SECONDS = float(os.environ.get("FAKE_WEATHER_LATENCY_SECONDS", 0.03))
+CATEGORIES = ["casual", "formal", "sport", "traditional"]
+SEASONS = ["all", "spring", "summer", "fall", "winter"]
+COLORS = ["red", "navy", "black", "white", "olive green", "mustard", "pink", "beige", "teal", "grey", "brown", "blue"]
+GARMENTS = ["shirt", "dress", "jacket", "kurta", "hoodie", "trousers", "saree", "blazer", "skirt", "sweater"]
+fake_upstream_app = FastAPI()
+@fake_upstream_app.post("/v1/chat/completions")
+async def fake_chat_completion(request: Request):
+    body = await request.json()
+    await asyncio.sleep(FAKE_LLM_LATENCY_SECONDS)
+    content = '{"suggestions": [{"outfit_name": "Bench outfit", "reason": "Looks good", "styling_tip": "Add a belt"}]}'
+    return {
+        "id": "bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+@fake_upstream_app.get("/forecast")
+async def fake_forecast():
+    await asyncio.sleep(FAKE_WEATHER_LATENCY_SECONDS)
+    return {"current_weather": {"temperature": 14.5, "weathercode": 61}}
+@fake_upstream_app.get("/reverse")
+async def fake_reverse_geocode():
+    await asyncio.sleep(FAKE_WEATHER_LATENCY_SECONDS)
+    return {"address": {"city": "Benchtown"}}
+def start_fake_upstreams(port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.harness:fake_upstream_app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/forecast")
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("fake upstream server did not start")
+def configure_environment(upstream_port: int):
+    os.environ.update({
+        "IMAGE_STORE_PRIMARY": "local",
+        "IMAGE_STORE_COLD": "",
+        "IMAGE_GC_INTERVAL_SECONDS": "0",
+        "RATE_LIMIT_ENABLED": "false",
+        "OPENROUTER_API_KEY": "bench",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{upstream_port}/v1",
+        "WEATHER_API_URL": f"http://127.0.0.1:{upstream_port}/forecast",
+        "GEOCODE_API_URL": f"http://127.0.0.1:{upstream_port}/reverse",
+        "AI_RATE_LIMIT_PER_MINUTE": "1000000",
+        "AI_RATE_LIMIT_PER_DAY": "1000000",
+    })
+def load_app(upload_dir: Path):
+    from mongomock_motor import AsyncMongoMockClient
+    import server
+    server.db = AsyncMongoMockClient()["bench"]
+    server.UPLOAD_DIR = upload_dir
+    server.image_stores["local"] = server.LocalImageStore(upload_dir)
+    return server
+def synthetic_png(rng: random.Random, size: int = 96) -> bytes:
+    from PIL import Image
+    image = Image.new("RGB", (size, size), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+def synthetic_outfit(rng: random.Random, user_id: str, index: int, now: datetime) -> dict:
+    color = rng.choice(COLORS)
+    last_used = now - timedelta(days=rng.randint(0, 365)) if rng.random() < 0.7 else None
+    return {
+        "id": f"{user_id}-outfit-{index}",
+        "user_id": user_id,
+        "name": f"{color.title()} {rng.choice(GARMENTS)} {index}",
+        "category": rng.choice(CATEGORIES),
+        "season": rng.choice(SEASONS),
+        "color": color,
+        "image_url": None,
+        "image_id": None,
+        "local_path": None,
+        "storage_type": None,
+        "image_hash": None,
+        "usage_count": rng.randint(0, 40),
+        "last_used": last_used.isoformat() if last_used else None,
+        "created_at": (now - timedelta(days=rng.randint(0, 730))).isoformat(),
+    }
+async def seed(server, wardrobe_sizes, groups: int = 10, members_per_group: int = 8, shares_per_member: int = 3, image_pool: int = 20, image_ratio: float = 0.5, seed_value: int = 42) -> dict:
+    rng = random.Random(seed_value)
+    db = server.db
+    now = datetime.now(timezone.utc)
+    password_hash = server.lazy_import("passlib.hash").bcrypt.hash("bench-password")
+    blobs = []
+    for _ in range(image_pool):
+        blobs.append(await server.store_image_blob(synthetic_png(rng), ".png"))
+    users = []
+    for i, size in enumerate(wardrobe_sizes):
+        user_id = f"bench-user-{i}"
+        await db.users.insert_one({
+            "id": user_id,
+            "username": f"bench{i}",
+            "email": f"bench{i}@example.com",
+            "password_hash": password_hash,
+            "gender": rng.choice(["female", "male"]),
+            "created_at": now.isoformat(),
+        })
+        outfits = []
+        for j in range(size):
+            outfit = synthetic_outfit(rng, user_id, j, now)
+            if rng.random() < image_ratio:
+                outfit.update(server.image_fields_from_blob(rng.choice(blobs)))
+            outfits.append(outfit)
+        for start in range(0, len(outfits), 1000):
+            await db.outfits.insert_many(outfits[start:start + 1000])
+        users.append({
+            "id": user_id,
+            "username": f"bench{i}",
+            "wardrobe_size": size,
+            "token": server.create_jwt_token(user_id, f"bench{i}"),
+            "outfit_ids": [outfit["id"] for outfit in outfits],
+        })
+    group_ids = []
+    for g in range(groups):
+        members = rng.sample(users, min(members_per_group, len(users)))
+        group_id = f"bench-group-{g}"
+        await db.groups.insert_one({
+            "id": group_id,
+            "name": f"Bench group {g}",
+            "description": None,
+            "creator_id": members[0]["id"],
+            "members": [member["id"] for member in members],
+            "invite_code": f"BENCH{g:03d}",
+            "created_at": now.isoformat(),
+        })
+        shares = []
+        for member in members:
+            for outfit_id in rng.sample(member["outfit_ids"], min(shares_per_member, len(member["outfit_ids"]))):
+                shares.append({"id": f"{group_id}-{outfit_id}", "group_id": group_id, "outfit_id": outfit_id, "shared_by_user_id": member["id"], "shared_at": now.isoformat()})
+        if shares:
+            await db.shared_outfits_to_group.insert_many(shares)
+        ratings = [
+            {"id": f"{share['id']}-{member['id']}", "group_id": group_id, "outfit_id": share["outfit_id"], "user_id": member["id"], "rating": rng.randint(1, 5), "rated_at": now.isoformat()}
+            for share in shares
+            for member in members
+            if member["id"] != share["shared_by_user_id"] and rng.random() < 0.6
+        ]
+        if ratings:
+            await db.outfit_ratings.insert_many(ratings)
+        for member in members:
+            member.setdefault("group_ids", []).append(group_id)
+        group_ids.append(group_id)
+    return {"users": users, "group_ids": group_ids, "image_urls": [blob["image_url"] for blob in blobs], "png": synthetic_png(rng)}
+def auth(user: dict) -> dict:
+    return {"Authorization": f"Bearer {user['token']}"}
+async def list_outfits(client, ctx, rng):
+    return await client.get("/api/outfits", headers=auth(rng.choice(ctx["users"])))
+async def group_details(client, ctx, rng):
+    user = rng.choice([user for user in ctx["users"] if user.get("group_ids")])
+    return await client.get(f"/api/groups/{rng.choice(user['group_ids'])}", headers=auth(user))
+async def upload_outfit(client, ctx, rng):
+    user = rng.choice(ctx["users"])
+    data = {"name": f"upload {rng.getrandbits(48)}", "category": rng.choice(CATEGORIES), "season": rng.choice(SEASONS), "color": rng.choice(COLORS)}
+    return await client.post("/api/outfits", data=data, files={"image": ("bench.png", ctx["png"], "image/png")}, headers=auth(user))
+async def download_image(client, ctx, rng):
+    return await client.get(rng.choice(ctx["image_urls"]))
+async def fast_suggestions(client, ctx, rng):
+    return await client.post("/api/suggestions/ai?fast=true", headers=auth(rng.choice(ctx["users"])))
+async def ai_suggestions(client, ctx, rng):
+    return await client.post("/api/suggestions/ai", headers=auth(rng.choice(ctx["users"])))
+async def weather_suggestions(client, ctx, rng):
+    return await client.get("/api/suggestions/weather?lat=17.4&lon=78.5", headers=auth(rng.choice(ctx["users"])))
+SCENARIOS = {
+    "outfits": list_outfits,
+    "group": group_details,
+    "upload": upload_outfit,
+    "image": download_image,
+    "suggest_fast": fast_suggestions,
+    "suggest_ai": ai_suggestions,
+    "suggest_weather": weather_suggestions,
+}
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+async def run_mix(client, ctx, mix: dict, total_requests: int, concurrency: int, seed_value: int = 7) -> dict:
+    rng = random.Random(seed_value)
+    names = list(mix)
+    plan = rng.choices(names, weights=[mix[name] for name in names], k=total_requests)
+    results = {name: {"latencies": [], "errors": 0} for name in names}
+    queue = iter(plan)
+    async def worker(worker_id: int):
+        worker_rng = random.Random(seed_value * 1000 + worker_id)
+        for name in queue:
+            started = time.perf_counter()
+            try:
+                response = await SCENARIOS[name](client, ctx, worker_rng)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            results[name]["latencies"].append(time.perf_counter() - started)
+            if failed:
+                results[name]["errors"] += 1
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"elapsed": elapsed, "requests": total_requests, "scenarios": results}
+def report(label: str, result: dict):
+    elapsed = result["elapsed"]
+    print(f"\n{label}: {result['requests']} requests in {elapsed:.2f}s ({result['requests'] / elapsed:.1f} req/s)")
+    print(f"{'scenario':>16} {'count':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, data in result["scenarios"].items():
+        latencies = data["latencies"]
+        print(f"{name:>16} {len(latencies):>6} {data['errors']:>6} {len(latencies) / elapsed:>8.1f} {percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f}")
+def temporary_upload_dir() -> tempfile.TemporaryDirectory:
+    return tempfile.TemporaryDirectory(prefix="wardrobe-bench-")
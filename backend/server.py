@@ -1,51 +1,552 @@
+import time
+IMPORT_STARTED = time.perf_counter()
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, File, UploadFile, Form, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, RedirectResponse
+from fastapi.responses import Response, StreamingResponse, JSONResponse, FileResponse, RedirectResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument, CursorType, monitoring
+from pymongo.errors import DuplicateKeyError, CollectionInvalid
 from io import BytesIO
 import os
+import sys
 import logging
 import json
 import uuid
+import hashlib
+import math
+import re
+import hmac
+import base64
+import asyncio
+import importlib
+import heapq
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict, Any
+from collections import OrderedDict, Counter, defaultdict
+from urllib.parse import parse_qs
 from datetime import datetime, timezone, timedelta
 import jwt
-from passlib.hash import bcrypt
-import httpx
-from openai import AsyncOpenAI, RateLimitError
 import traceback
 import aiofiles
-from PIL import Image
+import numpy as np
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import io
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME","fashion")
-mongo_client = AsyncIOMotorClient(MONGO_URI)
-db = mongo_client[MONGO_DB_NAME]
-gridfs_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="outfit_images")
-profile_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="profile_images")
+FAST_STARTUP = os.environ.get("FAST_STARTUP", "false").lower() == "true"
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "true").lower() == "true"
+LAZY_MODULES = ("passlib.hash", "PIL.Image", "httpx", "openai")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[tuple, float] = {}
+        self.gauges: Dict[tuple, float] = {}
+        self.histograms: Dict[tuple, list] = {}
+        self.buckets: Dict[str, tuple] = {}
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+    def set(self, name: str, value: float, labels: tuple = ()):
+        with self.lock:
+            self.gauges[(name, labels)] = value
+    def add(self, name: str, value: float, labels: tuple = ()):
+        with self.lock:
+            self.gauges[(name, labels)] = self.gauges.get((name, labels), 0) + value
+    def observe(self, name: str, value: float, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        with self.lock:
+            self.buckets.setdefault(name, buckets)
+            entry = self.histograms.get((name, labels))
+            if entry is None:
+                entry = self.histograms[(name, labels)] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+    def counter_value(self, name: str, labels: tuple = ()) -> float:
+        return self.counters.get((name, labels), 0)
+    @staticmethod
+    def format_labels(labels: tuple) -> str:
+        if not labels:
+            return ""
+        escaped = [(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in labels]
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                seen = set()
+                for (name, labels), value in sorted(series.items()):
+                    if name not in seen:
+                        seen.add(name)
+                        lines.append(f"# TYPE {name} {kind}")
+                    lines.append(f"{name}{self.format_labels(labels)} {value}")
+            seen = set()
+            for (name, labels), (counts, total, count) in sorted(self.histograms.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                for bound, bucket_count in zip(self.buckets[name], counts):
+                    lines.append(f"{name}_bucket{self.format_labels(labels + (('le', bound),))} {bucket_count}")
+                lines.append(f"{name}_bucket{self.format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{self.format_labels(labels)} {total}")
+                lines.append(f"{name}_count{self.format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+metrics = Metrics()
+request_metrics: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_metrics", default=None)
+@contextmanager
+def timed(kind: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("work_duration_seconds", elapsed, (("kind", kind),))
+        current = request_metrics.get()
+        if current is not None:
+            current[kind] = current.get(kind, 0.0) + elapsed
+lazy_modules: Dict[str, Any] = {}
+def lazy_import(name: str):
+    module = lazy_modules.get(name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        lazy_modules[name] = module
+        metrics.set("lazy_import_seconds", time.perf_counter() - started, (("module", name),))
+    return module
+if not FAST_STARTUP:
+    for module_name in LAZY_MODULES:
+        lazy_import(module_name)
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        current = request_metrics.get()
+        if current is not None:
+            current["mongo_ops"] += 1
+    def succeeded(self, event):
+        metrics.observe("mongo_command_duration_seconds", event.duration_micros / 1e6, (("command", event.command_name),))
+    def failed(self, event):
+        metrics.inc("mongo_command_failures_total", (("command", event.command_name),))
+mongo_client: Optional[AsyncIOMotorClient] = None
+db = None
+gridfs_bucket: Optional[AsyncIOMotorGridFSBucket] = None
+profile_bucket: Optional[AsyncIOMotorGridFSBucket] = None
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your_jwt_secret_key_change_in_production')
 JWT_ALGORITHM = 'HS256'
+IMAGE_URL_SECRET = os.environ.get('IMAGE_URL_SECRET') or JWT_SECRET
 JWT_EXPIRATION_HOURS = 24
 OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
+OPENROUTER_BASE_URL = os.environ.get('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
+AI_MODEL = os.environ.get('AI_MODEL', 'z-ai/glm-4.5-air:free')
+AI_MODELS = [model.strip() for model in os.environ.get('AI_MODELS', AI_MODEL).split(',') if model.strip()]
+AI_TIMEOUT_SECONDS = float(os.environ.get('AI_TIMEOUT_SECONDS', 20))
+AI_HEDGE_DELAY_SECONDS = float(os.environ.get('AI_HEDGE_DELAY_SECONDS', 0))
+AI_RATE_LIMIT_PER_MINUTE = int(os.environ.get('AI_RATE_LIMIT_PER_MINUTE', 20))
+AI_RATE_LIMIT_PER_DAY = int(os.environ.get('AI_RATE_LIMIT_PER_DAY', 50))
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'https://api.open-meteo.com/v1/forecast')
+GEOCODE_API_URL = os.environ.get('GEOCODE_API_URL', 'https://geocode.maps.co/reverse')
+WEATHER_TIMEOUT_SECONDS = float(os.environ.get('WEATHER_TIMEOUT_SECONDS', 3))
+UPSTREAM_FAILURE_THRESHOLD = 5
+UPSTREAM_RESET_SECONDS = 30
+AI_PROMPT_TOKEN_BUDGET = int(os.environ.get('AI_PROMPT_TOKEN_BUDGET', 600))
+AI_PROMPT_MAX_ITEMS = 30
+SUGGESTION_PRECOMPUTE_ENABLED = os.environ.get("SUGGESTION_PRECOMPUTE_ENABLED", "false").lower() == "true"
+SUGGESTION_PRECOMPUTE_HOUR = int(os.environ.get("SUGGESTION_PRECOMPUTE_HOUR", 3))
+SUGGESTION_PRECOMPUTE_ACTIVE_DAYS = int(os.environ.get("SUGGESTION_PRECOMPUTE_ACTIVE_DAYS", 7))
+SUGGESTION_PRECOMPUTE_LLM_RESERVE = float(os.environ.get("SUGGESTION_PRECOMPUTE_LLM_RESERVE", 0.5))
+SUGGESTION_PRECOMPUTE_MAX_WAIT_SECONDS = 300
+SUGGESTION_PRECOMPUTE_LEASE_SECONDS = 3600
+GROUP_STATS_RECONCILE_INTERVAL_SECONDS = int(os.environ.get("GROUP_STATS_RECONCILE_INTERVAL_SECONDS", 21600))
+GROUP_STATS_TOP_LIMIT = 5
+GROUP_STATS_WEEKS = 12
+SUGGESTION_GRID_DEGREES = float(os.environ.get("SUGGESTION_GRID_DEGREES", 0.25))
+AI_PROMPT_MAX_PER_GROUP = 2
+AI_PROMPT_SUMMARY_TOKENS = 60
 FRONTEND_URL = "https://smartwardrobe-s91s.onrender.com"
 UPLOAD_DIR = ROOT_DIR / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
 MAX_FILE_SIZE = 5 * 1024 * 1024  
+MAX_UPLOAD_REQUEST_SIZE = MAX_FILE_SIZE + 64 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+UNMANAGED_UPLOAD_PREFIX = "upload-"
+IMAGE_STORE_PRIMARY = os.environ.get("IMAGE_STORE_PRIMARY", "gridfs")
+S3_BUCKET = os.environ.get("S3_BUCKET")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+S3_REGION = os.environ.get("S3_REGION")
+IMAGE_STORE_COLD = os.environ.get("IMAGE_STORE_COLD") or ("s3" if S3_BUCKET else None)
+IMAGE_COLD_AFTER_DAYS = int(os.environ.get("IMAGE_COLD_AFTER_DAYS", 30))
+IMAGE_TIER_INTERVAL_SECONDS = int(os.environ.get("IMAGE_TIER_INTERVAL_SECONDS", 3600))
+IMAGE_TIER_BATCH_SIZE = 50
+IMAGE_TIER_CONCURRENCY = 4
+IMAGE_ACCESS_TOUCH_SECONDS = 3600
+IMAGE_GC_GRACE_SECONDS = int(os.environ.get("IMAGE_GC_GRACE_SECONDS", 3600))
+IMAGE_GC_INTERVAL_SECONDS = int(os.environ.get("IMAGE_GC_INTERVAL_SECONDS", 0))
+IMAGE_GC_BATCH_SIZE = 100
+IMAGE_GC_BATCH_PAUSE_SECONDS = 0.5
+ADMIN_USER_IDS = {user_id.strip() for user_id in os.environ.get("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
+WARDROBE_INDEX_MEMORY_BUDGET = int(os.environ.get("WARDROBE_INDEX_MEMORY_BUDGET", 64 * 1024 * 1024))
+WARDROBE_INDEX_TTL_SECONDS = int(os.environ.get("WARDROBE_INDEX_TTL_SECONDS", 300))
+WARDROBE_INDEX_LOAD_LIMIT = 10000
+WARDROBE_COMMIT_WAIT_SECONDS = 2.0
+WARDROBE_COMMIT_POLL_SECONDS = 0.01
+USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", 0))
+USER_CACHE_MAX_ENTRIES = 10000
+INVALIDATION_BUS = os.environ.get("INVALIDATION_BUS", "mongo")
+INVALIDATION_COLLECTION = "invalidation_events"
+INVALIDATION_CAPPED_BYTES = 1024 * 1024
+INVALIDATION_POLL_SECONDS = float(os.environ.get("INVALIDATION_POLL_SECONDS", 1))
+INVALIDATION_RESUME_MARGIN_SECONDS = 30
+INVALIDATION_SEEN_LIMIT = 4096
+INVALIDATION_EVENT_TTL_SECONDS = 3600
+INVALIDATION_KINDS = {"wardrobe", "user", "group"}
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+WARDROBE_INDEX_ITEM_BYTES = 1024
+WARDROBE_SEARCH_ITEM_BYTES = 512
+SEARCH_FIELD_WEIGHTS = {"name": 1.0, "category": 0.8, "color": 0.8}
+SEARCH_MIN_SIMILARITY = 0.3
+COMBINATION_MAX_LOOKS = 20
+DUPLICATE_HASH_BANDS = 4
+DUPLICATE_BAND_BITS = 16
+DUPLICATE_SEARCH_LIMIT = 2 * DUPLICATE_HASH_BANDS - 1
+DUPLICATE_MAX_DISTANCE = min(int(os.environ.get("DUPLICATE_MAX_DISTANCE", 6)), DUPLICATE_SEARCH_LIMIT)
+DUPLICATE_HINT_LIMIT = 5
+DUPLICATE_SCAN_CONCURRENCY = 4
+WARDROBE_DUPLICATE_ITEM_BYTES = 256
+COMBINATION_HARMONY_WEIGHT = 0.8
+COMBINATION_LAYER_BELOW_C = 18
+SIGNED_IMAGE_URLS = os.environ.get("SIGNED_IMAGE_URLS", "true").lower() == "true"
+SIGNED_URL_TTL_SECONDS = int(os.environ.get("SIGNED_URL_TTL_SECONDS", 900))
+IMAGE_STATIC_BASE_URL = os.environ.get("IMAGE_STATIC_BASE_URL", "").rstrip("/")
+IMAGE_CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".gif": "image/gif", ".webp": "image/webp"}
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get("EVENT_LOOP_LAG_INTERVAL_SECONDS", 0.5))
+FAST_JSON_RESPONSES = os.environ.get("FAST_JSON_RESPONSES", "false").lower() == "true"
+FAST_JSON_BATCH_SIZE = 200
+LOOP_STALL_THRESHOLD_MS = int(os.environ.get("LOOP_STALL_THRESHOLD_MS", 0))
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", 5))
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", ROOT_DIR / "profiles"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 50))
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_TRUST_PROXY = os.environ.get("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+RATE_LIMIT_DEFAULTS = [
+    ("global", None, r"^/api/(?!images/|profile-pic/)", "300/60"),
+    ("images", {"GET"}, r"^/api/(images|profile-pic)/", "3000/60"),
+    ("auth", {"POST"}, r"^/api/auth/(login|register)$", "10/60"),
+    ("suggestions", None, r"^/api/suggestions/", "10/60"),
+    ("group_details", {"GET"}, r"^/api/groups/[^/]+$", "60/60"),
+    ("uploads", {"POST", "PUT"}, r"^/api/(upload-image|profile/upload-pic|outfits(/[^/]+)?)$", "30/60"),
+]
 security = HTTPBearer()
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self.refill()
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+    def retry_after(self, tokens: float = 1) -> float:
+        self.refill()
+        if self.tokens >= tokens or self.rate_per_second <= 0:
+            return 0.0
+        return (tokens - self.tokens) / self.rate_per_second
+class MemoryRateLimitStore:
+    def __init__(self, max_keys: int = 100000, prune_interval: float = 60.0):
+        self.max_keys = max_keys
+        self.prune_interval = prune_interval
+        self.pruned_at = time.monotonic()
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys and time.monotonic() - self.pruned_at >= self.prune_interval:
+                self.prune()
+            while len(self.buckets) >= self.max_keys:
+                self.buckets.popitem(last=False)
+            bucket = self.buckets[key] = TokenBucket(limit / window, limit)
+        else:
+            self.buckets.move_to_end(key)
+        if bucket.try_acquire():
+            return 0.0
+        return bucket.retry_after()
+    def prune(self):
+        self.pruned_at = time.monotonic()
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill()
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[key]
+class MongoRateLimitStore:
+    def __init__(self, collection):
+        self.collection = collection
+    async def hit(self, key: str, limit: int, window: float) -> float:
+        now = time.time()
+        window_start = int(now // window * window)
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": f"{key}:{window_start}"},
+                {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": datetime.fromtimestamp(window_start + window, timezone.utc)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            logging.warning(f"Rate limit store unavailable, allowing request: {e}")
+            return 0.0
+        if doc["count"] <= limit:
+            return 0.0
+        return window_start + window - now
+def parse_rate_limit_rules() -> List[tuple]:
+    rules = []
+    for name, methods, pattern, default in RATE_LIMIT_DEFAULTS:
+        limit, window = os.environ.get(f"RATE_LIMIT_{name.upper()}", default).split("/")
+        rules.append((name, methods, re.compile(pattern), int(limit), float(window)))
+    return rules
+def rate_limit_client_key(scope) -> str:
+    headers = dict(scope.get("headers") or [])
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if authorization.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(authorization[7:], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            return f"user:{payload['user_id']}"
+        except Exception:
+            pass
+    forwarded_for = headers.get(b"x-forwarded-for")
+    if RATE_LIMIT_TRUST_PROXY and forwarded_for:
+        return f"ip:{forwarded_for.decode('latin-1').split(',')[0].strip()}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.rules = parse_rate_limit_rules()
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT_ENABLED or scope["type"] != "http" or scope["method"] == "OPTIONS" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        client_key = rate_limit_client_key(scope)
+        for name, methods, pattern, limit, window in self.rules:
+            if (methods and scope["method"] not in methods) or not pattern.match(scope["path"]):
+                continue
+            retry_after = await rate_limit_store.hit(f"{name}:{client_key}", limit, window)
+            if retry_after > 0:
+                metrics.inc("rate_limit_rejections_total", (("rule", name),))
+                response = JSONResponse(
+                    status_code=429,
+                    content={"detail": "Too many requests, please slow down."},
+                    headers={"Retry-After": str(max(math.ceil(retry_after), 1))}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.route_paths: Optional[Dict[Any, str]] = None
+    def route_label(self, scope) -> str:
+        if self.route_paths is None:
+            self.route_paths = {getattr(route, "endpoint", None) or getattr(route, "app", None): route.path for route in app.routes}
+        return self.route_paths.get(scope.get("endpoint"), "unmatched")
+    async def __call__(self, scope, receive, send):
+        if not METRICS_ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        current = {"mongo_ops": 0}
+        token = request_metrics.set(current)
+        status_code = 500
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        started = time.perf_counter()
+        metrics.add("http_requests_in_flight", 1)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.add("http_requests_in_flight", -1)
+            request_metrics.reset(token)
+            route = self.route_label(scope)
+            method = scope["method"]
+            metrics.inc("http_requests_total", (("method", method), ("route", route), ("status", status_code)))
+            metrics.observe("http_request_duration_seconds", elapsed, (("method", method), ("route", route)))
+            metrics.observe("http_request_mongo_ops", current.pop("mongo_ops"), (("method", method), ("route", route)), COUNT_BUCKETS)
+            for kind, seconds in current.items():
+                metrics.inc("http_request_work_seconds_total", (("route", route), ("kind", kind)), seconds)
+def collapse_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+class StackSampler:
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+    def start(self):
+        self.thread.start()
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+class LoopStallDetector:
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.heartbeat = time.monotonic()
+        self.thread_id: Optional[int] = None
+    async def beat(self):
+        self.thread_id = threading.get_ident()
+        threading.Thread(target=self.watch, name="loop-stall-detector", daemon=True).start()
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+    def watch(self):
+        reported = None
+        while True:
+            time.sleep(self.threshold / 4)
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat
+            if stalled < self.threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self.thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "unavailable\n"
+            metrics.inc("event_loop_stalls_total")
+            logging.warning(f"Event loop blocked for at least {stalled * 1000:.0f}ms, loop thread stack:\n{stack}")
+def profiling_requested(scope) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    expected = PROFILE_TOKEN
+    headers = dict(scope.get("headers") or [])
+    if hmac.compare_digest(headers.get(b"x-profile", b"").decode("latin-1"), expected):
+        return True
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile", [])
+    return any(hmac.compare_digest(value, expected) for value in values)
+def prune_profiles(keep: int):
+    names = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".folded"))
+    for name in names[:max(len(names) - keep, 0)]:
+        try:
+            os.remove(PROFILE_DIR / name)
+        except FileNotFoundError:
+            pass
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.active = False
+        if PROFILING_ENABLED and not PROFILE_TOKEN:
+            logging.warning("PROFILING_ENABLED is set without PROFILE_TOKEN, request profiling stays off")
+    async def __call__(self, scope, receive, send):
+        if not PROFILING_ENABLED or scope["type"] != "http" or self.active or not profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        self.active = True
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        name = f"{int(time.time() * 1000)}-{scope['method'].lower()}-{slug}.folded"
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile", name.encode())]
+            await send(message)
+        sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            self.active = False
+            PROFILE_DIR.mkdir(exist_ok=True)
+            async with aiofiles.open(PROFILE_DIR / name, "w") as f:
+                await f.write(sampler.folded())
+            await asyncio.to_thread(prune_profiles, PROFILE_MAX_FILES)
+            logging.info(f"Saved profile {name} ({sum(sampler.stacks.values())} samples)")
+class UploadTooLarge(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=413, detail="File too large")
+class UploadSizeLimitMiddleware:
+    def __init__(self, app, max_size: int = MAX_UPLOAD_REQUEST_SIZE):
+        self.app = app
+        self.max_size = max_size
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_size:
+            await self.reject(send)
+            return
+        received = 0
+        response_started = False
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    raise UploadTooLarge()
+            return message
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            if not response_started:
+                await self.reject(send)
+    async def reject(self, send):
+        response = JSONResponse(status_code=413, content={"detail": "File too large"})
+        await response({"type": "http"}, None, send)
+rate_limit_store = MemoryRateLimitStore()
 app = FastAPI(title="Smart Wardrobe API")
+app.add_middleware(UploadSizeLimitMiddleware)
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -55,7 +556,8 @@ app.add_middleware(
     expose_headers=["*"],
 )
 api_router = APIRouter(prefix="/api")
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+background_tasks: List[asyncio.Task] = []
+app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR, check_dir=False), name="uploads")
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -108,12 +610,41 @@ class OutfitCreate(BaseModel):
 class OutfitUsage(BaseModel):
     outfit_id: str
     used_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+class DuplicateHint(BaseModel):
+    outfit_id: str
+    name: str
+    distance: int
+class OutfitCreated(Outfit):
+    possible_duplicates: List[DuplicateHint] = []
+class DuplicateGroup(BaseModel):
+    max_distance: int
+    outfits: List[Outfit]
+class DuplicateScanResponse(BaseModel):
+    scanned: int
+    hashed: int
+    groups: List[DuplicateGroup]
 class OutfitStats(BaseModel):
     most_used: List[dict]
     least_used: List[dict]
+class OutfitSearchHit(Outfit):
+    score: float
+class OutfitSearchResponse(BaseModel):
+    query: str
+    total: int
+    results: List[OutfitSearchHit]
+    facets: Dict[str, Dict[str, int]]
+class OutfitChanges(BaseModel):
+    version: int
+    upserts: List[Outfit]
+    deleted: List[str]
+class OutfitCombination(BaseModel):
+    score: float
+    slots: List[str]
+    items: List[Outfit]
 class SuggestionResponse(BaseModel):
     suggestions: List[dict]
     reasoning: str
+    prompt_stats: Optional[Dict[str, Any]] = None
 class OutfitNameInput(BaseModel):
     name: str
 class SharedOutfit(BaseModel):
@@ -167,6 +698,23 @@ class GroupDetail(BaseModel):
     invite_code: str
     created_at: datetime
     is_member: bool = True
+class GroupStats(BaseModel):
+    group_id: str
+    shares_count: int
+    ratings_count: int
+    average_rating: float
+    rating_distribution: Dict[str, int]
+    top_rated: List[Dict[str, Any]]
+    top_sharers: List[Dict[str, Any]]
+    weekly_activity: List[Dict[str, Any]]
+    updated_at: Optional[datetime] = None
+    reconciled_at: Optional[datetime] = None
+class InvalidationEvent(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    kind: str
+    key: str
+    origin: str = WORKER_ID
+    at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 class SharedOutfitToGroup(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -201,60 +749,1705 @@ def verify_jwt_token(token: str) -> dict:
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     payload = verify_jwt_token(token)
-    user = await db.users.find_one({"id": payload['user_id']}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+    user = user_cache.get(payload['user_id']) if USER_CACHE_TTL_SECONDS > 0 else None
+    if user is None:
+        user = await db.users.find_one({"id": payload['user_id']}, {"_id": 0})
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        user_cache.put(user)
     return user
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user['id'] not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+def image_dhash(img) -> str:
+    pixels = np.asarray(img.convert("L").resize((9, 8), lazy_import("PIL.Image").BILINEAR), dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes().hex()
+def image_dhash_from_bytes(image_data: bytes) -> str:
+    with timed("pillow"):
+        return image_dhash(lazy_import("PIL.Image").open(io.BytesIO(image_data)))
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
 async def compress_image(image_data: bytes, file_format: str, max_width: int = 600, quality: int = 75) -> bytes:
-    img = Image.open(io.BytesIO(image_data))
-    if file_format.upper() == "JPEG" and img.mode in ("RGBA", "P"):
-        img = img.convert("RGB")
-    if img.width > max_width:
-        ratio = max_width / img.width
-        new_height = int(img.height * ratio)
-        img = img.resize((max_width, new_height), Image.LANCZOS)
-    output = io.BytesIO()
-    img.save(output, format=file_format, quality=quality)
-    return output.getvalue()
+    content, _ = await compress_image_with_hash(image_data, file_format, max_width, quality)
+    return content
+async def compress_image_with_hash(image_data: bytes, file_format: str, max_width: int = 600, quality: int = 75) -> tuple:
+    Image = lazy_import("PIL.Image")
+    with timed("pillow"):
+        img = Image.open(io.BytesIO(image_data))
+        if file_format.upper() == "JPEG" and img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        if img.width > max_width:
+            ratio = max_width / img.width
+            new_height = int(img.height * ratio)
+            img = img.resize((max_width, new_height), Image.LANCZOS)
+        output = io.BytesIO()
+        img.save(output, format=file_format, quality=quality)
+        return output.getvalue(), image_dhash(img)
 async def validate_image(image_data: bytes) -> bool:
     try:
-        img = Image.open(io.BytesIO(image_data))
-        img.verify()  
+        with timed("pillow"):
+            img = lazy_import("PIL.Image").open(io.BytesIO(image_data))
+            img.verify()  
         return True
     except Exception:
         return False
-async def upload_to_gridfs(file: UploadFile):
+def sniff_image_type(header: bytes) -> Optional[str]:
+    if header.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+def check_image_header(data: bytes, complete: bool):
     try:
-        contents = await file.read()
-        file_id = await gridfs_bucket.upload_from_stream(file.filename, BytesIO(contents))
+        with timed("pillow"):
+            img = lazy_import("PIL.Image").open(io.BytesIO(data))
+    except Exception:
+        if complete:
+            raise HTTPException(status_code=400, detail="Invalid image file")
+        return
+    if img.width * img.height > MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=400, detail="Image dimensions too large")
+async def read_upload_limited(file: UploadFile, max_size: int = MAX_FILE_SIZE) -> bytes:
+    buffer = bytearray()
+    header_checked = False
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > max_size:
+            raise HTTPException(status_code=413, detail="File too large")
+        if not header_checked and len(buffer) >= 12:
+            if sniff_image_type(bytes(buffer[:12])) is None:
+                raise HTTPException(status_code=400, detail="Invalid image file")
+            check_image_header(bytes(buffer), complete=False)
+            header_checked = True
+    if not header_checked:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    return bytes(buffer)
+def sign_image_path(path: str, expires: int) -> str:
+    digest = hmac.new(IMAGE_URL_SECRET.encode(), f"{path}:{expires}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+def verify_image_signature(path: str, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_image_path(path, expires), signature)
+class ImageStore(ABC):
+    name = "base"
+    @abstractmethod
+    async def put(self, key: str, content: bytes, content_type: str) -> str:
+        pass
+    @abstractmethod
+    async def get(self, locator: str) -> bytes:
+        pass
+    @abstractmethod
+    async def delete(self, locator: str):
+        pass
+    def signed_url(self, locator: str, expires_in: int) -> Optional[str]:
+        return None
+class GridFSImageStore(ImageStore):
+    name = "gridfs"
+    def __init__(self, bucket: AsyncIOMotorGridFSBucket):
+        self.bucket = bucket
+    async def put(self, key: str, content: bytes, content_type: str) -> str:
+        file_id = await self.bucket.upload_from_stream(key, BytesIO(content), metadata={"contentType": content_type})
         return str(file_id)
+    async def get(self, locator: str) -> bytes:
+        grid_out = await self.bucket.open_download_stream(ObjectId(locator))
+        return await grid_out.read()
+    async def delete(self, locator: str):
+        await self.bucket.delete(ObjectId(locator))
+class LocalImageStore(ImageStore):
+    name = "local"
+    def __init__(self, directory: Path):
+        self.directory = directory
+    def path_for(self, locator: str) -> Path:
+        return self.directory / Path(locator.replace("\\", "/")).name
+    async def put(self, key: str, content: bytes, content_type: str) -> str:
+        file_path = self.path_for(key)
+        if not await asyncio.to_thread(file_path.exists):
+            async with aiofiles.open(file_path, 'wb') as f:
+                await f.write(content)
+        return file_path.name
+    async def get(self, locator: str) -> bytes:
+        async with aiofiles.open(self.path_for(locator), 'rb') as f:
+            return await f.read()
+    async def delete(self, locator: str):
+        file_path = self.path_for(locator)
+        if await asyncio.to_thread(file_path.exists):
+            await asyncio.to_thread(os.remove, file_path)
+    def signed_url(self, locator: str, expires_in: int) -> Optional[str]:
+        if not IMAGE_STATIC_BASE_URL:
+            return None
+        name = self.path_for(locator).name
+        expires = int(time.time()) + expires_in
+        return f"{IMAGE_STATIC_BASE_URL}/{name}?expires={expires}&signature={sign_image_path(f'/{name}', expires)}"
+class S3ImageStore(ImageStore):
+    name = "s3"
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None, prefix: str = "outfits/"):
+        import boto3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+    async def put(self, key: str, content: bytes, content_type: str) -> str:
+        locator = f"{self.prefix}{key}"
+        await asyncio.to_thread(self.client.put_object, Bucket=self.bucket, Key=locator, Body=content, ContentType=content_type)
+        return locator
+    async def get(self, locator: str) -> bytes:
+        response = await asyncio.to_thread(self.client.get_object, Bucket=self.bucket, Key=locator)
+        return await asyncio.to_thread(response["Body"].read)
+    async def delete(self, locator: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=locator)
+    def signed_url(self, locator: str, expires_in: int) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": locator},
+            ExpiresIn=expires_in
+        )
+image_stores: Dict[str, ImageStore] = {}
+def init_services():
+    global mongo_client, db, gridfs_bucket, profile_bucket, rate_limit_store
+    started = time.perf_counter()
+    mongo_client = AsyncIOMotorClient(MONGO_URI, event_listeners=[MongoCommandMetrics()])
+    db = mongo_client[MONGO_DB_NAME]
+    gridfs_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="outfit_images")
+    profile_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="profile_images")
+    UPLOAD_DIR.mkdir(exist_ok=True)
+    image_stores["gridfs"] = GridFSImageStore(gridfs_bucket)
+    image_stores["local"] = LocalImageStore(UPLOAD_DIR)
+    if S3_BUCKET:
+        image_stores["s3"] = S3ImageStore(S3_BUCKET, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION)
+    if RATE_LIMIT_STORE == "mongo":
+        rate_limit_store = MongoRateLimitStore(db.rate_limits)
+    metrics.set("startup_services_seconds", time.perf_counter() - started)
+if not FAST_STARTUP:
+    init_services()
+def blob_locator(blob: dict) -> Optional[str]:
+    if blob.get("locator"):
+        return blob["locator"]
+    if blob.get("storage_type") == "local" and blob.get("local_path"):
+        return Path(blob["local_path"].replace("\\", "/")).name
+    return blob.get("image_id")
+async def delete_stored_image(storage_type: Optional[str], locator: Optional[str]):
+    store = image_stores.get(storage_type)
+    if not store or not locator:
+        return
+    try:
+        await store.delete(locator)
+        logging.info(f"Deleted image from {storage_type}: {locator}")
     except Exception as e:
-        print(f"GridFS upload failed: {e}")
+        logging.warning(f"{storage_type} delete failed: {e}")
+def blob_storage_key(image_hash: str, file_ext: str) -> str:
+    return f"{image_hash}-{uuid.uuid4().hex[:12]}{file_ext}"
+async def store_image_blob(content: bytes, file_ext: str, dhash: Optional[str] = None) -> dict:
+    image_hash = hashlib.sha256(content).hexdigest()
+    blob = await db.image_blobs.find_one_and_update(
+        {"sha256": image_hash},
+        {"$inc": {"ref_count": 1}, **({"$set": {"dhash": dhash}} if dhash else {})},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if blob:
+        return blob
+    content_type = IMAGE_CONTENT_TYPES.get(file_ext, "image/jpeg")
+    key = blob_storage_key(image_hash, file_ext)
+    storage_type = IMAGE_STORE_PRIMARY if IMAGE_STORE_PRIMARY in image_stores else "gridfs"
+    try:
+        locator = await image_stores[storage_type].put(key, content, content_type)
+    except Exception as e:
+        logging.warning(f"{storage_type} upload failed, saving locally instead: {e}")
+        storage_type = "local"
+        locator = await image_stores["local"].put(key, content, content_type)
+    now = datetime.now(timezone.utc).isoformat()
+    blob = {
+        "sha256": image_hash,
+        "size": len(content),
+        "content_type": content_type,
+        "extension": file_ext,
+        "ref_count": 1,
+        "storage_type": storage_type,
+        "locator": locator,
+        "image_id": locator if storage_type == "gridfs" else None,
+        "local_path": str(UPLOAD_DIR / locator) if storage_type == "local" else None,
+        "image_url": f"/api/images/{image_hash}",
+        "dhash": dhash,
+        "created_at": now,
+        "last_accessed": now
+    }
+    try:
+        await db.image_blobs.insert_one(dict(blob))
+    except DuplicateKeyError:
+        await delete_stored_image(storage_type, locator)
+        return await store_image_blob(content, file_ext, dhash)
+    return blob
+def image_fields_from_blob(blob: dict) -> dict:
+    return {
+        "image_url": blob["image_url"],
+        "image_id": blob.get("image_id"),
+        "local_path": blob.get("local_path"),
+        "storage_type": blob["storage_type"],
+        "image_hash": blob["sha256"],
+        "image_dhash": blob.get("dhash")
+    }
+async def retain_image(outfit: dict):
+    if outfit.get("image_hash"):
+        await db.image_blobs.update_one({"sha256": outfit["image_hash"]}, {"$inc": {"ref_count": 1}})
+async def release_image(outfit: dict):
+    image_hash = outfit.get("image_hash")
+    if image_hash:
+        blob = await db.image_blobs.find_one_and_update(
+            {"sha256": image_hash},
+            {"$inc": {"ref_count": -1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob and blob["ref_count"] <= 0:
+            result = await db.image_blobs.delete_one({"sha256": image_hash, "ref_count": {"$lte": 0}})
+            if result.deleted_count:
+                await delete_stored_image(blob["storage_type"], blob_locator(blob))
+        return
+    storage_type = outfit.get("storage_type")
+    if storage_type == "gridfs" and outfit.get("image_id"):
+        shared = await db.outfits.count_documents({"image_id": outfit["image_id"], "id": {"$ne": outfit["id"]}})
+        if not shared:
+            await delete_stored_image("gridfs", outfit["image_id"])
+    elif storage_type == "local" and outfit.get("local_path"):
+        shared = await db.outfits.count_documents({"local_path": outfit["local_path"], "id": {"$ne": outfit["id"]}})
+        if not shared:
+            await delete_stored_image("local", outfit["local_path"])
+async def resolve_image_urls(outfits: List[dict], api_base_url: str):
+    signed = {}
+    hashes = list({o["image_hash"] for o in outfits if o.get("image_hash")})
+    if SIGNED_IMAGE_URLS and hashes:
+        blobs_cursor = db.image_blobs.find(
+            {"sha256": {"$in": hashes}},
+            {"_id": 0, "sha256": 1, "storage_type": 1, "locator": 1, "image_id": 1, "local_path": 1}
+        )
+        async for blob in blobs_cursor:
+            store = image_stores.get(blob.get("storage_type"))
+            try:
+                url = store.signed_url(blob_locator(blob), SIGNED_URL_TTL_SECONDS) if store else None
+            except Exception as e:
+                logging.warning(f"Could not sign image URL for {blob['sha256']}: {e}")
+                url = None
+            if url:
+                signed[blob["sha256"]] = url
+    for outfit in outfits:
+        image_url = outfit.get("image_url")
+        if outfit.get("image_hash") in signed:
+            outfit["image_url"] = signed[outfit["image_hash"]]
+        elif image_url and not image_url.startswith(('http://', 'https://')):
+            outfit["image_url"] = f"{api_base_url}{image_url}"
+async def find_image_blob(file_id: str) -> Optional[dict]:
+    if len(file_id) == 64 and all(c in "0123456789abcdef" for c in file_id):
+        return await db.image_blobs.find_one({"sha256": file_id}, {"_id": 0})
+    if ObjectId.is_valid(file_id):
+        return await db.image_blobs.find_one({"image_id": file_id}, {"_id": 0})
+    return None
+async def touch_image_blob(blob: dict):
+    now = datetime.now(timezone.utc)
+    last_accessed = blob.get("last_accessed")
+    if last_accessed and now - datetime.fromisoformat(last_accessed) < timedelta(seconds=IMAGE_ACCESS_TOUCH_SECONDS):
+        return
+    await db.image_blobs.update_one({"sha256": blob["sha256"]}, {"$set": {"last_accessed": now.isoformat()}, "$inc": {"views": 1}})
+async def migrate_image_blob(blob: dict, target: str) -> bool:
+    source = blob["storage_type"]
+    locator = blob_locator(blob)
+    content = await image_stores[source].get(locator)
+    key = blob_storage_key(blob["sha256"], blob.get("extension", ".jpg"))
+    new_locator = await image_stores[target].put(key, content, blob.get("content_type", "image/jpeg"))
+    fields = {
+        "storage_type": target,
+        "locator": new_locator,
+        "local_path": str(UPLOAD_DIR / new_locator) if target == "local" else None,
+        "migrated_at": datetime.now(timezone.utc).isoformat()
+    }
+    result = await db.image_blobs.update_one({"sha256": blob["sha256"], "storage_type": source}, {"$set": fields})
+    if not result.modified_count:
+        await delete_stored_image(target, new_locator)
+        return False
+    await db.outfits.update_many(
+        {"image_hash": blob["sha256"]},
+        {"$set": {"storage_type": target, "local_path": fields["local_path"]}}
+    )
+    await delete_stored_image(source, locator)
+    return True
+async def run_image_tier_migration(batch_size: int = IMAGE_TIER_BATCH_SIZE) -> int:
+    if IMAGE_STORE_COLD not in image_stores:
+        return 0
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=IMAGE_COLD_AFTER_DAYS)).isoformat()
+    blobs = await db.image_blobs.find(
+        {
+            "storage_type": {"$ne": IMAGE_STORE_COLD},
+            "ref_count": {"$gt": 0},
+            "$or": [
+                {"last_accessed": {"$lt": cutoff}},
+                {"last_accessed": {"$exists": False}, "created_at": {"$lt": cutoff}}
+            ]
+        },
+        {"_id": 0}
+    ).to_list(batch_size)
+    semaphore = asyncio.Semaphore(IMAGE_TIER_CONCURRENCY)
+    async def migrate(blob: dict) -> bool:
+        async with semaphore:
+            try:
+                return await migrate_image_blob(blob, IMAGE_STORE_COLD)
+            except Exception as e:
+                logging.warning(f"Image tier migration failed for {blob['sha256']}: {e}")
+                return False
+    results = await asyncio.gather(*(migrate(blob) for blob in blobs))
+    return sum(results)
+gc_status: Dict[str, Any] = {"running": False}
+precompute_status: Dict[str, Any] = {"running": False}
+def image_name_from_url(image_url: str, marker: str) -> Optional[str]:
+    if marker not in image_url:
         return None
-async def save_locally(file: UploadFile):
-    import uuid
-    file_ext = file.filename.split(".")[-1]
-    filename = f"{uuid.uuid4()}.{file_ext}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
-    async with aiofiles.open(filepath, "wb") as f:
-        await f.write(await file.read())
-    return f"/uploads/{filename}"
-async def delete_image(image_id: str | None, local_path: str | None):
-    if image_id:
+    return image_url.split(marker)[-1].split("?")[0] or None
+async def collect_image_references() -> Dict[str, set]:
+    refs = {"gridfs": set(), "local": set(), "hashes": set(), "profile": set()}
+    outfits_cursor = db.outfits.find({}, {"_id": 0, "image_id": 1, "local_path": 1, "image_url": 1, "image_hash": 1})
+    async for outfit in outfits_cursor:
+        if outfit.get("image_id"):
+            refs["gridfs"].add(outfit["image_id"])
+        if outfit.get("local_path"):
+            refs["local"].add(Path(outfit["local_path"].replace("\\", "/")).name)
+        if outfit.get("image_hash"):
+            refs["hashes"].add(outfit["image_hash"])
+        image_url = outfit.get("image_url") or ""
+        local_name = image_name_from_url(image_url, "/uploads/")
+        if local_name:
+            refs["local"].add(local_name)
+        image_key = image_name_from_url(image_url, "/api/images/")
+        if image_key:
+            refs["gridfs"].add(image_key)
+            refs["hashes"].add(image_key)
+    async for blob in db.image_blobs.find({}, {"_id": 0}):
+        if blob["sha256"] not in refs["hashes"]:
+            continue
+        if blob.get("image_id"):
+            refs["gridfs"].add(blob["image_id"])
+        locator = blob_locator(blob)
+        if locator and blob.get("storage_type") in ("gridfs", "local"):
+            refs[blob["storage_type"]].add(locator)
+    async for user in db.users.find({"profile_pic_id": {"$ne": None}}, {"_id": 0, "profile_pic_id": 1}):
+        refs["profile"].add(user["profile_pic_id"])
+    return refs
+async def gc_pause(processed: int, batch_size: int):
+    if processed % batch_size == 0:
+        await asyncio.sleep(IMAGE_GC_BATCH_PAUSE_SECONDS)
+def gc_record_orphan(kind: str, name: str, size: int):
+    gc_status["orphaned"] += 1
+    gc_status["orphaned_bytes"] += size or 0
+    if len(gc_status["orphans"]) < 100:
+        gc_status["orphans"].append({"kind": kind, "name": name, "size": size})
+async def sweep_image_blobs(refs: Dict[str, set], dry_run: bool, batch_size: int):
+    gc_status["phase"] = "image_blobs"
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=IMAGE_GC_GRACE_SECONDS)).isoformat()
+    processed = 0
+    async for blob in db.image_blobs.find({"created_at": {"$lt": cutoff}}, {"_id": 0}):
+        processed += 1
+        gc_status["scanned"] += 1
+        if blob["sha256"] not in refs["hashes"] and not await db.outfits.count_documents({"image_hash": blob["sha256"]}, limit=1):
+            gc_record_orphan("image_blob", blob["sha256"], blob.get("size", 0))
+            if not dry_run:
+                result = await db.image_blobs.delete_one({"sha256": blob["sha256"], "ref_count": blob["ref_count"]})
+                if result.deleted_count:
+                    await delete_stored_image(blob["storage_type"], blob_locator(blob))
+                    gc_status["deleted"] += 1
+                    gc_status["bytes_freed"] += blob.get("size", 0)
+        await gc_pause(processed, batch_size)
+async def image_still_referenced(kind: str, name: str) -> bool:
+    if kind == "profile":
+        return bool(await db.users.count_documents({"profile_pic_id": name}, limit=1))
+    if kind == "gridfs":
+        blob_query = {"$or": [{"image_id": name}, {"locator": name}]}
+        outfit_query = {"image_id": name}
+    else:
+        path_pattern = f"(^|[\\\\/]){re.escape(name)}$"
+        blob_query = {"$or": [{"locator": name}, {"local_path": {"$regex": path_pattern}}]}
+        outfit_query = {"$or": [{"local_path": {"$regex": path_pattern}}, {"image_url": {"$regex": f"/uploads/{re.escape(name)}(\\?|$)"}}]}
+    if await db.image_blobs.count_documents(blob_query, limit=1):
+        return True
+    return bool(await db.outfits.count_documents(outfit_query, limit=1))
+async def sweep_gridfs_files(collection: str, referenced: set, delete, kind: str, dry_run: bool, batch_size: int):
+    gc_status["phase"] = kind
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=IMAGE_GC_GRACE_SECONDS)
+    processed = 0
+    async for grid_file in db[collection].find({"uploadDate": {"$lt": cutoff}}, {"_id": 1, "length": 1}):
+        processed += 1
+        gc_status["scanned"] += 1
+        file_id = str(grid_file["_id"])
+        if file_id not in referenced and not await image_still_referenced(kind, file_id):
+            gc_record_orphan(kind, file_id, grid_file.get("length", 0))
+            if not dry_run:
+                try:
+                    await delete(grid_file["_id"])
+                    gc_status["deleted"] += 1
+                    gc_status["bytes_freed"] += grid_file.get("length", 0)
+                except Exception as e:
+                    logging.warning(f"GC could not delete {kind} {file_id}: {e}")
+        await gc_pause(processed, batch_size)
+async def sweep_local_uploads(referenced: set, dry_run: bool, batch_size: int):
+    gc_status["phase"] = "local"
+    cutoff = time.time() - IMAGE_GC_GRACE_SECONDS
+    names = await asyncio.to_thread(os.listdir, UPLOAD_DIR)
+    for processed, name in enumerate(names, start=1):
+        gc_status["scanned"] += 1
+        if name not in referenced:
+            file_path = UPLOAD_DIR / name
+            try:
+                stat = await asyncio.to_thread(file_path.stat)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime < cutoff and not await image_still_referenced("local", name):
+                gc_record_orphan("local", name, stat.st_size)
+                if not dry_run:
+                    await delete_stored_image("local", name)
+                    gc_status["deleted"] += 1
+                    gc_status["bytes_freed"] += stat.st_size
+        await gc_pause(processed, batch_size)
+async def run_image_gc(dry_run: bool = True, batch_size: int = IMAGE_GC_BATCH_SIZE) -> Dict[str, Any]:
+    if gc_status.get("running"):
+        return gc_status
+    gc_status.clear()
+    gc_status.update({
+        "running": True,
+        "dry_run": dry_run,
+        "phase": "mark",
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+        "scanned": 0,
+        "orphaned": 0,
+        "orphaned_bytes": 0,
+        "deleted": 0,
+        "bytes_freed": 0,
+        "orphans": [],
+        "error": None
+    })
+    try:
+        refs = await collect_image_references()
+        await sweep_image_blobs(refs, dry_run, batch_size)
+        await sweep_gridfs_files("outfit_images.files", refs["gridfs"], gridfs_bucket.delete, "gridfs", dry_run, batch_size)
+        await sweep_gridfs_files("profile_images.files", refs["profile"], profile_bucket.delete, "profile", dry_run, batch_size)
+        await sweep_local_uploads(refs["local"], dry_run, batch_size)
+        logging.info(f"Image GC finished (dry_run={dry_run}): {gc_status['orphaned']} orphans, {gc_status['bytes_freed']} bytes freed")
+    except Exception as e:
+        logging.error(f"Image GC failed: {e}\n{traceback.format_exc()}")
+        gc_status["error"] = str(e)
+    finally:
+        gc_status["running"] = False
+        gc_status["phase"] = "done"
+        gc_status["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return gc_status
+async def image_gc_scheduler():
+    while True:
+        await asyncio.sleep(IMAGE_GC_INTERVAL_SECONDS)
+        await run_image_gc(dry_run=False)
+async def event_loop_lag_monitor():
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL_SECONDS)
+        lag = max(time.perf_counter() - started - EVENT_LOOP_LAG_INTERVAL_SECONDS, 0.0)
+        metrics.set("event_loop_lag_seconds", lag)
+        metrics.observe("event_loop_lag_distribution_seconds", lag)
+async def image_tier_migrator():
+    while True:
         try:
-            await gridfs_bucket.delete(ObjectId(image_id))
+            moved = await run_image_tier_migration()
+            if moved:
+                logging.info(f"Moved {moved} cold images to {IMAGE_STORE_COLD}")
         except Exception as e:
-            print(f"GridFS delete failed: {e}")
-    if local_path:
-        local_file = local_path.lstrip("/")
-        if os.path.exists(local_file):
-            os.remove(local_file)
+            logging.error(f"Image tier migrator error: {e}")
+        await asyncio.sleep(IMAGE_TIER_INTERVAL_SECONDS)
+class CircuitOpenError(Exception):
+    pass
+class UpstreamRateLimitError(Exception):
+    pass
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = UPSTREAM_FAILURE_THRESHOLD, reset_timeout: float = UPSTREAM_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.probe_in_flight = False
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        return False
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+        self.probe_in_flight = False
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+    def record_cancelled(self):
+        self.probe_in_flight = False
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic()
+    def release(self):
+        self.probe_in_flight = False
+class Upstream:
+    def __init__(self, name: str, timeout: float, buckets: Optional[List[TokenBucket]] = None):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self.buckets = buckets or []
+    async def call(self, func, *args, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+        for bucket in self.buckets:
+            if not bucket.try_acquire():
+                self.breaker.release()
+                raise UpstreamRateLimitError(f"{self.name} rate limit reached, retry in {bucket.retry_after():.0f}s")
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            with timed("llm" if self.name.startswith("llm:") else "http"):
+                result = await asyncio.wait_for(func(*args, **kwargs), timeout=self.timeout)
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            self.breaker.record_failure()
+            raise TimeoutError(f"{self.name} did not respond within {self.timeout}s")
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            self.breaker.record_cancelled()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            metrics.observe("upstream_call_duration_seconds", time.perf_counter() - started, (("upstream", self.name), ("outcome", outcome)))
+        self.breaker.record_success()
+        return result
+llm_buckets = [
+    TokenBucket(AI_RATE_LIMIT_PER_MINUTE / 60, AI_RATE_LIMIT_PER_MINUTE),
+    TokenBucket(AI_RATE_LIMIT_PER_DAY / 86400, AI_RATE_LIMIT_PER_DAY),
+]
+upstreams: Dict[str, Upstream] = {
+    "weather": Upstream("weather", WEATHER_TIMEOUT_SECONDS),
+    "geocode": Upstream("geocode", WEATHER_TIMEOUT_SECONDS),
+}
+for model_name in AI_MODELS:
+    upstreams[f"llm:{model_name}"] = Upstream(f"llm:{model_name}", AI_TIMEOUT_SECONDS, llm_buckets)
+ai_client = None
+http_client = None
+def get_ai_client(api_key: str):
+    global ai_client
+    if ai_client is None or ai_client.api_key != api_key:
+        ai_client = lazy_import("openai").AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=api_key, timeout=AI_TIMEOUT_SECONDS, max_retries=0)
+    return ai_client
+def get_http_client():
+    global http_client
+    if http_client is None:
+        http_client = lazy_import("httpx").AsyncClient(timeout=WEATHER_TIMEOUT_SECONDS)
+    return http_client
+async def fetch_json(url: str) -> dict:
+    response = await get_http_client().get(url)
+    response.raise_for_status()
+    return response.json()
+async def llm_chat_completion(api_key: str, messages: List[dict], **kwargs):
+    client = get_ai_client(api_key)
+    async def attempt(model: str):
+        return await upstreams[f"llm:{model}"].call(client.chat.completions.create, model=model, messages=messages, **kwargs)
+    models = list(AI_MODELS)
+    pending = set()
+    errors = []
+    while models or pending:
+        if models:
+            pending.add(asyncio.create_task(attempt(models.pop(0))))
+        hedge_delay = AI_HEDGE_DELAY_SECONDS if models and AI_HEDGE_DELAY_SECONDS > 0 else None
+        done, pending = await asyncio.wait(pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            errors.append(task.exception())
+    rate_limited = [e for e in errors if isinstance(e, (lazy_import("openai").RateLimitError, UpstreamRateLimitError))]
+    raise (rate_limited or errors)[0]
+RECOMMENDER_CATEGORIES = ["casual", "formal", "sport", "traditional"]
+RECOMMENDER_SEASONS = ["all", "spring", "summer", "fall", "winter"]
+COLOR_FAMILY_NAMES = ["other", "neutral", "red", "orange", "yellow", "green", "blue", "purple", "pink", "brown"]
+COLOR_FAMILIES = {
+    "black": "neutral", "white": "neutral", "grey": "neutral", "gray": "neutral", "silver": "neutral",
+    "beige": "neutral", "cream": "neutral", "ivory": "neutral", "navy": "neutral", "khaki": "neutral", "denim": "neutral",
+    "red": "red", "maroon": "red", "burgundy": "red", "wine": "red", "crimson": "red",
+    "orange": "orange", "coral": "orange", "peach": "orange", "rust": "orange",
+    "yellow": "yellow", "mustard": "yellow", "gold": "yellow", "golden": "yellow",
+    "green": "green", "olive": "green", "mint": "green", "teal": "green", "emerald": "green",
+    "blue": "blue", "sky": "blue", "turquoise": "blue", "cyan": "blue", "aqua": "blue", "cobalt": "blue",
+    "purple": "purple", "violet": "purple", "lavender": "purple", "lilac": "purple", "plum": "purple",
+    "pink": "pink", "magenta": "pink", "rose": "pink", "fuchsia": "pink",
+    "brown": "brown", "tan": "brown", "camel": "brown", "chocolate": "brown", "coffee": "brown",
+}
+COLOR_HARMONY = np.full((len(COLOR_FAMILY_NAMES), len(COLOR_FAMILY_NAMES)), 0.35, dtype=np.float32)
+COLOR_HARMONY[0, :] = COLOR_HARMONY[:, 0] = 0.5
+COLOR_HARMONY[1, :] = COLOR_HARMONY[:, 1] = 0.9
+np.fill_diagonal(COLOR_HARMONY, 0.7)
+for first, second, value in [
+    ("red", "green", 0.8), ("blue", "orange", 0.8), ("yellow", "purple", 0.8),
+    ("red", "orange", 0.75), ("orange", "yellow", 0.75), ("yellow", "green", 0.75), ("green", "blue", 0.75),
+    ("blue", "purple", 0.75), ("purple", "pink", 0.75), ("pink", "red", 0.75), ("blue", "pink", 0.65),
+    ("brown", "green", 0.75), ("brown", "orange", 0.75), ("brown", "yellow", 0.7), ("brown", "blue", 0.65),
+]:
+    i, j = COLOR_FAMILY_NAMES.index(first), COLOR_FAMILY_NAMES.index(second)
+    COLOR_HARMONY[i, j] = COLOR_HARMONY[j, i] = value
+COLOR_HARMONY[1, 1] = 0.8
+SEASON_OVERLAP = np.array([
+    [1.0, 1.0, 1.0, 1.0, 1.0],
+    [1.0, 1.0, 0.6, 0.6, 0.2],
+    [1.0, 0.6, 1.0, 0.2, 0.0],
+    [1.0, 0.6, 0.2, 1.0, 0.6],
+    [1.0, 0.2, 0.0, 0.6, 1.0],
+], dtype=np.float32)
+STYLE_HARMONY = np.array([
+    [0.8, 0.8, 0.8, 0.8, 0.8],
+    [0.8, 1.0, 0.6, 0.8, 0.5],
+    [0.8, 0.6, 1.0, 0.2, 0.6],
+    [0.8, 0.8, 0.2, 1.0, 0.2],
+    [0.8, 0.5, 0.6, 0.2, 1.0],
+], dtype=np.float32)
+GARMENT_SLOT_NAMES = ["top", "bottom", "one_piece", "shoes", "layer"]
+GARMENT_SLOTS = {
+    "top": ["shirt", "tshirt", "tee", "top", "blouse", "kurta", "kurti", "polo", "tank", "sweater", "hoodie", "sweatshirt", "tunic", "camisole", "jersey", "pullover", "turtleneck"],
+    "bottom": ["trousers", "pants", "jeans", "shorts", "skirt", "leggings", "chinos", "joggers", "palazzo", "dhoti", "salwar", "churidar", "culottes", "slacks"],
+    "one_piece": ["dress", "saree", "sari", "jumpsuit", "gown", "romper", "lehenga", "anarkali", "playsuit", "sherwani"],
+    "shoes": ["shoe", "shoes", "sneakers", "sneaker", "boots", "boot", "heels", "sandals", "loafers", "flats", "trainers", "slippers", "juttis", "mojari", "oxfords", "pumps", "brogues"],
+    "layer": ["jacket", "blazer", "coat", "cardigan", "shrug", "waistcoat", "vest", "overcoat", "parka", "windbreaker"],
+}
+GARMENT_KEYWORDS = {word: slot for slot, words in GARMENT_SLOTS.items() for word in words}
+LOOK_TEMPLATES = [("top", "bottom", "shoes"), ("one_piece", "shoes")]
+LAYERED_LOOK_TEMPLATES = [template + ("layer",) for template in LOOK_TEMPLATES]
+CATEGORY_OCCASIONS = {"casual": "Daily wear", "formal": "Office or evening event", "sport": "Workout or active day", "traditional": "Festive occasion"}
+CATEGORY_TIPS = {
+    "casual": "Keep it relaxed: roll the sleeves and finish with clean sneakers or loafers.",
+    "formal": "Keep the rest of the look sharp and simple, and let a structured layer or polished shoes do the work.",
+    "sport": "Layer a light jacket over it so it works beyond the gym.",
+    "traditional": "Let it be the statement piece and keep accessories minimal and metallic.",
+}
+COLOR_TIPS = {
+    "neutral": "Its neutral tone pairs with almost anything, so add one bold accent.",
+    "brown": "Earthy tones look best with greens, creams and denim.",
+}
+def color_family_code(color: str) -> int:
+    for word in (color or "").lower().replace("-", " ").split():
+        family = COLOR_FAMILIES.get(word)
+        if family:
+            return COLOR_FAMILY_NAMES.index(family)
+    return 0
+def code_of(value: str, choices: List[str]) -> int:
+    value = (value or "").lower()
+    return choices.index(value) if value in choices else -1
+def days_since(timestamp, now: datetime) -> float:
+    if not timestamp:
+        return float("inf")
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return max((now - timestamp).total_seconds() / 86400, 0.0)
+def encode_wardrobe(outfits: List[dict], now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    now = now or datetime.now(timezone.utc)
+    return {
+        "category": np.array([code_of(o.get("category"), RECOMMENDER_CATEGORIES) for o in outfits], dtype=np.int8),
+        "season": np.array([max(code_of(o.get("season"), RECOMMENDER_SEASONS), 0) for o in outfits], dtype=np.int8),
+        "color": np.array([color_family_code(o.get("color")) for o in outfits], dtype=np.int8),
+        "usage": np.array([o.get("usage_count", 0) or 0 for o in outfits], dtype=np.float32),
+        "days_since_used": np.array([days_since(o.get("last_used"), now) for o in outfits], dtype=np.float32),
+    }
+def current_season(now: datetime) -> int:
+    return RECOMMENDER_SEASONS.index(["winter", "winter", "spring", "spring", "spring", "summer", "summer", "summer", "fall", "fall", "fall", "winter"][now.month - 1])
+def season_weights(temperature: Optional[float], now: datetime) -> np.ndarray:
+    if temperature is None:
+        return SEASON_OVERLAP[current_season(now)] * np.array([0.8, 1, 1, 1, 1], dtype=np.float32)
+    if temperature < 5:
+        weights = [0.6, 0.3, 0.0, 0.7, 1.0]
+    elif temperature < 12:
+        weights = [0.7, 0.6, 0.1, 1.0, 0.7]
+    elif temperature < 20:
+        weights = [0.8, 1.0, 0.4, 0.8, 0.2]
+    elif temperature < 27:
+        weights = [0.8, 0.8, 0.9, 0.3, 0.0]
+    else:
+        weights = [0.7, 0.5, 1.0, 0.1, 0.0]
+    return np.array(weights, dtype=np.float32)
+def score_wardrobe(features: Dict[str, np.ndarray], temperature: Optional[float], now: datetime) -> np.ndarray:
+    usage = features["usage"]
+    rarely_used = 1 - usage / max(float(usage.max(initial=0)), 1.0)
+    staleness = np.minimum(features["days_since_used"], 60) / 60
+    season_fit = season_weights(temperature, now)[features["season"]]
+    if temperature is None:
+        return 0.5 * rarely_used + 0.3 * staleness + 0.2 * season_fit
+    return 0.6 * season_fit + 0.25 * staleness + 0.15 * rarely_used
+def pick_diverse(scores: np.ndarray, features: Dict[str, np.ndarray], limit: int) -> List[int]:
+    scores = scores.astype(np.float32).copy()
+    picked = []
+    for _ in range(min(limit, len(scores))):
+        best = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            break
+        picked.append(best)
+        scores[best] = -np.inf
+        scores[features["category"] == features["category"][best]] *= 0.85
+        scores[features["color"] == features["color"][best]] *= 0.85
+    return picked
+def complementary_items(index: int, outfits: List[dict], features: Dict[str, np.ndarray], limit: int = 3) -> List[str]:
+    compat = COLOR_HARMONY[features["color"][index], features["color"]] * SEASON_OVERLAP[features["season"][index], features["season"]]
+    compat[index] = -1
+    compat[features["category"] == features["category"][index]] *= 0.9
+    compat += 0.01 * np.minimum(features["days_since_used"], 60) / 60
+    candidates = np.argsort(-compat)[:limit]
+    return [outfits[i]["name"] for i in candidates if compat[i] > 0.3]
+def recommend_outfits(outfits: List[dict], temperature: Optional[float] = None, limit: int = 4, features: Optional[Dict[str, np.ndarray]] = None) -> List[dict]:
+    if not outfits:
+        return []
+    now = datetime.now(timezone.utc)
+    features = features if features is not None else encode_wardrobe(outfits, now)
+    picked = pick_diverse(score_wardrobe(features, temperature, now), features, limit)
+    suggestions = []
+    for rank, index in enumerate(picked):
+        outfit = outfits[index]
+        category = (outfit.get("category") or "").lower()
+        family = COLOR_FAMILY_NAMES[features["color"][index]]
+        tip = CATEGORY_TIPS.get(category, "Try pairing it with different accessories or layering it.")
+        if family in COLOR_TIPS:
+            tip = f"{tip} {COLOR_TIPS[family]}"
+        suggestion = {
+            "outfit_name": outfit["name"],
+            "styling_tip": tip,
+            "occasion": CATEGORY_OCCASIONS.get(category, "Daily wear"),
+            "complementary_items": complementary_items(index, outfits, features)
+        }
+        if temperature is not None:
+            suggestion["recommendation_level"] = "mostly recommended" if rank == 0 else ("recommended" if rank == 1 else "least recommended")
+        suggestions.append(suggestion)
+    return suggestions
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+def summarize_wardrobe(outfits: List[dict], token_budget: int) -> str:
+    counts: Dict[str, Dict[str, int]] = {}
+    for outfit in outfits:
+        colors = counts.setdefault((outfit.get("category") or "other").lower(), {})
+        color = " ".join((outfit.get("color") or "unknown").lower().split())
+        colors[color] = colors.get(color, 0) + 1
+    parts = []
+    for category, colors in sorted(counts.items(), key=lambda item: -sum(item[1].values())):
+        top_colors = sorted(colors.items(), key=lambda item: -item[1])[:3]
+        part = f"{category} {sum(colors.values())} ({', '.join(f'{color} {count}' for color, count in top_colors)})"
+        if estimate_tokens("; ".join(parts + [part])) > token_budget:
+            break
+        parts.append(part)
+    return "; ".join(parts)
+def build_wardrobe_prompt(
+    outfits: List[dict],
+    features: Dict[str, np.ndarray],
+    intro: str,
+    instructions: str,
+    describe,
+    temperature: Optional[float] = None,
+    max_items: int = AI_PROMPT_MAX_ITEMS,
+    token_budget: int = AI_PROMPT_TOKEN_BUDGET
+) -> tuple:
+    now = datetime.now(timezone.utc)
+    candidates = np.argsort(-score_wardrobe(features, temperature, now), kind="stable")
+    if temperature is not None:
+        fit = season_weights(temperature, now)[features["season"]]
+        suitable = candidates[fit[candidates] >= 0.5]
+        if len(suitable):
+            candidates = suitable
+    used_tokens = estimate_tokens(intro) + estimate_tokens(instructions) + AI_PROMPT_SUMMARY_TOKENS
+    group_counts: Dict[tuple, int] = {}
+    listed = set()
+    lines = []
+    duplicates = 0
+    for i in candidates:
+        outfit = outfits[i]
+        key = (features["category"][i], features["season"][i], " ".join((outfit.get("color") or "").lower().split()))
+        if group_counts.get(key, 0) >= AI_PROMPT_MAX_PER_GROUP:
+            duplicates += 1
+            continue
+        line = describe(outfit)
+        cost = estimate_tokens(line) + 1
+        if len(lines) >= max_items or used_tokens + cost > token_budget:
+            break
+        group_counts[key] = group_counts.get(key, 0) + 1
+        listed.add(int(i))
+        lines.append(line)
+        used_tokens += cost
+    remaining = [outfit for i, outfit in enumerate(outfits) if i not in listed]
+    summary = summarize_wardrobe(remaining, AI_PROMPT_SUMMARY_TOKENS) if remaining else ""
+    prompt = intro + "\n".join(lines)
+    if summary:
+        prompt += f"\nOther items in the wardrobe, by category and color: {summary}"
+    prompt += f"\n\n{instructions}"
+    stats = {
+        "prompt_tokens": estimate_tokens(prompt),
+        "token_budget": token_budget,
+        "wardrobe_size": len(outfits),
+        "candidates": int(len(candidates)),
+        "items_listed": len(lines),
+        "duplicates_skipped": duplicates,
+        "items_summarized": len(remaining),
+    }
+    return prompt, [outfits[i] for i in sorted(listed)], stats
+def timestamp_seconds(value) -> float:
+    if not value:
+        return np.nan
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+def search_tokens(text: Optional[str]) -> List[str]:
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+def token_trigrams(token: str, prefix_only: bool = False) -> set:
+    padded = f"  {token}" if prefix_only else f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+def edit_distance(a: str, b: str, limit: int) -> int:
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+class OutfitSearchIndex:
+    def __init__(self, outfits: List[dict]):
+        self.fields: Dict[str, Dict[str, float]] = {}
+        self.token_outfits: Dict[str, set] = defaultdict(set)
+        self.trigram_tokens: Dict[str, set] = defaultdict(set)
+        for outfit in outfits:
+            self.add(outfit)
+    def add(self, outfit: dict):
+        self.remove(outfit["id"])
+        weights: Dict[str, float] = {}
+        for field, weight in SEARCH_FIELD_WEIGHTS.items():
+            for token in search_tokens(outfit.get(field)):
+                weights[token] = max(weights.get(token, 0.0), weight)
+        self.fields[outfit["id"]] = weights
+        for token in weights:
+            if not self.token_outfits[token]:
+                for gram in token_trigrams(token):
+                    self.trigram_tokens[gram].add(token)
+            self.token_outfits[token].add(outfit["id"])
+    def remove(self, outfit_id: str):
+        for token in self.fields.pop(outfit_id, {}):
+            outfits = self.token_outfits[token]
+            outfits.discard(outfit_id)
+            if not outfits:
+                del self.token_outfits[token]
+                for gram in token_trigrams(token):
+                    self.trigram_tokens[gram].discard(token)
+                    if not self.trigram_tokens[gram]:
+                        del self.trigram_tokens[gram]
+    def expand(self, query_token: str) -> Dict[str, float]:
+        matches = {}
+        if query_token in self.token_outfits:
+            matches[query_token] = 3.0
+        prefix_grams = token_trigrams(query_token, prefix_only=True)
+        candidates = set.intersection(*(self.trigram_tokens.get(gram, set()) for gram in prefix_grams))
+        for token in candidates:
+            if token != query_token and token.startswith(query_token):
+                matches[token] = 2.0 + len(query_token) / len(token) * 0.5
+        if len(query_token) < 3:
+            return matches
+        query_grams = token_trigrams(query_token)
+        shared = Counter()
+        for gram in query_grams:
+            for token in self.trigram_tokens.get(gram, ()):
+                shared[token] += 1
+        limit = 1 if len(query_token) <= 5 else 2
+        for token, count in shared.items():
+            if token in matches:
+                continue
+            similarity = count / (len(query_grams) + len(token) + 1 - count)
+            if similarity < SEARCH_MIN_SIMILARITY:
+                continue
+            distance = edit_distance(query_token, token, limit)
+            if distance <= limit:
+                matches[token] = 1.0 + similarity - distance * 0.25
+        return matches
+    def search(self, query: str) -> Dict[str, float]:
+        query_tokens = search_tokens(query)
+        if not query_tokens:
+            return {outfit_id: 0.0 for outfit_id in self.fields}
+        scores: Optional[Dict[str, float]] = None
+        for query_token in query_tokens:
+            token_scores: Dict[str, float] = {}
+            for token, match_score in self.expand(query_token).items():
+                for outfit_id in self.token_outfits[token]:
+                    score = match_score * self.fields[outfit_id][token]
+                    if score > token_scores.get(outfit_id, 0.0):
+                        token_scores[outfit_id] = score
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {outfit_id: score + token_scores[outfit_id] for outfit_id, score in scores.items() if outfit_id in token_scores}
+            if not scores:
+                break
+        return scores
+def garment_slot(outfit: dict) -> Optional[str]:
+    for token in reversed(search_tokens((outfit.get("name") or "").replace("-", ""))):
+        slot = GARMENT_KEYWORDS.get(token) or (GARMENT_KEYWORDS.get(token[:-1]) if token.endswith("s") else None)
+        if slot:
+            return slot
+    return None
+class DuplicateIndex:
+    def __init__(self, outfits: List[dict]):
+        self.hashes: Dict[str, int] = {}
+        self.bands: List[Dict[int, set]] = [defaultdict(set) for _ in range(DUPLICATE_HASH_BANDS)]
+        for outfit in outfits:
+            self.add(outfit)
+    @staticmethod
+    def band_keys(value: int) -> List[int]:
+        mask = (1 << DUPLICATE_BAND_BITS) - 1
+        return [(value >> (DUPLICATE_BAND_BITS * band)) & mask for band in range(DUPLICATE_HASH_BANDS)]
+    def add(self, outfit: dict):
+        self.remove(outfit["id"])
+        value = int(outfit.get("image_dhash") or "0", 16)
+        if value == 0:
+            return
+        self.hashes[outfit["id"]] = value
+        for band, key in enumerate(self.band_keys(value)):
+            self.bands[band][key].add(outfit["id"])
+    def remove(self, outfit_id: str):
+        value = self.hashes.pop(outfit_id, None)
+        if value is None:
+            return
+        for band, key in enumerate(self.band_keys(value)):
+            members = self.bands[band][key]
+            members.discard(outfit_id)
+            if not members:
+                del self.bands[band][key]
+    def near(self, value: int, max_distance: int = DUPLICATE_MAX_DISTANCE) -> List[tuple]:
+        candidates = set()
+        flips = [1 << bit for bit in range(DUPLICATE_BAND_BITS)] if max_distance >= DUPLICATE_HASH_BANDS else []
+        for band, key in enumerate(self.band_keys(value)):
+            buckets = self.bands[band]
+            for probe in [key] + [key ^ flip for flip in flips]:
+                candidates |= buckets.get(probe, set())
+        matches = [(hamming_distance(value, self.hashes[outfit_id]), outfit_id) for outfit_id in candidates]
+        return sorted(match for match in matches if match[0] <= max_distance)
+    def groups(self, max_distance: int = DUPLICATE_MAX_DISTANCE) -> List[List[str]]:
+        parent: Dict[str, str] = {}
+        def find(outfit_id: str) -> str:
+            while parent.get(outfit_id, outfit_id) != outfit_id:
+                parent[outfit_id] = parent.get(parent[outfit_id], parent[outfit_id])
+                outfit_id = parent[outfit_id]
+            return outfit_id
+        for outfit_id, value in self.hashes.items():
+            for _, other in self.near(value, max_distance):
+                root, other_root = find(outfit_id), find(other)
+                if root != other_root:
+                    parent[other_root] = root
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for outfit_id in self.hashes:
+            groups[find(outfit_id)].append(outfit_id)
+        return [members for members in groups.values() if len(members) > 1]
+class CombinationIndex:
+    def __init__(self, outfits: List[dict]):
+        self.matrix = np.zeros((16, 16), dtype=np.float32)
+        self.codes = np.zeros((16, 4), dtype=np.int8)
+        self.keys: List[tuple] = []
+        self.members: List[set] = []
+        self.rows: Dict[tuple, int] = {}
+        self.item_keys: Dict[str, tuple] = {}
+        for outfit in outfits:
+            self.add(outfit)
+    @staticmethod
+    def signature(outfit: dict) -> Optional[tuple]:
+        slot = garment_slot(outfit)
+        if slot is None:
+            return None
+        return (
+            GARMENT_SLOT_NAMES.index(slot),
+            code_of(outfit.get("category"), RECOMMENDER_CATEGORIES) + 1,
+            color_family_code(outfit.get("color")),
+            max(code_of(outfit.get("season"), RECOMMENDER_SEASONS), 0),
+        )
+    def grow(self):
+        size = len(self.matrix)
+        matrix = np.zeros((size * 2, size * 2), dtype=np.float32)
+        matrix[:size, :size] = self.matrix
+        codes = np.zeros((size * 2, 4), dtype=np.int8)
+        codes[:size] = self.codes
+        self.matrix, self.codes = matrix, codes
+    def add(self, outfit: dict):
+        self.remove(outfit["id"])
+        key = self.signature(outfit)
+        if key is None:
+            return
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self.matrix):
+                self.grow()
+            self.keys.append(key)
+            self.members.append(set())
+            self.rows[key] = row
+            self.codes[row] = key
+            codes = self.codes[:row + 1]
+            compat = COLOR_HARMONY[key[2], codes[:, 2]] * SEASON_OVERLAP[key[3], codes[:, 3]] * STYLE_HARMONY[key[1], codes[:, 1]]
+            self.matrix[row, :row + 1] = compat
+            self.matrix[:row + 1, row] = compat
+        self.members[row].add(outfit["id"])
+        self.item_keys[outfit["id"]] = key
+    def remove(self, outfit_id: str):
+        key = self.item_keys.pop(outfit_id, None)
+        if key is None:
+            return
+        row = self.rows[key]
+        self.members[row].discard(outfit_id)
+        if self.members[row]:
+            return
+        del self.rows[key]
+        last = len(self.keys) - 1
+        if row != last:
+            moved = self.keys[last]
+            self.keys[row] = moved
+            self.members[row] = self.members[last]
+            self.rows[moved] = row
+            self.codes[row] = self.codes[last]
+            self.matrix[row, :] = self.matrix[last, :]
+            self.matrix[:, row] = self.matrix[:, last]
+        self.keys.pop()
+        self.members.pop()
+    def search_template(self, candidates: List[np.ndarray], best: np.ndarray, heap: List[tuple], limit: int):
+        size = len(candidates)
+        pairs = size * (size - 1) / 2
+        slot_best = [float(best[rows].max()) for rows in candidates]
+        row_max = {(u, v): self.matrix[np.ix_(candidates[u], candidates[v])].max(axis=1) for u in range(size) for v in range(u + 1, size)}
+        block_max = {key: float(values.max()) for key, values in row_max.items()}
+        def extend(assigned: List[int], harmony: float, items: float):
+            depth = len(assigned)
+            rows = candidates[depth]
+            gains = harmony + self.matrix[assigned][:, rows].sum(axis=0)
+            child_items = items + best[rows]
+            optimistic = gains.copy()
+            for u in range(depth + 1, size):
+                optimistic += self.matrix[assigned][:, candidates[u]].max(axis=1).sum() if assigned else 0.0
+                optimistic += row_max[depth, u]
+                optimistic += sum(block_max[u, v] for v in range(u + 1, size))
+            bounds = COMBINATION_HARMONY_WEIGHT * optimistic / pairs + (1 - COMBINATION_HARMONY_WEIGHT) * (child_items + sum(slot_best[depth + 1:])) / size
+            order = np.argsort(-bounds, kind="stable")
+            for i in (order if depth + 1 < size else order[:limit]):
+                if len(heap) >= limit and bounds[i] <= heap[0][0]:
+                    break
+                chosen = assigned + [int(rows[i])]
+                if depth + 1 < size:
+                    extend(chosen, float(gains[i]), float(child_items[i]))
+                elif len(heap) < limit:
+                    heapq.heappush(heap, (float(bounds[i]), tuple(chosen)))
+                else:
+                    heapq.heapreplace(heap, (float(bounds[i]), tuple(chosen)))
+        extend([], 0.0, 0.0)
+    def top_looks(self, scores: np.ndarray, positions: Dict[str, int], templates: List[tuple], limit: int) -> List[tuple]:
+        ranked = [sorted(members, key=lambda outfit_id: (-scores[positions[outfit_id]], outfit_id)) for members in self.members]
+        best = np.array([scores[positions[members[0]]] for members in ranked], dtype=np.float32)
+        slots = self.codes[:len(self.keys), 0]
+        heap: List[tuple] = []
+        for template in templates:
+            candidates = [np.flatnonzero(slots == GARMENT_SLOT_NAMES.index(slot)) for slot in template]
+            if all(len(rows) for rows in candidates):
+                self.search_template(candidates, best, heap, limit)
+        looks = []
+        used = set()
+        for score, rows in sorted(heap, reverse=True):
+            outfit_ids = []
+            for row in rows:
+                outfit_id = next((outfit_id for outfit_id in ranked[row] if outfit_id not in used), ranked[row][0])
+                used.add(outfit_id)
+                outfit_ids.append(outfit_id)
+            looks.append((score, [GARMENT_SLOT_NAMES[self.keys[row][0]] for row in rows], outfit_ids))
+        return looks
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + self.codes.nbytes
+class WardrobeIndex:
+    columns = ("category", "season", "color", "usage", "last_used")
+    def __init__(self, outfits: List[dict]):
+        capacity = max(len(outfits), 16)
+        self.outfits: List[dict] = []
+        self.positions: Dict[str, int] = {}
+        self.category = np.empty(capacity, dtype=np.int8)
+        self.season = np.empty(capacity, dtype=np.int8)
+        self.color = np.empty(capacity, dtype=np.int8)
+        self.usage = np.empty(capacity, dtype=np.float32)
+        self.last_used = np.empty(capacity, dtype=np.float64)
+        self.loaded_at = time.monotonic()
+        self.search: Optional[OutfitSearchIndex] = None
+        self.combinations: Optional[CombinationIndex] = None
+        self.duplicates: Optional[DuplicateIndex] = None
+        for outfit in outfits:
+            self.upsert(outfit)
+    def __len__(self) -> int:
+        return len(self.outfits)
+    def grow(self):
+        for name in self.columns:
+            column = getattr(self, name)
+            grown = np.empty(len(column) * 2, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+    def upsert(self, outfit: dict):
+        outfit = {key: value for key, value in outfit.items() if key != "_id"}
+        position = self.positions.get(outfit["id"])
+        if position is None:
+            position = len(self.outfits)
+            if position == len(self.usage):
+                self.grow()
+            self.outfits.append(outfit)
+            self.positions[outfit["id"]] = position
+        else:
+            self.outfits[position] = outfit
+        self.category[position] = code_of(outfit.get("category"), RECOMMENDER_CATEGORIES)
+        self.season[position] = max(code_of(outfit.get("season"), RECOMMENDER_SEASONS), 0)
+        self.color[position] = color_family_code(outfit.get("color"))
+        self.usage[position] = outfit.get("usage_count", 0) or 0
+        self.last_used[position] = timestamp_seconds(outfit.get("last_used"))
+        if self.search is not None:
+            self.search.add(outfit)
+        if self.combinations is not None:
+            self.combinations.add(outfit)
+        if self.duplicates is not None:
+            self.duplicates.add(outfit)
+    def remove(self, outfit_id: str):
+        position = self.positions.pop(outfit_id, None)
+        if position is None:
+            return
+        if self.search is not None:
+            self.search.remove(outfit_id)
+        if self.combinations is not None:
+            self.combinations.remove(outfit_id)
+        if self.duplicates is not None:
+            self.duplicates.remove(outfit_id)
+        last = len(self.outfits) - 1
+        if position != last:
+            moved = self.outfits[last]
+            self.outfits[position] = moved
+            self.positions[moved["id"]] = position
+            for name in self.columns:
+                column = getattr(self, name)
+                column[position] = column[last]
+        self.outfits.pop()
+    def record_use(self, outfit_id: str, used_at: datetime):
+        position = self.positions.get(outfit_id)
+        if position is None:
+            return
+        outfit = dict(self.outfits[position])
+        outfit["usage_count"] = (outfit.get("usage_count", 0) or 0) + 1
+        outfit["last_used"] = used_at.isoformat()
+        self.outfits[position] = outfit
+        self.usage[position] += 1
+        self.last_used[position] = used_at.timestamp()
+    def features(self, now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        size = len(self.outfits)
+        now = now or datetime.now(timezone.utc)
+        days = (now.timestamp() - self.last_used[:size]) / 86400
+        days = np.where(np.isnan(days), np.inf, np.maximum(days, 0)).astype(np.float32)
+        return {
+            "category": self.category[:size],
+            "season": self.season[:size],
+            "color": self.color[:size],
+            "usage": self.usage[:size],
+            "days_since_used": days,
+        }
+    def search_index(self) -> OutfitSearchIndex:
+        if self.search is None:
+            self.search = OutfitSearchIndex(self.outfits)
+        return self.search
+    def combination_index(self) -> CombinationIndex:
+        if self.combinations is None:
+            self.combinations = CombinationIndex(self.outfits)
+        return self.combinations
+    def duplicate_index(self) -> DuplicateIndex:
+        if self.duplicates is None:
+            self.duplicates = DuplicateIndex(self.outfits)
+        return self.duplicates
+    def usage_order(self) -> np.ndarray:
+        return np.argsort(-self.usage[:len(self.outfits)], kind="stable")
+    def nbytes(self) -> int:
+        item_bytes = WARDROBE_INDEX_ITEM_BYTES + (WARDROBE_SEARCH_ITEM_BYTES if self.search is not None else 0)
+        combination_bytes = self.combinations.nbytes() if self.combinations is not None else 0
+        duplicate_bytes = len(self.duplicates.hashes) * WARDROBE_DUPLICATE_ITEM_BYTES if self.duplicates is not None else 0
+        return sum(getattr(self, name).nbytes for name in self.columns) + len(self.outfits) * item_bytes + combination_bytes + duplicate_bytes
+class WardrobeIndexCache:
+    def __init__(self, memory_budget: int, ttl_seconds: int):
+        self.memory_budget = memory_budget
+        self.ttl_seconds = ttl_seconds
+        self.indexes: "OrderedDict[str, WardrobeIndex]" = OrderedDict()
+        self.locks: Dict[str, asyncio.Lock] = {}
+    def fresh(self, index: Optional[WardrobeIndex]) -> bool:
+        return index is not None and time.monotonic() - index.loaded_at < self.ttl_seconds
+    async def get(self, user_id: str) -> WardrobeIndex:
+        index = self.indexes.get(user_id)
+        if self.fresh(index):
+            metrics.inc("cache_requests_total", (("cache", "wardrobe_index"), ("result", "hit")))
+            self.indexes.move_to_end(user_id)
+            return index
+        lock = self.locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            index = self.indexes.get(user_id)
+            if self.fresh(index):
+                metrics.inc("cache_requests_total", (("cache", "wardrobe_index"), ("result", "hit")))
+            else:
+                metrics.inc("cache_requests_total", (("cache", "wardrobe_index"), ("result", "miss")))
+                outfits = await db.outfits.find({"user_id": user_id}, {"_id": 0}).to_list(WARDROBE_INDEX_LOAD_LIMIT)
+                index = WardrobeIndex(outfits)
+                self.indexes[user_id] = index
+                self.evict()
+            self.indexes.move_to_end(user_id)
+        self.locks.pop(user_id, None)
+        return index
+    def upsert(self, user_id: str, outfit: dict):
+        index = self.indexes.get(user_id)
+        if index is not None:
+            index.upsert(outfit)
+    def remove(self, user_id: str, outfit_id: str):
+        index = self.indexes.get(user_id)
+        if index is not None:
+            index.remove(outfit_id)
+    def record_use(self, user_id: str, outfit_id: str, used_at: datetime):
+        index = self.indexes.get(user_id)
+        if index is not None:
+            index.record_use(outfit_id, used_at)
+    def invalidate(self, user_id: str):
+        self.indexes.pop(user_id, None)
+    def evict(self):
+        total = sum(index.nbytes() for index in self.indexes.values())
+        while total > self.memory_budget and len(self.indexes) > 1:
+            _, evicted = self.indexes.popitem(last=False)
+            total -= evicted.nbytes()
+wardrobe_indexes = WardrobeIndexCache(WARDROBE_INDEX_MEMORY_BUDGET, WARDROBE_INDEX_TTL_SECONDS)
+class UserCache:
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.users: "OrderedDict[str, tuple]" = OrderedDict()
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self.users.get(user_id)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl_seconds:
+            metrics.inc("cache_requests_total", (("cache", "user"), ("result", "miss")))
+            return None
+        metrics.inc("cache_requests_total", (("cache", "user"), ("result", "hit")))
+        self.users.move_to_end(user_id)
+        return dict(entry[1])
+    def put(self, user: dict):
+        if self.ttl_seconds <= 0:
+            return
+        self.users[user["id"]] = (time.monotonic(), dict(user))
+        self.users.move_to_end(user["id"])
+        while len(self.users) > self.max_entries:
+            self.users.popitem(last=False)
+    def invalidate(self, user_id: str):
+        self.users.pop(user_id, None)
+user_cache = UserCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+class MemoryInvalidationTransport:
+    def __init__(self):
+        self.buses: List["InvalidationBus"] = []
+    async def start(self, bus: "InvalidationBus") -> Optional[asyncio.Task]:
+        self.buses.append(bus)
+        return None
+    async def publish(self, event: InvalidationEvent):
+        for bus in self.buses:
+            if bus.worker_id != event.origin:
+                bus.deliver(event)
+class MongoInvalidationTransport:
+    def __init__(self, collection: str = INVALIDATION_COLLECTION):
+        self.collection = collection
+        self.seen: "OrderedDict[str, None]" = OrderedDict()
+        self.capped = False
+    async def start(self, bus: "InvalidationBus") -> Optional[asyncio.Task]:
+        try:
+            await db.create_collection(self.collection, capped=True, size=INVALIDATION_CAPPED_BYTES)
+        except CollectionInvalid:
+            pass
+        except Exception as e:
+            logging.warning(f"Could not create capped collection {self.collection}: {e}")
+        try:
+            self.capped = bool((await db[self.collection].options()).get("capped"))
+        except Exception as e:
+            logging.warning(f"Could not read options of {self.collection}: {e}")
+            self.capped = False
+        if not self.capped:
+            logging.warning(f"{self.collection} is not capped, polling it every {INVALIDATION_POLL_SECONDS}s instead of tailing")
+            await db[self.collection].create_index("at")
+            await db[self.collection].create_index("created_at", expireAfterSeconds=INVALIDATION_EVENT_TTL_SECONDS)
+        return asyncio.create_task(self.tail(bus) if self.capped else self.poll(bus))
+    async def publish(self, event: InvalidationEvent):
+        await db[self.collection].insert_one({**event.model_dump(), "created_at": datetime.now(timezone.utc)})
+    def receive(self, bus: "InvalidationBus", doc: dict):
+        if doc["id"] in self.seen:
+            return
+        self.seen[doc["id"]] = None
+        if len(self.seen) > INVALIDATION_SEEN_LIMIT:
+            self.seen.popitem(last=False)
+        if doc["origin"] != bus.worker_id:
+            bus.deliver(InvalidationEvent(**{field: doc[field] for field in InvalidationEvent.model_fields}))
+    def resume_from(self, since: str) -> str:
+        return (datetime.fromisoformat(since) - timedelta(seconds=INVALIDATION_RESUME_MARGIN_SECONDS)).isoformat()
+    async def tail(self, bus: "InvalidationBus"):
+        since = datetime.now(timezone.utc).isoformat()
+        while True:
+            try:
+                cursor = db[self.collection].find({"at": {"$gte": self.resume_from(since)}}, {"_id": 0}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while True:
+                    async for doc in cursor:
+                        since = max(since, doc["at"])
+                        self.receive(bus, doc)
+                    if not cursor.alive:
+                        break
+                    await asyncio.sleep(INVALIDATION_POLL_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Invalidation bus tail error: {e}")
+            await asyncio.sleep(INVALIDATION_POLL_SECONDS)
+    async def poll(self, bus: "InvalidationBus"):
+        since = datetime.now(timezone.utc).isoformat()
+        while True:
+            try:
+                async for doc in db[self.collection].find({"at": {"$gte": self.resume_from(since)}}, {"_id": 0}).sort("at", 1):
+                    since = max(since, doc["at"])
+                    self.receive(bus, doc)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Invalidation bus poll error: {e}")
+            await asyncio.sleep(INVALIDATION_POLL_SECONDS)
+class InvalidationBus:
+    def __init__(self, transport, worker_id: str = WORKER_ID):
+        self.transport = transport
+        self.worker_id = worker_id
+        self.handlers: Dict[str, List] = defaultdict(list)
+    def subscribe(self, kind: str, handler):
+        self.handlers[kind].append(handler)
+    def deliver(self, event: InvalidationEvent):
+        metrics.inc("invalidation_events_total", (("kind", event.kind), ("direction", "received")))
+        for handler in self.handlers.get(event.kind, []):
+            try:
+                handler(event.key)
+            except Exception as e:
+                logging.warning(f"Invalidation handler for {event.kind} failed: {e}")
+    async def publish(self, kind: str, key: str, local: bool = False):
+        if kind not in INVALIDATION_KINDS:
+            raise ValueError(f"Unknown invalidation event kind: {kind}")
+        event = InvalidationEvent(kind=kind, key=key, origin=self.worker_id)
+        if local:
+            self.deliver(event)
+        metrics.inc("invalidation_events_total", (("kind", kind), ("direction", "sent")))
+        try:
+            await self.transport.publish(event)
+        except Exception as e:
+            logging.warning(f"Could not publish {kind} invalidation for {key}: {e}")
+    async def start(self) -> Optional[asyncio.Task]:
+        return await self.transport.start(self)
+invalidation_bus = InvalidationBus(MongoInvalidationTransport() if INVALIDATION_BUS == "mongo" else MemoryInvalidationTransport())
+invalidation_bus.subscribe("wardrobe", wardrobe_indexes.invalidate)
+invalidation_bus.subscribe("user", user_cache.invalidate)
+async def find_duplicate_hints(user_id: str, dhash: Optional[str]) -> List[DuplicateHint]:
+    if not dhash:
+        return []
+    index = await wardrobe_indexes.get(user_id)
+    duplicates = index.duplicate_index()
+    wardrobe_indexes.evict()
+    return [
+        DuplicateHint(outfit_id=outfit_id, name=index.outfits[index.positions[outfit_id]]["name"], distance=distance)
+        for distance, outfit_id in duplicates.near(int(dhash, 16))[:DUPLICATE_HINT_LIMIT]
+    ]
+async def backfill_image_dhashes(user_id: str) -> int:
+    image_hashes = await db.outfits.distinct("image_hash", {"user_id": user_id, "image_hash": {"$ne": None}, "image_dhash": None})
+    semaphore = asyncio.Semaphore(DUPLICATE_SCAN_CONCURRENCY)
+    async def backfill(image_hash: str) -> int:
+        async with semaphore:
+            try:
+                blob = await db.image_blobs.find_one({"sha256": image_hash}, {"_id": 0})
+                if not blob:
+                    return 0
+                dhash = blob.get("dhash")
+                if not dhash:
+                    dhash = await asyncio.to_thread(image_dhash_from_bytes, await image_stores[blob["storage_type"]].get(blob_locator(blob)))
+                    await db.image_blobs.update_one({"sha256": image_hash}, {"$set": {"dhash": dhash}})
+                await db.outfits.update_many({"user_id": user_id, "image_hash": image_hash}, {"$set": {"image_dhash": dhash}})
+                return 1
+            except Exception as e:
+                logging.warning(f"Could not hash image {image_hash}: {e}")
+                return 0
+    return sum(await asyncio.gather(*(backfill(image_hash) for image_hash in image_hashes)))
+def local_weather_suggestions(outfits: List[dict], temperature: float, weather_desc: str, features: Optional[Dict[str, np.ndarray]] = None) -> List[dict]:
+    suggestions = recommend_outfits(outfits, temperature=temperature, limit=3, features=features)
+    for suggestion in suggestions:
+        suggestion["reason"] = f"Perfect for {temperature}°C and {weather_desc}"
+    return suggestions
+async def reserve_wardrobe_version(user_id: str) -> int:
+    doc = await db.wardrobe_versions.find_one_and_update(
+        {"user_id": user_id},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}, "$setOnInsert": {"committed": 0}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+async def commit_wardrobe_version(user_id: str, version: int, candidates_changed: bool = True):
+    ready = {"user_id": user_id, "$or": [{"committed": {"$gte": version - 1}}, {"committed": {"$exists": False}}]}
+    deadline = time.monotonic() + WARDROBE_COMMIT_WAIT_SECONDS
+    while not (await db.wardrobe_versions.update_one(ready, {"$max": {"committed": version}})).matched_count:
+        if time.monotonic() >= deadline:
+            logging.warning(f"Wardrobe version {version - 1} for {user_id} was never committed, skipping it")
+            await db.wardrobe_versions.update_one({"user_id": user_id}, {"$max": {"committed": version}})
+            break
+        await asyncio.sleep(WARDROBE_COMMIT_POLL_SECONDS)
+    if candidates_changed:
+        await db.daily_suggestions.delete_many({"user_id": user_id})
+    await invalidation_bus.publish("wardrobe", user_id)
+@asynccontextmanager
+async def wardrobe_write(user_id: str, candidates_changed: bool = True):
+    version = await reserve_wardrobe_version(user_id)
+    try:
+        yield version
+    finally:
+        await commit_wardrobe_version(user_id, version, candidates_changed)
+async def get_wardrobe_version(user_id: str) -> int:
+    doc = await db.wardrobe_versions.find_one({"user_id": user_id}, {"_id": 0, "version": 1, "committed": 1})
+    return doc.get("committed", doc["version"]) if doc else 0
+def wardrobe_etag(user_id: str, version: int, api_base_url: str) -> str:
+    window = int(time.time() // max(SIGNED_URL_TTL_SECONDS // 2, 1)) if SIGNED_IMAGE_URLS else 0
+    digest = hashlib.sha1(f"{user_id}:{version}:{window}:{api_base_url}".encode()).hexdigest()[:20]
+    return f'"{digest}"'
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+def activity_week(moment) -> str:
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    year, week, _ = moment.isocalendar()
+    return f"{year}-W{week:02d}"
+def empty_group_stats(group: dict) -> dict:
+    return {
+        "group_id": group["id"],
+        "members": list(group.get("members", [])),
+        "shares_count": 0,
+        "ratings_count": 0,
+        "rating_sum": 0,
+        "rating_distribution": {str(value): 0 for value in range(1, 6)},
+        "outfits": {},
+        "sharers": {},
+        "weekly": {},
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+        "reconciled_at": None
+    }
+async def reconcile_group_stats(group_id: str) -> Optional[dict]:
+    group = await db.groups.find_one({"id": group_id}, {"_id": 0, "id": 1, "members": 1})
+    if not group:
+        await db.group_stats.delete_one({"group_id": group_id})
+        return None
+    shares = await db.shared_outfits_to_group.find({"group_id": group_id}, {"_id": 0}).to_list(None)
+    ratings = await db.outfit_ratings.find({"group_id": group_id}, {"_id": 0, "outfit_id": 1, "rating": 1, "rated_at": 1}).to_list(None)
+    outfit_names = {o["id"]: o["name"] async for o in db.outfits.find({"id": {"$in": [share["outfit_id"] for share in shares]}}, {"_id": 0, "id": 1, "name": 1})}
+    usernames = {u["id"]: u["username"] async for u in db.users.find({"id": {"$in": list({share["shared_by_user_id"] for share in shares})}}, {"_id": 0, "id": 1, "username": 1})}
+    stats = empty_group_stats(group)
+    for share in shares:
+        if share["outfit_id"] not in outfit_names:
+            continue
+        sharer_id = share["shared_by_user_id"]
+        stats["shares_count"] += 1
+        stats["outfits"][share["outfit_id"]] = {"name": outfit_names[share["outfit_id"]], "shared_by": sharer_id, "ratings_count": 0, "rating_sum": 0}
+        sharer = stats["sharers"].setdefault(sharer_id, {"username": usernames.get(sharer_id), "shares": 0})
+        sharer["shares"] += 1
+        week = stats["weekly"].setdefault(activity_week(share["shared_at"]), {"shares": 0, "ratings": 0})
+        week["shares"] += 1
+    for rating in ratings:
+        outfit = stats["outfits"].get(rating["outfit_id"])
+        if outfit is None:
+            continue
+        stats["ratings_count"] += 1
+        stats["rating_sum"] += rating["rating"]
+        stats["rating_distribution"][str(rating["rating"])] += 1
+        outfit["ratings_count"] += 1
+        outfit["rating_sum"] += rating["rating"]
+        week = stats["weekly"].setdefault(activity_week(rating["rated_at"]), {"shares": 0, "ratings": 0})
+        week["ratings"] += 1
+    oldest_week = activity_week(datetime.now(timezone.utc) - timedelta(weeks=GROUP_STATS_WEEKS))
+    stats["weekly"] = {week: counts for week, counts in stats["weekly"].items() if week > oldest_week}
+    stats["reconciled_at"] = stats["updated_at"]
+    await db.group_stats.replace_one({"group_id": group_id}, stats, upsert=True)
+    return stats
+async def update_group_stats(group_id: str, update: dict):
+    try:
+        update.setdefault("$set", {})["updated_at"] = datetime.now(timezone.utc).isoformat()
+        result = await db.group_stats.update_one({"group_id": group_id}, update)
+        if result.matched_count == 0:
+            await reconcile_group_stats(group_id)
+    except Exception as e:
+        logging.warning(f"Could not update stats for group {group_id}: {e}")
+async def record_group_share(group_id: str, outfit: dict, user: dict, shared_at: datetime):
+    week = activity_week(shared_at)
+    await update_group_stats(group_id, {
+        "$inc": {"shares_count": 1, f"sharers.{user['id']}.shares": 1, f"weekly.{week}.shares": 1},
+        "$set": {
+            f"outfits.{outfit['id']}": {"name": outfit["name"], "shared_by": user["id"], "ratings_count": 0, "rating_sum": 0},
+            f"sharers.{user['id']}.username": user["username"]
+        }
+    })
+async def record_group_rating(group_id: str, outfit_id: str, rating: int, previous: Optional[int] = None):
+    if previous is None:
+        increments = {
+            "ratings_count": 1,
+            "rating_sum": rating,
+            f"rating_distribution.{rating}": 1,
+            f"outfits.{outfit_id}.ratings_count": 1,
+            f"outfits.{outfit_id}.rating_sum": rating,
+            f"weekly.{activity_week(datetime.now(timezone.utc))}.ratings": 1
+        }
+    elif previous != rating:
+        increments = {
+            "rating_sum": rating - previous,
+            f"rating_distribution.{previous}": -1,
+            f"rating_distribution.{rating}": 1,
+            f"outfits.{outfit_id}.rating_sum": rating - previous
+        }
+    else:
+        return
+    await update_group_stats(group_id, {"$inc": increments})
+async def record_group_outfit_removed(outfit_id: str):
+    shares = await db.shared_outfits_to_group.find({"outfit_id": outfit_id}, {"_id": 0}).to_list(None)
+    oldest_week = activity_week(datetime.now(timezone.utc) - timedelta(weeks=GROUP_STATS_WEEKS))
+    for share in shares:
+        group_id = share["group_id"]
+        if not await db.group_stats.count_documents({"group_id": group_id, f"outfits.{outfit_id}": {"$exists": True}}, limit=1):
+            continue
+        increments = Counter({"shares_count": -1, f"sharers.{share['shared_by_user_id']}.shares": -1})
+        share_week = activity_week(share["shared_at"])
+        if share_week > oldest_week:
+            increments[f"weekly.{share_week}.shares"] -= 1
+        async for rating in db.outfit_ratings.find({"group_id": group_id, "outfit_id": outfit_id}, {"_id": 0, "rating": 1, "rated_at": 1}):
+            increments["ratings_count"] -= 1
+            increments["rating_sum"] -= rating["rating"]
+            increments[f"rating_distribution.{rating['rating']}"] -= 1
+            rating_week = activity_week(rating["rated_at"])
+            if rating_week > oldest_week:
+                increments[f"weekly.{rating_week}.ratings"] -= 1
+        await update_group_stats(group_id, {"$inc": dict(increments), "$unset": {f"outfits.{outfit_id}": ""}})
+async def record_group_outfit_renamed(outfit_id: str, name: str):
+    try:
+        await db.group_stats.update_many({f"outfits.{outfit_id}": {"$exists": True}}, {"$set": {f"outfits.{outfit_id}.name": name}})
+    except Exception as e:
+        logging.warning(f"Could not rename outfit {outfit_id} in group stats: {e}")
+def group_stats_response(stats: dict) -> GroupStats:
+    now = datetime.now(timezone.utc)
+    weeks = [activity_week(now - timedelta(weeks=offset)) for offset in range(GROUP_STATS_WEEKS - 1, -1, -1)]
+    rated = [
+        {
+            "outfit_id": outfit_id,
+            "name": outfit["name"],
+            "shared_by": outfit.get("shared_by"),
+            "ratings_count": outfit["ratings_count"],
+            "average_rating": round(outfit["rating_sum"] / outfit["ratings_count"], 2)
+        }
+        for outfit_id, outfit in stats.get("outfits", {}).items()
+        if outfit.get("ratings_count") and outfit.get("name")
+    ]
+    rated.sort(key=lambda entry: (-entry["average_rating"], -entry["ratings_count"], entry["name"]))
+    sharers = sorted(
+        ({"user_id": user_id, "username": sharer.get("username"), "shares": sharer["shares"]} for user_id, sharer in stats.get("sharers", {}).items() if sharer.get("shares")),
+        key=lambda entry: (-entry["shares"], entry["username"] or "")
+    )
+    weekly = stats.get("weekly", {})
+    return GroupStats(
+        group_id=stats["group_id"],
+        shares_count=stats["shares_count"],
+        ratings_count=stats["ratings_count"],
+        average_rating=round(stats["rating_sum"] / stats["ratings_count"], 2) if stats["ratings_count"] else 0.0,
+        rating_distribution=stats["rating_distribution"],
+        top_rated=rated[:GROUP_STATS_TOP_LIMIT],
+        top_sharers=sharers[:GROUP_STATS_TOP_LIMIT],
+        weekly_activity=[{"week": week, "shares": weekly.get(week, {}).get("shares", 0), "ratings": weekly.get(week, {}).get("ratings", 0)} for week in weeks],
+        updated_at=stats.get("updated_at"),
+        reconciled_at=stats.get("reconciled_at")
+    )
+async def run_group_stats_reconciliation() -> int:
+    reconciled = 0
+    async for group in db.groups.find({}, {"_id": 0, "id": 1}):
+        try:
+            await reconcile_group_stats(group["id"])
+            reconciled += 1
+        except Exception as e:
+            logging.warning(f"Group stats reconciliation failed for {group['id']}: {e}")
+    return reconciled
+async def group_stats_reconciler():
+    while True:
+        await asyncio.sleep(GROUP_STATS_RECONCILE_INTERVAL_SECONDS)
+        try:
+            reconciled = await run_group_stats_reconciliation()
+            logging.info(f"Reconciled stats for {reconciled} groups")
+        except Exception as e:
+            logging.error(f"Group stats reconciler error: {e}")
+OUTFIT_FIELDS = tuple(Outfit.model_fields)
+def utc_z(value):
+    if isinstance(value, str) and value.endswith("+00:00"):
+        return value[:-6] + "Z"
+    return value
+def json_default(value):
+    if isinstance(value, datetime):
+        return utc_z(value.isoformat())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+def dump_json(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+    return json.dumps(value, default=json_default, separators=(",", ":")).encode()
+def fast_json_response(value, status_code: int = 200) -> Response:
+    return Response(content=dump_json(value), status_code=status_code, media_type="application/json")
+def public_outfit(outfit: dict) -> dict:
+    public = {field: outfit.get(field) for field in OUTFIT_FIELDS}
+    public["usage_count"] = public["usage_count"] or 0
+    public["created_at"] = utc_z(public["created_at"])
+    public["last_used"] = utc_z(public["last_used"])
+    return public
+async def stream_json_array(batches):
+    yield b"["
+    first = True
+    async for items in batches:
+        if not items:
+            continue
+        chunk = dump_json(items)[1:-1]
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b"]"
+async def public_outfit_batches(cursor, api_base_url: str):
+    while True:
+        batch = await cursor.to_list(FAST_JSON_BATCH_SIZE)
+        if not batch:
+            break
+        await resolve_image_urls(batch, api_base_url)
+        yield [public_outfit(o) for o in batch]
 @api_router.post("/auth/register", response_model=TokenResponse)
 async def register(user_data: UserRegister):
     existing_user = await db.users.find_one({"username": user_data.username}, {"_id": 0})
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
-    password_hash = bcrypt.hash(user_data.password)
+    with timed("bcrypt"):
+        password_hash = lazy_import("passlib.hash").bcrypt.hash(user_data.password)
     user = User(username=user_data.username, email=user_data.email, password_hash=password_hash, gender=user_data.gender)
     doc = user.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
@@ -264,7 +2457,9 @@ async def register(user_data: UserRegister):
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(login_data: UserLogin):
     user = await db.users.find_one({"username": login_data.username}, {"_id": 0})
-    if not user or not bcrypt.verify(login_data.password, user['password_hash']):
+    with timed("bcrypt"):
+        valid_password = user is not None and lazy_import("passlib.hash").bcrypt.verify(login_data.password, user['password_hash'])
+    if not valid_password:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     token = create_jwt_token(user['id'], user['username'])
     return TokenResponse(token=token, username=user['username'])
@@ -310,6 +2505,7 @@ async def update_profile(
             {"id": current_user['id']},
             {"$set": update_data}
         )
+        await invalidation_bus.publish("user", current_user['id'], local=True)
     updated_user = await db.users.find_one({"id": current_user['id']}, {"_id": 0})
     return UserProfile(
         username=updated_user['username'],
@@ -326,13 +2522,17 @@ async def change_password(
     user = await db.users.find_one({"id": current_user['id']}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if not bcrypt.verify(password_data.current_password, user['password_hash']):
+    with timed("bcrypt"):
+        valid_password = lazy_import("passlib.hash").bcrypt.verify(password_data.current_password, user['password_hash'])
+    if not valid_password:
         raise HTTPException(status_code=400, detail="Current password is incorrect")
-    new_password_hash = bcrypt.hash(password_data.new_password)
+    with timed("bcrypt"):
+        new_password_hash = lazy_import("passlib.hash").bcrypt.hash(password_data.new_password)
     await db.users.update_one(
         {"id": current_user['id']},
         {"$set": {"password_hash": new_password_hash}}
     )
+    await invalidation_bus.publish("user", current_user['id'], local=True)
     return {"message": "Password changed successfully"}
 @api_router.post("/profile/upload-pic")
 async def upload_profile_pic(
@@ -346,9 +2546,7 @@ async def upload_profile_pic(
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     try:
-        content = await file.read()
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large")
+        content = await read_upload_limited(file)
         if not await validate_image(content):
             raise HTTPException(status_code=400, detail="Invalid image file")
         format_map = {
@@ -371,7 +2569,10 @@ async def upload_profile_pic(
             {"id": current_user['id']},
             {"$set": {"profile_pic_id": profile_pic_id, "profile_pic_url": profile_pic_url}}
         )
+        await invalidation_bus.publish("user", current_user['id'], local=True)
         return {"message": "Profile picture uploaded successfully", "profile_pic_url": profile_pic_url}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading profile picture: {str(e)}")
 @api_router.get("/profile-pic/{file_id}")
@@ -395,13 +2596,8 @@ async def upload_image(
             status_code=400, 
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
-    unique_id = str(uuid.uuid4())
-    filename = f"{unique_id}{file_ext}"
-    file_path = UPLOAD_DIR / filename
     try:
-        content = await file.read()
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large")
+        content = await read_upload_limited(file)
         if not await validate_image(content):
             raise HTTPException(status_code=400, detail="Invalid image file")
         format_map = {
@@ -409,28 +2605,123 @@ async def upload_image(
             ".gif": "GIF", ".webp": "WEBP"
         }
         pillow_format = format_map.get(file_ext, "JPEG")
-        compressed_content = await compress_image(content, file_format=pillow_format)
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(compressed_content)
+        compressed_content, dhash = await compress_image_with_hash(content, file_format=pillow_format)
+        filename = await image_stores["local"].put(
+            f"{UNMANAGED_UPLOAD_PREFIX}{hashlib.sha256(compressed_content).hexdigest()}{file_ext}",
+            compressed_content,
+            IMAGE_CONTENT_TYPES.get(file_ext, "image/jpeg")
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
     image_url = f"/uploads/{filename}"
-    return {"filename": filename, "image_url": image_url}
+    possible_duplicates = await find_duplicate_hints(current_user['id'], dhash)
+    return {"filename": filename, "image_url": image_url, "image_dhash": dhash, "possible_duplicates": [hint.model_dump() for hint in possible_duplicates]}
 @api_router.get("/outfits", response_model=List[Outfit])
-async def get_outfits(request: Request, current_user: dict = Depends(get_current_user)):
+async def get_outfits(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
+    api_base_url = f"{request.url.scheme}://{request.url.netloc}"
+    version = await get_wardrobe_version(current_user['id'])
+    etag = wardrobe_etag(current_user['id'], version, api_base_url)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "X-Wardrobe-Version": str(version)}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
     outfits_cursor = db.outfits.find({"user_id": current_user['id']}, {"_id": 0})
+    if FAST_JSON_RESPONSES:
+        outfits_cursor = outfits_cursor.limit(1000).batch_size(FAST_JSON_BATCH_SIZE)
+        return StreamingResponse(stream_json_array(public_outfit_batches(outfits_cursor, api_base_url)), media_type="application/json", headers=headers)
+    response.headers.update(headers)
     outfits = await outfits_cursor.to_list(1000)
-    api_base_url = f"{request.url.scheme}://{request.url.netloc}"
     for outfit in outfits:
         if isinstance(outfit.get('created_at'), str):
             outfit['created_at'] = datetime.fromisoformat(outfit['created_at'])
         if outfit.get('last_used') and isinstance(outfit['last_used'], str):
             outfit['last_used'] = datetime.fromisoformat(outfit['last_used'])
-        image_url = outfit.get('image_url')
-        if image_url and not image_url.startswith(('http://', 'https://')):
-            outfit['image_url'] = f"{api_base_url}{image_url}"
+    await resolve_image_urls(outfits, api_base_url)
     return outfits
-@api_router.post("/outfits", response_model=Outfit, status_code=status.HTTP_201_CREATED)
+@api_router.get("/outfits/search", response_model=OutfitSearchResponse)
+async def search_outfits(
+    request: Request,
+    q: str = "",
+    season: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user)
+):
+    index = await wardrobe_indexes.get(current_user['id'])
+    search_index = index.search_index()
+    wardrobe_indexes.evict()
+    scores = search_index.search(q)
+    matches = [index.outfits[index.positions[outfit_id]] for outfit_id in scores]
+    facets = {
+        "season": dict(Counter(outfit.get("season") for outfit in matches)),
+        "category": dict(Counter(outfit.get("category") for outfit in matches)),
+    }
+    if season:
+        matches = [outfit for outfit in matches if outfit.get("season") == season]
+    if category:
+        matches = [outfit for outfit in matches if outfit.get("category") == category]
+    matches.sort(key=lambda outfit: (-scores[outfit["id"]], -(outfit.get("usage_count") or 0), outfit.get("name", "")))
+    results = [dict(outfit, score=round(scores[outfit["id"]], 3)) for outfit in matches[:max(min(limit, 100), 1)]]
+    await resolve_image_urls(results, f"{request.url.scheme}://{request.url.netloc}")
+    return OutfitSearchResponse(query=q, total=len(matches), results=results, facets=facets)
+@api_router.get("/outfits/combinations", response_model=List[OutfitCombination])
+async def get_outfit_combinations(
+    request: Request,
+    limit: int = 5,
+    temperature: Optional[float] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    index = await wardrobe_indexes.get(current_user['id'])
+    with timed("combinations"):
+        combinations = index.combination_index()
+        wardrobe_indexes.evict()
+        now = datetime.now(timezone.utc)
+        templates = LOOK_TEMPLATES + (LAYERED_LOOK_TEMPLATES if temperature is not None and temperature < COMBINATION_LAYER_BELOW_C else [])
+        looks = combinations.top_looks(score_wardrobe(index.features(now), temperature, now), index.positions, templates, max(min(limit, COMBINATION_MAX_LOOKS), 1))
+    results = []
+    for score, slots, outfit_ids in looks:
+        items = [dict(index.outfits[index.positions[outfit_id]]) for outfit_id in outfit_ids]
+        await resolve_image_urls(items, f"{request.url.scheme}://{request.url.netloc}")
+        results.append(OutfitCombination(score=round(score, 3), slots=slots, items=items))
+    return results
+@api_router.post("/outfits/duplicates/scan", response_model=DuplicateScanResponse)
+async def scan_duplicate_outfits(request: Request, max_distance: int = DUPLICATE_MAX_DISTANCE, current_user: dict = Depends(get_current_user)):
+    hashed = await backfill_image_dhashes(current_user['id'])
+    if hashed:
+        await invalidation_bus.publish("wardrobe", current_user['id'], local=True)
+    index = await wardrobe_indexes.get(current_user['id'])
+    duplicates = index.duplicate_index()
+    wardrobe_indexes.evict()
+    groups = []
+    for outfit_ids in duplicates.groups(max(min(max_distance, DUPLICATE_SEARCH_LIMIT), 0)):
+        values = [duplicates.hashes[outfit_id] for outfit_id in outfit_ids]
+        outfits = sorted((dict(index.outfits[index.positions[outfit_id]]) for outfit_id in outfit_ids), key=lambda outfit: str(outfit.get("created_at") or ""))
+        await resolve_image_urls(outfits, f"{request.url.scheme}://{request.url.netloc}")
+        groups.append(DuplicateGroup(max_distance=max(hamming_distance(a, b) for i, a in enumerate(values) for b in values[i + 1:]), outfits=outfits))
+    groups.sort(key=lambda group: (group.max_distance, -len(group.outfits)))
+    return DuplicateScanResponse(scanned=len(index), hashed=hashed, groups=groups)
+@api_router.get("/outfits/changes", response_model=OutfitChanges)
+async def get_outfit_changes(request: Request, since: int = 0, current_user: dict = Depends(get_current_user)):
+    version = await get_wardrobe_version(current_user['id'])
+    if since >= version:
+        return OutfitChanges(version=version, upserts=[], deleted=[])
+    query = {"user_id": current_user['id']}
+    if since > 0:
+        query["version"] = {"$gt": since}
+    upserts = await db.outfits.find(query, {"_id": 0}).to_list(None)
+    tombstones = await db.outfit_tombstones.find(
+        {"user_id": current_user['id'], "version": {"$gt": since}},
+        {"_id": 0, "outfit_id": 1}
+    ).to_list(None) if since > 0 else []
+    for outfit in upserts:
+        if isinstance(outfit.get('created_at'), str):
+            outfit['created_at'] = datetime.fromisoformat(outfit['created_at'])
+        if outfit.get('last_used') and isinstance(outfit['last_used'], str):
+            outfit['last_used'] = datetime.fromisoformat(outfit['last_used'])
+    await resolve_image_urls(upserts, f"{request.url.scheme}://{request.url.netloc}")
+    return OutfitChanges(version=version, upserts=upserts, deleted=[t["outfit_id"] for t in tombstones])
+@api_router.post("/outfits", response_model=OutfitCreated, status_code=status.HTTP_201_CREATED)
 async def create_outfit(
     name: str = Form(...),
     category: str = Form(...),
@@ -443,10 +2734,7 @@ async def create_outfit(
     existing_outfit = await db.outfits.find_one({"name": name, "user_id": current_user['id']})
     if existing_outfit:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"An outfit named '{name}' already exists.")
-    image_id = None
-    final_image_url = None
-    local_path = None
-    storage_type = None  
+    image_fields = {"image_url": None, "image_id": None, "local_path": None, "storage_type": None, "image_hash": None, "image_dhash": None}
     if image:
         file_ext = Path(image.filename).suffix.lower()
         if file_ext not in ALLOWED_EXTENSIONS:
@@ -455,9 +2743,7 @@ async def create_outfit(
                 detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
             )
         try:
-            content = await image.read()
-            if len(content) > MAX_FILE_SIZE:
-                raise HTTPException(status_code=400, detail="File too large")
+            content = await read_upload_limited(image)
             if not await validate_image(content):
                 raise HTTPException(status_code=400, detail="Invalid image file")
             format_map = {
@@ -465,48 +2751,57 @@ async def create_outfit(
                 ".gif": "GIF", ".webp": "WEBP"
             }
             pillow_format = format_map.get(file_ext, "JPEG")
-            compressed_content = await compress_image(content, file_format=pillow_format)
-            try:
-                from io import BytesIO
-                gridfs_stream = BytesIO(compressed_content)
-                file_id = await gridfs_bucket.upload_from_stream(image.filename, gridfs_stream)
-                image_id = str(file_id)
-                final_image_url = f"/api/images/{image_id}"
-                storage_type = "gridfs"
-            except Exception as e:
-                print(f"GridFS upload failed, saving locally instead: {e}")
-                unique_id = str(uuid.uuid4())
-                filename = f"{unique_id}{file_ext}"
-                file_path = UPLOAD_DIR / filename
-                async with aiofiles.open(file_path, 'wb') as f:
-                    await f.write(compressed_content)
-                final_image_url = f"/uploads/{filename}"
-                local_path = str(file_path)
-                storage_type = "local"
+            compressed_content, dhash = await compress_image_with_hash(content, file_format=pillow_format)
+            blob = await store_image_blob(compressed_content, file_ext, dhash)
+            image_fields = image_fields_from_blob(blob)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
     else:
-        final_image_url = image_url
-        storage_type = "url" if image_url else None
+        image_fields["image_url"] = image_url
+        image_fields["storage_type"] = "url" if image_url else None
     outfit = Outfit(
         user_id=current_user['id'],
         name=name,
         category=category,
         season=season,
         color=color,
-        image_url=final_image_url
+        image_url=image_fields["image_url"]
     )
     doc = outfit.model_dump()
-    doc['image_id'] = image_id
-    doc['local_path'] = local_path
-    doc['storage_type'] = storage_type  
+    doc.update(image_fields)
     doc['created_at'] = doc['created_at'].isoformat()
     if doc.get('last_used'):
         doc['last_used'] = doc['last_used'].isoformat()
-    await db.outfits.insert_one(doc)
-    return outfit
+    possible_duplicates = await find_duplicate_hints(current_user['id'], doc.get("image_dhash"))
+    async with wardrobe_write(current_user['id']) as version:
+        doc['version'] = version
+        await db.outfits.insert_one(doc)
+    wardrobe_indexes.upsert(current_user['id'], doc)
+    return OutfitCreated(**outfit.model_dump(), possible_duplicates=possible_duplicates)
+@app.get("/signed-images/{name}")
+async def get_signed_image(name: str, expires: int, signature: str):
+    if not verify_image_signature(f"/{name}", expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired image link")
+    file_path = image_stores["local"].path_for(name)
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(
+        file_path,
+        media_type=IMAGE_CONTENT_TYPES.get(file_path.suffix.lower(), "image/jpeg"),
+        headers={"Cache-Control": f"private, max-age={SIGNED_URL_TTL_SECONDS}"}
+    )
 @api_router.get("/images/{file_id}")
 async def get_image(file_id: str):
+    blob = await find_image_blob(file_id)
+    if blob:
+        try:
+            contents = await image_stores[blob["storage_type"]].get(blob_locator(blob))
+            await touch_image_blob(blob)
+            return Response(content=contents, media_type=blob.get("content_type", "image/jpeg"))
+        except Exception as e:
+            logging.error(f"{blob['storage_type']} image retrieval failed: {e}")
     try:
         grid_out = await gridfs_bucket.open_download_stream(ObjectId(file_id))
         contents = await grid_out.read()
@@ -551,7 +2846,8 @@ async def update_outfit(
     outfit = await db.outfits.find_one({"id": outfit_id, "user_id": current_user['id']}, {"_id": 0})
     if not outfit:
         raise HTTPException(status_code=404, detail="Outfit not found")
-    final_image_url = outfit.get('image_url')
+    image_fields = {}
+    current_image_url = outfit.get('image_url')
     if image:
         file_ext = Path(image.filename).suffix.lower()
         if file_ext not in ALLOWED_EXTENSIONS:
@@ -559,13 +2855,8 @@ async def update_outfit(
                 status_code=400, 
                 detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
             )
-        unique_id = str(uuid.uuid4())
-        filename = f"{unique_id}{file_ext}"
-        file_path = UPLOAD_DIR / filename
         try:
-            content = await image.read()
-            if len(content) > MAX_FILE_SIZE:
-                raise HTTPException(status_code=400, detail="File too large")
+            content = await read_upload_limited(image)
             if not await validate_image(content):
                 raise HTTPException(status_code=400, detail="Invalid image file")
             format_map = {
@@ -573,32 +2864,35 @@ async def update_outfit(
                 ".gif": "GIF", ".webp": "WEBP"
             }
             pillow_format = format_map.get(file_ext, "JPEG")
-            compressed_content = await compress_image(content, file_format=pillow_format)
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(compressed_content)
-            final_image_url = f"/uploads/{filename}"
-            if outfit.get('image_url'):
-                old_path_str = outfit.get('image_url', '').lstrip('/uploads/')
-                if old_path_str:
-                    old_path = ROOT_DIR / "uploads" / old_path_str
-                    if old_path.exists():
-                        os.remove(old_path)
+            compressed_content, dhash = await compress_image_with_hash(content, file_format=pillow_format)
+            blob = await store_image_blob(compressed_content, file_ext, dhash)
+            image_fields = image_fields_from_blob(blob)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
-    elif image_url:
-        final_image_url = image_url
+        await release_image(outfit)
+    elif image_url and image_url != current_image_url and not (current_image_url and image_url.endswith(current_image_url)) \
+            and not (outfit.get('image_hash') and outfit['image_hash'] in image_url):
+        await release_image(outfit)
+        image_fields = {"image_url": image_url, "image_id": None, "local_path": None, "storage_type": "url", "image_hash": None, "image_dhash": None}
     update_data = {
         'name': name,
         'category': category,
         'season': season,
         'color': color,
-        'image_url': final_image_url
+        **image_fields
     }
-    await db.outfits.update_one(
-        {"id": outfit_id},
-        {"$set": update_data}
-    )
+    async with wardrobe_write(current_user['id']) as version:
+        update_data['version'] = version
+        await db.outfits.update_one(
+            {"id": outfit_id},
+            {"$set": update_data}
+        )
     updated_outfit = await db.outfits.find_one({"id": outfit_id}, {"_id": 0})
+    if name != outfit['name']:
+        await record_group_outfit_renamed(outfit_id, name)
+    wardrobe_indexes.upsert(current_user['id'], updated_outfit)
     if isinstance(updated_outfit.get('created_at'), str):
         updated_outfit['created_at'] = datetime.fromisoformat(updated_outfit['created_at'])
     if updated_outfit.get('last_used') and isinstance(updated_outfit['last_used'], str):
@@ -612,47 +2906,42 @@ async def delete_outfit(outfit_id: str, current_user: dict = Depends(get_current
     })
     if not outfit:
         raise HTTPException(status_code=404, detail="Outfit not found")
-    storage_type = outfit.get("storage_type")
-    if storage_type == "gridfs":
-        image_id = outfit.get("image_id")
-        if image_id:
-            try:
-                await gridfs_bucket.delete(ObjectId(image_id))
-                print(f"✅ Deleted image from GridFS: {image_id}")
-            except Exception as e:
-                print(f"⚠ GridFS delete failed: {e}")
-    elif storage_type == "local":
-        local_path = outfit.get("local_path")
-        if local_path:
-            try:
-                local_file = local_path.replace("\\", "/")
-                if local_file.startswith("/"):
-                    local_file = local_file[1:]
-                if os.path.exists(local_file):
-                    os.remove(local_file)
-                    print(f"✅ Deleted local image: {local_file}")
-            except Exception as e:
-                print(f"⚠ Local file delete failed: {e}")
-    await db.outfits.delete_one({"id": outfit_id})
+    async with wardrobe_write(current_user['id']) as version:
+        await db.outfit_tombstones.insert_one({
+            "user_id": current_user['id'],
+            "outfit_id": outfit_id,
+            "version": version,
+            "deleted_at": datetime.now(timezone.utc).isoformat()
+        })
+        await db.outfits.delete_one({"id": outfit_id})
+    wardrobe_indexes.remove(current_user['id'], outfit_id)
+    await record_group_outfit_removed(outfit_id)
+    await release_image(outfit)
     return {"message": f"Outfit '{outfit.get('name')}' deleted successfully."}
 @api_router.post("/outfits/{outfit_id}/use")
 async def use_outfit(outfit_id: str, current_user: dict = Depends(get_current_user)):
     outfit = await db.outfits.find_one({"id": outfit_id, "user_id": current_user['id']}, {"_id": 0})
     if not outfit:
         raise HTTPException(status_code=404, detail="Outfit not found")
-    await db.outfits.update_one(
-        {"id": outfit_id},
-        {
-            "$inc": {"usage_count": 1},
-            "$set": {"last_used": datetime.now(timezone.utc).isoformat()}
-        }
-    )
+    used_at = datetime.now(timezone.utc)
+    async with wardrobe_write(current_user['id'], candidates_changed=False) as version:
+        await db.outfits.update_one(
+            {"id": outfit_id},
+            {
+                "$inc": {"usage_count": 1},
+                "$set": {"last_used": used_at.isoformat(), "version": version}
+            }
+        )
+    wardrobe_indexes.record_use(current_user['id'], outfit_id, used_at)
     return {"message": "Outfit usage recorded"}
 @api_router.get("/outfits/stats", response_model=OutfitStats)
 async def get_outfit_stats(current_user: dict = Depends(get_current_user)):
-    outfits = await db.outfits.find({"user_id": current_user['id']}, {"_id": 0}).to_list(1000)
-    sorted_outfits = sorted(outfits, key=lambda x: x.get('usage_count', 0), reverse=True)
-    return OutfitStats(most_used=sorted_outfits[:5], least_used=sorted_outfits[-5:])
+    index = await wardrobe_indexes.get(current_user['id'])
+    order = index.usage_order()
+    return OutfitStats(
+        most_used=[index.outfits[i] for i in order[:5]],
+        least_used=[index.outfits[i] for i in order[-5:]]
+    )
 @api_router.post("/outfits/{outfit_id}/share", response_model=ShareResponse)
 async def share_outfit(outfit_id: str, current_user: dict = Depends(get_current_user)):
     outfit = await db.outfits.find_one({"id": outfit_id, "user_id": current_user['id']}, {"_id": 0})
@@ -683,16 +2972,14 @@ async def get_shared_outfit(share_token: str, request: Request):
     if not outfit:
         raise HTTPException(status_code=404, detail="Outfit not found")
     api_base_url = f"{request.url.scheme}://{request.url.netloc}"
-    image_url = outfit.get('image_url')
-    if image_url and not image_url.startswith(('http://', 'https://')):
-        image_url = f"{api_base_url}{image_url}"
+    await resolve_image_urls([outfit], api_base_url)
     public_outfit = PublicOutfitView(
         id=outfit['id'],
         name=outfit['name'],
         category=outfit['category'],
         season=outfit['season'],
         color=outfit['color'],
-        image_url=image_url,
+        image_url=outfit.get('image_url'),
         created_at=datetime.fromisoformat(outfit['created_at'])
     )
     return public_outfit
@@ -731,8 +3018,14 @@ async def add_shared_outfit_to_wardrobe(
         image_url=original_outfit.get('image_url')
     )
     doc = new_outfit.model_dump()
+    for field in ("image_id", "local_path", "storage_type", "image_hash", "image_dhash"):
+        doc[field] = original_outfit.get(field)
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.outfits.insert_one(doc)
+    await retain_image(doc)
+    async with wardrobe_write(current_user['id']) as version:
+        doc['version'] = version
+        await db.outfits.insert_one(doc)
+    wardrobe_indexes.upsert(current_user['id'], doc)
     return new_outfit
 @api_router.post("/groups/create", response_model=GroupResponse)
 async def create_group(
@@ -748,6 +3041,9 @@ async def create_group(
     doc = group.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.groups.insert_one(doc)
+    stats = empty_group_stats(doc)
+    stats["reconciled_at"] = stats["updated_at"]
+    await db.group_stats.insert_one(stats)
     creator = await db.users.find_one({"id": current_user['id']}, {"_id": 0, "password_hash": 0})
     return GroupResponse(
         id=group.id,
@@ -765,6 +3061,20 @@ async def get_user_groups(current_user: dict = Depends(get_current_user)):
     groups = await groups_cursor.to_list(1000)
     result = []
     for group in groups:
+        if FAST_JSON_RESPONSES:
+            creator = await db.users.find_one({"id": group['creator_id']}, {"_id": 0, "username": 1})
+            result.append({
+                "id": group['id'],
+                "name": group['name'],
+                "description": group.get('description'),
+                "creator_id": group['creator_id'],
+                "creator_name": creator['username'],
+                "members_count": len(group['members']),
+                "invite_code": group['invite_code'],
+                "created_at": utc_z(group['created_at']),
+                "is_member": True
+            })
+            continue
         if isinstance(group.get('created_at'), str):
             group['created_at'] = datetime.fromisoformat(group['created_at'])
         creator = await db.users.find_one({"id": group['creator_id']}, {"_id": 0, "password_hash": 0})
@@ -778,6 +3088,8 @@ async def get_user_groups(current_user: dict = Depends(get_current_user)):
             invite_code=group['invite_code'],
             created_at=group['created_at']
         ))
+    if FAST_JSON_RESPONSES:
+        return fast_json_response(result)
     return result
 @api_router.get("/groups/{group_id}", response_model=GroupDetail)
 async def get_group_details(group_id: str, request: Request, current_user: dict = Depends(get_current_user)):
@@ -800,6 +3112,7 @@ async def get_group_details(group_id: str, request: Request, current_user: dict
                 "profile_pic_url": member.get('profile_pic_url')
             })
     shared_outfits = []
+    group_outfits = []
     shared_outfits_cursor = db.shared_outfits_to_group.find({"group_id": group_id}, {"_id": 0})
     shared_outfits_list = await shared_outfits_cursor.to_list(1000)
     api_base_url = f"{request.url.scheme}://{request.url.netloc}"
@@ -822,16 +3135,14 @@ async def get_group_details(group_id: str, request: Request, current_user: dict
             outfit['created_at'] = datetime.fromisoformat(outfit['created_at'])
         if isinstance(shared_outfit.get('shared_at'), str):
             shared_outfit['shared_at'] = datetime.fromisoformat(shared_outfit['shared_at'])
-        image_url = outfit.get('image_url')
-        if image_url and not image_url.startswith(('http://', 'https://')):
-            image_url = f"{api_base_url}{image_url}"
+        group_outfits.append(outfit)
         shared_outfits.append({
             "id": outfit['id'],
             "name": outfit['name'],
             "category": outfit['category'],
             "season": outfit['season'],
             "color": outfit['color'],
-            "image_url": image_url,
+            "image_url": None,
             "shared_by": {
                 "id": sharer['id'],
                 "username": sharer['username']
@@ -841,6 +3152,22 @@ async def get_group_details(group_id: str, request: Request, current_user: dict
             "average_rating": round(avg_rating, 1),
             "user_rating": user_rating
         })
+    await resolve_image_urls(group_outfits, api_base_url)
+    for entry, outfit in zip(shared_outfits, group_outfits):
+        entry["image_url"] = outfit.get("image_url")
+    if FAST_JSON_RESPONSES:
+        return fast_json_response({
+            "id": group['id'],
+            "name": group['name'],
+            "description": group.get('description'),
+            "creator_id": group['creator_id'],
+            "creator_name": creator['username'],
+            "members": members,
+            "shared_outfits": shared_outfits,
+            "invite_code": group['invite_code'],
+            "created_at": group['created_at'],
+            "is_member": True
+        })
     return GroupDetail(
         id=group['id'],
         name=group['name'],
@@ -852,6 +3179,17 @@ async def get_group_details(group_id: str, request: Request, current_user: dict
         invite_code=group['invite_code'],
         created_at=group['created_at']
     )
+@api_router.get("/groups/{group_id}/stats", response_model=GroupStats)
+async def get_group_stats(group_id: str, current_user: dict = Depends(get_current_user)):
+    stats = await db.group_stats.find_one({"group_id": group_id}, {"_id": 0})
+    if stats is None or current_user['id'] not in stats.get("members", []):
+        group = await db.groups.find_one({"id": group_id}, {"_id": 0, "members": 1})
+        if not group:
+            raise HTTPException(status_code=404, detail="Group not found")
+        if current_user['id'] not in group['members']:
+            raise HTTPException(status_code=403, detail="You are not a member of this group")
+        stats = await reconcile_group_stats(group_id)
+    return group_stats_response(stats)
 @api_router.post("/groups/join")
 async def join_group(
     join_data: JoinGroupRequest,
@@ -866,6 +3204,8 @@ async def join_group(
         {"id": group['id']},
         {"$push": {"members": current_user['id']}}
     )
+    await update_group_stats(group['id'], {"$addToSet": {"members": current_user['id']}})
+    await invalidation_bus.publish("group", group['id'], local=True)
     return {"message": "Successfully joined the group"}
 @api_router.post("/groups/{group_id}/share")
 async def share_outfit_to_group(
@@ -895,6 +3235,7 @@ async def share_outfit_to_group(
     doc = shared_outfit.model_dump()
     doc['shared_at'] = doc['shared_at'].isoformat()
     await db.shared_outfits_to_group.insert_one(doc)
+    await record_group_share(group_id, outfit, current_user, shared_outfit.shared_at)
     return {"message": "Outfit shared to group successfully"}
 @api_router.post("/groups/{group_id}/outfits/{outfit_id}/rate")
 async def rate_outfit_in_group(
@@ -926,6 +3267,7 @@ async def rate_outfit_in_group(
             {"id": existing_rating['id']},
             {"$set": {"rating": rating_data.rating}}
         )
+        await record_group_rating(group_id, outfit_id, rating_data.rating, existing_rating['rating'])
         message = "Rating updated successfully"
     else:
         rating = OutfitRating(
@@ -937,6 +3279,7 @@ async def rate_outfit_in_group(
         doc = rating.model_dump()
         doc['rated_at'] = doc['rated_at'].isoformat()
         await db.outfit_ratings.insert_one(doc)
+        await record_group_rating(group_id, outfit_id, rating_data.rating)
         message = "Rating submitted successfully"
     ratings_cursor = db.outfit_ratings.find({"group_id": group_id, "outfit_id": outfit_id}, {"_id": 0})
     ratings = await ratings_cursor.to_list(1000)
@@ -946,101 +3289,331 @@ async def rate_outfit_in_group(
         "average_rating": round(avg_rating, 1),
         "ratings_count": len(ratings)
     }
-@api_router.post("/suggestions/ai", response_model=SuggestionResponse)
-async def get_ai_suggestions(current_user: dict = Depends(get_current_user)):
+async def ai_suggestion_response(outfits: List[dict], features: Dict[str, np.ndarray]) -> SuggestionResponse:
+    prompt, least_used, prompt_stats = build_wardrobe_prompt(
+        outfits,
+        features,
+        intro="These are the least-worn items in my wardrobe:\n",
+        instructions='Suggest up to 4 fresh ways to wear these items. Reply with a JSON object of the form '
+                     '{"suggestions": [{"outfit_name": "<name of one of the items above>", "styling_tip": "<one or two sentences>", '
+                     '"occasion": "<where to wear it>", "complementary_items": ["<other item names from the list>"]}]}',
+        describe=lambda o: f"- {o['name']} ({o['category']}, {o['color']}, {o['season']} season, used {o.get('usage_count', 0)} times)",
+        max_items=10
+    )
+    if not least_used:
+        return SuggestionResponse(suggestions=[], reasoning="Could not find least-worn outfits to base suggestions on.")
+    logging.info(f"[/suggestions/ai] prompt stats: {prompt_stats}")
+    api_key = os.environ.get("OPENROUTER_API_KEY")
+    if not api_key:
+        logging.error("OPENROUTER_API_KEY environment variable is not set!")
+        fallback = recommend_outfits(outfits, limit=4, features=features)
+        return SuggestionResponse(
+            suggestions=fallback,
+            reasoning="AI service is not configured. Showing quick suggestions for your least-worn items."
+        )
     try:
-        outfits = await db.outfits.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(1000)
-        if not outfits:
-            return SuggestionResponse(suggestions=[], reasoning="No outfits found in your wardrobe.")
-        least_used = sorted(outfits, key=lambda x: x.get('usage_count', 0))[:10]
-        if not least_used:
-            return SuggestionResponse(suggestions=[], reasoning="Could not find least-worn outfits to base suggestions on.")
-        outfit_list = "\n".join([
-            f"- {o['name']} ({o['category']}, {o['color']}, {o['season']} season, used {o.get('usage_count', 0)} times)"
-            for o in least_used
-        ])
-        prompt = f
-        api_key = os.environ.get("OPENROUTER_API_KEY")
-        if not api_key:
-            logging.error("OPENROUTER_API_KEY environment variable is not set!")
-            fallback = [
-                {
-                    "outfit_name": o["name"],
-                    "styling_tip": "Try pairing it with different accessories or layering it.",
-                    "occasion": "Daily wear",
-                    "complementary_items": []
-                }
-                for o in least_used[:4]
-            ]
+        response = await llm_chat_completion(
+            api_key,
+            messages=[
+                {"role": "system", "content": "You are a helpful fashion stylist that always replies in valid JSON. Do not include any text before or after the JSON."},
+                {"role": "user", "content": prompt},
+            ],
+            response_format={"type": "json_object"},
+        )
+        reply_text = response.choices[0].message.content
+        logging.info(f"Received raw response from AI: {reply_text}")
+        if response.usage:
+            prompt_stats["llm_prompt_tokens"] = response.usage.prompt_tokens
+        try:
+            ai_data = json.loads(reply_text)
+            final_suggestions = []
+            if isinstance(ai_data, dict):
+                suggestions_list = ai_data.get("suggestions") or ai_data.get("data") or ai_data.get("results")
+                if isinstance(suggestions_list, list):
+                    final_suggestions = suggestions_list
+            elif isinstance(ai_data, list):
+                final_suggestions = ai_data
+            if final_suggestions:
+                final_suggestions = final_suggestions[:4]
+            if not final_suggestions:
+                logging.warning(f"AI returned a response, but no suggestions could be extracted. Response: {ai_data}")
+                raise ValueError("AI response did not contain a valid list of suggestions.")
             return SuggestionResponse(
-                suggestions=fallback,
-                reasoning="AI service is not configured. Showing basic suggestions for your least-worn items."
+                suggestions=final_suggestions,
+                reasoning="AI-powered styling suggestions based on your least-worn outfits.",
+                prompt_stats=prompt_stats
             )
-        try:
-            client_ai = AsyncOpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=api_key,
+        except json.JSONDecodeError as json_err:
+            logging.error(f"Failed to parse AI response as JSON. Error: {json_err}")
+            logging.error(f"Raw text that failed to parse: {reply_text}")
+            fallback = recommend_outfits(outfits, limit=4, features=features)
+            return SuggestionResponse(
+                suggestions=fallback,
+                reasoning="AI service returned an invalid response. Showing quick suggestions for your least-worn items."
             )
-            response = await client_ai.chat.completions.create(
-                model="z-ai/glm-4.5-air:free",
-                messages=[
-                    {"role": "system", "content": "You are a helpful fashion stylist that always replies in valid JSON. Do not include any text before or after the JSON."},
-                    {"role": "user", "content": prompt},
-                ],
-                response_format={"type": "json_object"},
+    except Exception as ai_error:
+        err_msg = str(ai_error)
+        logging.error(f"AI SERVICE FAILED: {err_msg}\n{traceback.format_exc()}")
+        fallback = recommend_outfits(outfits, limit=4, features=features)
+        return SuggestionResponse(
+            suggestions=fallback,
+            reasoning=f"AI service is currently unavailable: {err_msg}. Showing quick suggestions for your least-worn items."
+        )
+async def lookup_weather(lat: Optional[float], lon: Optional[float]) -> tuple:
+    temp = 20
+    weather_desc = "clear sky"
+    location_name = "Your Location"
+    try:
+        if lat and lon:
+            weather_url = f"{WEATHER_API_URL}?latitude={lat}&longitude={lon}&current_weather=true"
+            geocode_url = f"{GEOCODE_API_URL}?lat={lat}&lon={lon}"
+            weather_data, geocode_data = await asyncio.gather(
+                upstreams["weather"].call(fetch_json, weather_url),
+                upstreams["geocode"].call(fetch_json, geocode_url),
+                return_exceptions=True
             )
-            reply_text = response.choices[0].message.content
-            logging.info(f"Received raw response from AI: {reply_text}")
-            try:
-                ai_data = json.loads(reply_text)
-                final_suggestions = []
-                if isinstance(ai_data, dict):
-                    suggestions_list = ai_data.get("suggestions") or ai_data.get("data") or ai_data.get("results")
-                    if isinstance(suggestions_list, list):
-                        final_suggestions = suggestions_list
-                elif isinstance(ai_data, list):
-                    final_suggestions = ai_data
-                if final_suggestions:
-                    final_suggestions = final_suggestions[:4]
-                if not final_suggestions:
-                    logging.warning(f"AI returned a response, but no suggestions could be extracted. Response: {ai_data}")
-                    raise ValueError("AI response did not contain a valid list of suggestions.")
-                return SuggestionResponse(
-                    suggestions=final_suggestions,
-                    reasoning="AI-powered styling suggestions based on your least-worn outfits."
-                )
-            except json.JSONDecodeError as json_err:
-                logging.error(f"Failed to parse AI response as JSON. Error: {json_err}")
-                logging.error(f"Raw text that failed to parse: {reply_text}")
-                fallback = [
-                    {
-                        "outfit_name": o["name"],
-                        "styling_tip": "Try pairing it with different accessories or layering it.",
-                        "occasion": "Daily wear",
-                        "complementary_items": []
-                    }
-                    for o in least_used[:4]
-                ]
-                return SuggestionResponse(
-                    suggestions=fallback,
-                    reasoning="AI service returned an invalid response. Showing basic suggestions for your least-worn items."
-                )
-        except Exception as ai_error:
-            err_msg = str(ai_error)
-            logging.error(f"AI SERVICE FAILED: {err_msg}\n{traceback.format_exc()}")
-            fallback = [
-                {
-                    "outfit_name": o["name"],
-                    "styling_tip": "Try pairing it with different accessories or layering it.",
-                    "occasion": "Daily wear",
-                    "complementary_items": []
-                }
-                for o in least_used[:4]
-            ]
+            if isinstance(geocode_data, Exception):
+                location_name = f"Lat: {lat:.2f}, Lon: {lon:.2f}"
+            else:
+                city = geocode_data.get('address', {}).get('city') or geocode_data.get('address', {}).get('town') or geocode_data.get('address', {}).get('state', 'Your Location')
+                location_name = city
+            if isinstance(weather_data, Exception):
+                raise weather_data
+            current = weather_data.get('current_weather', {})
+            temp = current.get('temperature', 20)
+            weather_code = current.get('weathercode', 0)
+            weather_descriptions = {
+                0: "clear sky", 1: "mainly clear", 2: "partly cloudy", 3: "overcast",
+                45: "foggy", 48: "foggy", 51: "light drizzle", 53: "drizzle", 55: "heavy drizzle",
+                61: "light rain", 63: "rain", 65: "heavy rain", 71: "light snow", 73: "snow", 75: "heavy snow",
+                77: "snow grains", 80: "light showers", 81: "showers", 82: "heavy showers",
+                85: "light snow showers", 86: "snow showers", 95: "thunderstorm", 96: "thunderstorm with hail", 99: "heavy thunderstorm"
+            }
+            weather_desc = weather_descriptions.get(weather_code, "clear")
+    except Exception as e:
+        logging.warning(f"Could not fetch weather data: {e}. Using default weather.")
+    return temp, weather_desc, location_name
+async def weather_suggestion_response(all_outfits: List[dict], features: Dict[str, np.ndarray], temp: float, weather_desc: str, location_name: str) -> SuggestionResponse:
+    prompt, _, prompt_stats = build_wardrobe_prompt(
+        all_outfits,
+        features,
+        intro=f"The weather in {location_name} is {temp}°C with {weather_desc}. These items in my wardrobe suit it:\n",
+        instructions='Pick the 3 items best suited to this weather, best first. Reply with a JSON object of the form '
+                     '{"suggestions": [{"outfit_name": "<name of one of the items above>", "styling_tip": "<one or two sentences>", '
+                     '"occasion": "<where to wear it>", "recommendation_level": "mostly recommended | recommended | least recommended", '
+                     '"complementary_items": ["<other item names from the list>"]}]}',
+        describe=lambda o: f"- {o['name']} ({o['category']}, {o['color']}, {o['season']} season)",
+        temperature=temp
+    )
+    logging.info(f"[/suggestions/weather] prompt stats: {prompt_stats}")
+    api_key = os.environ.get("OPENROUTER_API_KEY")
+    if not api_key:
+        logging.error("OPENROUTER_API_KEY environment variable is not set!")
+        return SuggestionResponse(
+            suggestions=local_weather_suggestions(all_outfits, temp, weather_desc, features), 
+            reasoning=f"Weather in {location_name}: {temp}°C, {weather_desc}. AI service is not configured."
+        )
+    try:
+        response = await llm_chat_completion(
+            api_key,
+            messages=[
+                {"role": "system", "content": "You are a helpful fashion stylist assistant that always replies in valid JSON. Do not include any text before or after the JSON."},
+                {"role": "user", "content": prompt},
+            ],
+            response_format={"type": "json_object"},
+        )
+        reply_text = response.choices[0].message.content
+        if response.usage:
+            prompt_stats["llm_prompt_tokens"] = response.usage.prompt_tokens
+        ai_data = json.loads(reply_text)
+        final_suggestions = []
+        if isinstance(ai_data, dict):
+            suggestions_list = ai_data.get("suggestions") or ai_data.get("data") or ai_data.get("results")
+            if isinstance(suggestions_list, list):
+                for suggestion in suggestions_list:
+                    suggestion['reason'] = f"Perfect for {temp}°C and {weather_desc}"
+                    if 'complementary_items' not in suggestion:
+                        suggestion['complementary_items'] = []
+                final_suggestions = suggestions_list
+        elif isinstance(ai_data, list):
+            for suggestion in ai_data:
+                suggestion['reason'] = f"Perfect for {temp}°C and {weather_desc}"
+                if 'complementary_items' not in suggestion:
+                    suggestion['complementary_items'] = []
+            final_suggestions = ai_data
+        if not final_suggestions:
+            logging.warning(f"AI returned a response, but no suggestions could be extracted. Response: {ai_data}")
+            raise ValueError("AI response did not contain a valid list of suggestions.")
+        return SuggestionResponse(
+            suggestions=final_suggestions,
+            reasoning=f"Weather in {location_name}: {temp}°C, {weather_desc}",
+            prompt_stats=prompt_stats
+        )
+    except (lazy_import("openai").RateLimitError, UpstreamRateLimitError) as e:
+        logging.error(f"[/suggestions/weather] RATE LIMIT EXCEEDED: {e}")
+        return SuggestionResponse(
+            suggestions=local_weather_suggestions(all_outfits, temp, weather_desc, features), 
+            reasoning="You've reached the free daily limit for AI suggestions. Please try again tomorrow or add credits to your account."
+        )
+    except Exception as ai_error:
+        err_msg = str(ai_error)
+        logging.error(f"[/suggestions/weather] AI SERVICE FAILED: {err_msg}\n{traceback.format_exc()}")
+        return SuggestionResponse(
+            suggestions=local_weather_suggestions(all_outfits, temp, weather_desc, features),
+            reasoning=f"Weather in {location_name}: {temp}°C, {weather_desc}. AI service is currently unavailable."
+        )
+def suggestion_cell(lat: float, lon: float) -> str:
+    size = SUGGESTION_GRID_DEGREES
+    return f"{(math.floor(lat / size) + 0.5) * size:.4f},{(math.floor(lon / size) + 0.5) * size:.4f}"
+async def remember_suggestion_activity(user_id: str, lat: Optional[float] = None, lon: Optional[float] = None):
+    today = datetime.now(timezone.utc).date().isoformat()
+    query: Dict[str, Any] = {"id": user_id, "last_active_date": {"$ne": today}}
+    update = {"last_active_date": today}
+    if lat and lon:
+        update["suggestion_cell"] = suggestion_cell(lat, lon)
+        query = {"id": user_id, "$or": [{"last_active_date": {"$ne": today}}, {"suggestion_cell": {"$ne": update["suggestion_cell"]}}]}
+    await db.users.update_one(query, {"$set": update})
+async def find_precomputed_suggestions(user_id: str, kind: str, lat: Optional[float] = None, lon: Optional[float] = None) -> Optional[SuggestionResponse]:
+    doc = await db.daily_suggestions.find_one(
+        {"user_id": user_id, "date": datetime.now(timezone.utc).date().isoformat()},
+        {"_id": 0, kind: 1, "cell": 1}
+    )
+    hit = doc is not None and doc.get(kind) is not None and (not (lat and lon) or doc.get("cell") == suggestion_cell(lat, lon))
+    metrics.inc("cache_requests_total", (("cache", "daily_suggestions"), ("result", "hit" if hit else "miss")))
+    return SuggestionResponse(**doc[kind]) if hit else None
+async def wait_for_llm_budget() -> bool:
+    while True:
+        waits = []
+        for bucket in llm_buckets:
+            needed = bucket.capacity * SUGGESTION_PRECOMPUTE_LLM_RESERVE + 1
+            if needed > bucket.capacity:
+                return False
+            waits.append(bucket.retry_after(needed))
+        wait = max(waits)
+        if wait <= 0:
+            return True
+        if wait > SUGGESTION_PRECOMPUTE_MAX_WAIT_SECONDS:
+            return False
+        await asyncio.sleep(wait)
+async def acquire_job_lease(name: str, ttl_seconds: int) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        await db.job_leases.update_one(
+            {"_id": name, "$or": [{"owner": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+async def precompute_user_suggestions(user_id: str, today: str, cell: Optional[str], weather: Optional[tuple]) -> int:
+    outfits = await db.outfits.find({"user_id": user_id}, {"_id": 0}).to_list(WARDROBE_INDEX_LOAD_LIMIT)
+    if not outfits:
+        return 0
+    features = WardrobeIndex(outfits).features()
+    doc: Dict[str, Any] = {"ai": None, "weather": None}
+    llm_calls = 0
+    if await wait_for_llm_budget():
+        result = await ai_suggestion_response(outfits, features)
+        llm_calls += 1
+        if result.prompt_stats is not None:
+            doc["ai"] = result.model_dump()
+    if weather is not None and await wait_for_llm_budget():
+        result = await weather_suggestion_response(outfits, features, *weather)
+        llm_calls += 1
+        if result.prompt_stats is not None:
+            doc["weather"] = result.model_dump()
+    if doc["ai"] is None and doc["weather"] is None:
+        return llm_calls
+    now = datetime.now(timezone.utc)
+    doc.update({"user_id": user_id, "date": today, "cell": cell, "created_at": now, "expires_at": now + timedelta(days=1)})
+    await db.daily_suggestions.replace_one({"user_id": user_id, "date": today}, doc, upsert=True)
+    precompute_status["stored"] += 1
+    return llm_calls
+async def run_suggestion_precompute() -> Dict[str, Any]:
+    if precompute_status.get("running"):
+        return precompute_status
+    now = datetime.now(timezone.utc)
+    today = now.date().isoformat()
+    precompute_status.clear()
+    precompute_status.update({
+        "running": True,
+        "date": today,
+        "started_at": now.isoformat(),
+        "finished_at": None,
+        "users": 0,
+        "cells": 0,
+        "llm_calls": 0,
+        "stored": 0,
+        "skipped_budget": False,
+        "skipped_lease": False,
+        "error": None
+    })
+    try:
+        if not await acquire_job_lease(f"precompute:{today}", SUGGESTION_PRECOMPUTE_LEASE_SECONDS):
+            precompute_status["skipped_lease"] = True
+            logging.info(f"Suggestion precompute for {today} is running on another worker, skipping")
+            return precompute_status
+        active_since = (now - timedelta(days=SUGGESTION_PRECOMPUTE_ACTIVE_DAYS)).date().isoformat()
+        done = {doc["user_id"] async for doc in db.daily_suggestions.find({"date": today}, {"_id": 0, "user_id": 1})}
+        cells: Dict[Optional[str], List[str]] = defaultdict(list)
+        async for user in db.users.find({"last_active_date": {"$gte": active_since}}, {"_id": 0, "id": 1, "suggestion_cell": 1}):
+            if user["id"] not in done:
+                cells[user.get("suggestion_cell")].append(user["id"])
+        precompute_status["users"] = sum(len(user_ids) for user_ids in cells.values())
+        precompute_status["cells"] = len(cells)
+        for cell, user_ids in cells.items():
+            weather = None
+            if cell is not None:
+                lat, lon = (float(part) for part in cell.split(","))
+                weather = await lookup_weather(lat, lon)
+            for user_id in user_ids:
+                if not await wait_for_llm_budget():
+                    precompute_status["skipped_budget"] = True
+                    break
+                if not await acquire_job_lease(f"precompute:{today}", SUGGESTION_PRECOMPUTE_LEASE_SECONDS):
+                    precompute_status["skipped_lease"] = True
+                    break
+                if not await acquire_job_lease(f"precompute:{today}:{user_id}", 86400):
+                    continue
+                precompute_status["llm_calls"] += await precompute_user_suggestions(user_id, today, cell, weather)
+            if precompute_status["skipped_budget"] or precompute_status["skipped_lease"]:
+                break
+        logging.info(f"Suggestion precompute finished: {precompute_status['stored']}/{precompute_status['users']} users across {precompute_status['cells']} cells, {precompute_status['llm_calls']} LLM calls")
+    except Exception as e:
+        logging.error(f"Suggestion precompute failed: {e}\n{traceback.format_exc()}")
+        precompute_status["error"] = str(e)
+    finally:
+        precompute_status["running"] = False
+        precompute_status["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return precompute_status
+async def suggestion_precompute_scheduler():
+    while True:
+        now = datetime.now(timezone.utc)
+        next_run = now.replace(hour=SUGGESTION_PRECOMPUTE_HOUR, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        await run_suggestion_precompute()
+@api_router.post("/suggestions/ai", response_model=SuggestionResponse)
+async def get_ai_suggestions(fast: bool = False, current_user: dict = Depends(get_current_user)):
+    try:
+        await remember_suggestion_activity(current_user["id"])
+        if not fast:
+            precomputed = await find_precomputed_suggestions(current_user["id"], "ai")
+            if precomputed is not None:
+                return precomputed
+        index = await wardrobe_indexes.get(current_user["id"])
+        outfits = index.outfits
+        if not outfits:
+            return SuggestionResponse(suggestions=[], reasoning="No outfits found in your wardrobe.")
+        features = index.features()
+        if fast:
             return SuggestionResponse(
-                suggestions=fallback,
-                reasoning=f"AI service is currently unavailable: {err_msg}. Showing basic suggestions for your least-worn items."
+                suggestions=recommend_outfits(outfits, limit=4, features=features),
+                reasoning="Quick suggestions for your least-worn outfits based on color harmony and season."
             )
+        return await ai_suggestion_response(outfits, features)
     except Exception as e:
         logging.error(f"Top-level server error in get_ai_suggestions: {e}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="An internal server error occurred while fetching suggestions.")
@@ -1048,135 +3621,84 @@ async def get_ai_suggestions(current_user: dict = Depends(get_current_user)):
 async def get_ai_weather_suggestions(
     lat: Optional[float] = None,
     lon: Optional[float] = None,
+    fast: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        all_outfits = await db.outfits.find({"user_id": current_user['id']}, {"_id": 0}).to_list(50)
+        await remember_suggestion_activity(current_user['id'], lat, lon)
+        if not fast:
+            precomputed = await find_precomputed_suggestions(current_user['id'], "weather", lat, lon)
+            if precomputed is not None:
+                return precomputed
+        index = await wardrobe_indexes.get(current_user['id'])
+        all_outfits = index.outfits
         if not all_outfits:
             return SuggestionResponse(suggestions=[], reasoning="No outfits found in your wardrobe.")
-        temp = 20
-        weather_desc = "clear sky"
-        location_name = "Your Location"
-        try:
-            async with httpx.AsyncClient() as client:
-                if lat and lon:
-                    weather_url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current_weather=true"
-                    weather_response = await client.get(weather_url)
-                    weather_data = weather_response.json()
-                    geocode_url = f"https://geocode.maps.co/reverse?lat={lat}&lon={lon}"
-                    try:
-                        geocode_response = await client.get(geocode_url)
-                        geocode_data = geocode_response.json()
-                        city = geocode_data.get('address', {}).get('city') or geocode_data.get('address', {}).get('town') or geocode_data.get('address', {}).get('state', 'Your Location')
-                        location_name = city
-                    except:
-                        location_name = f"Lat: {lat:.2f}, Lon: {lon:.2f}"
-                    current = weather_data.get('current_weather', {})
-                    temp = current.get('temperature', 20)
-                    weather_code = current.get('weathercode', 0)
-                    weather_descriptions = {
-                        0: "clear sky", 1: "mainly clear", 2: "partly cloudy", 3: "overcast",
-                        45: "foggy", 48: "foggy", 51: "light drizzle", 53: "drizzle", 55: "heavy drizzle",
-                        61: "light rain", 63: "rain", 65: "heavy rain", 71: "light snow", 73: "snow", 75: "heavy snow",
-                        77: "snow grains", 80: "light showers", 81: "showers", 82: "heavy showers",
-                        85: "light snow showers", 86: "snow showers", 95: "thunderstorm", 96: "thunderstorm with hail", 99: "heavy thunderstorm"
-                    }
-                    weather_desc = weather_descriptions.get(weather_code, "clear")
-        except Exception as e:
-            logging.warning(f"Could not fetch weather data: {e}. Using default weather.")
-        outfit_list = "\n".join([f"- {o['name']} ({o['category']}, {o['color']}, {o['season']} season)" for o in all_outfits])
-        prompt = f
-        api_key = os.environ.get("OPENROUTER_API_KEY")
-        if not api_key:
-            logging.error("OPENROUTER_API_KEY environment variable is not set!")
-            if temp < 10: season_filter = ['winter', 'fall', 'all']
-            elif temp < 20: season_filter = ['fall', 'spring', 'all']
-            else: season_filter = ['summer', 'spring', 'all']
-            fallback_outfits = [o for o in all_outfits if o.get('season', 'all') in season_filter][:3]
-            fallback_suggestions = []
-            for i, o in enumerate(fallback_outfits):
-                rec_level = "mostly recommended" if i == 0 else ("recommended" if i == 1 else "least recommended")
-                fallback_suggestions.append({
-                    "outfit_name": o['name'], 
-                    "styling_tip": "A good choice for the current weather.", 
-                    "occasion": "Daily wear", 
-                    "recommendation_level": rec_level,
-                    "complementary_items": []
-                })
-            return SuggestionResponse(
-                suggestions=fallback_suggestions, 
-                reasoning=f"Weather in {location_name}: {temp}°C, {weather_desc}. AI service is not configured."
-            )
-        try:
-            client_ai = AsyncOpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key)
-            response = await client_ai.chat.completions.create(
-                model="z-ai/glm-4.5-air:free",
-                messages=[
-                    {"role": "system", "content": "You are a helpful fashion stylist assistant that always replies in valid JSON. Do not include any text before or after the JSON."},
-                    {"role": "user", "content": prompt},
-                ],
-                response_format={"type": "json_object"},
-            )
-            reply_text = response.choices[0].message.content
-            ai_data = json.loads(reply_text)
-            final_suggestions = []
-            if isinstance(ai_data, dict):
-                suggestions_list = ai_data.get("suggestions") or ai_data.get("data") or ai_data.get("results")
-                if isinstance(suggestions_list, list):
-                    for suggestion in suggestions_list:
-                        suggestion['reason'] = f"Perfect for {temp}°C and {weather_desc}"
-                        if 'complementary_items' not in suggestion:
-                            suggestion['complementary_items'] = []
-                    final_suggestions = suggestions_list
-            elif isinstance(ai_data, list):
-                for suggestion in ai_data:
-                    suggestion['reason'] = f"Perfect for {temp}°C and {weather_desc}"
-                    if 'complementary_items' not in suggestion:
-                        suggestion['complementary_items'] = []
-                final_suggestions = ai_data
-            if not final_suggestions:
-                logging.warning(f"AI returned a response, but no suggestions could be extracted. Response: {ai_data}")
-                raise ValueError("AI response did not contain a valid list of suggestions.")
+        features = index.features()
+        temp, weather_desc, location_name = await lookup_weather(lat, lon)
+        if fast:
             return SuggestionResponse(
-                suggestions=final_suggestions,
+                suggestions=local_weather_suggestions(all_outfits, temp, weather_desc, features),
                 reasoning=f"Weather in {location_name}: {temp}°C, {weather_desc}"
             )
-        except RateLimitError as e:
-            logging.error(f"[/suggestions/weather] RATE LIMIT EXCEEDED: {e}")
-            if temp < 10: season_filter = ['winter', 'fall', 'all']
-            elif temp < 20: season_filter = ['fall', 'spring', 'all']
-            else: season_filter = ['summer', 'spring', 'all']
-            fallback_outfits = [o for o in all_outfits if o.get('season', 'all') in season_filter][:3]
-            fallback_suggestions = []
-            for i, o in enumerate(fallback_outfits):
-                if i == 0:
-                    rec_level = "mostly recommended"
-                elif i == 1:
-                    rec_level = "recommended"
-                else:
-                    rec_level = "least recommended"
-                fallback_suggestions.append({
-                    "outfit_name": o['name'], 
-                    "styling_tip": "A good choice for the current weather.", 
-                    "occasion": "Daily wear", 
-                    "reason": f"Perfect for {temp}°C and {weather_desc}",
-                    "recommendation_level": rec_level,
-                    "complementary_items": []
-                })
-            return SuggestionResponse(
-                suggestions=fallback_suggestions, 
-                reasoning="You've reached the free daily limit for AI suggestions. Please try again tomorrow or add credits to your account."
-            )
-        except Exception as ai_error:
-            err_msg = str(ai_error)
-            logging.error(f"[/suggestions/weather] AI SERVICE FAILED: {err_msg}\n{traceback.format_exc()}")
-            return SuggestionResponse(suggestions=[], reasoning="AI service is currently unavailable.")
+        return await weather_suggestion_response(all_outfits, features, temp, weather_desc, location_name)
     except Exception as e:
         logging.error(f"Weather suggestion error: {e}")
         raise HTTPException(status_code=500, detail="An internal server error occurred.")
+@api_router.post("/admin/image-gc")
+async def trigger_image_gc(dry_run: bool = True, admin_user: dict = Depends(get_admin_user)):
+    if gc_status.get("running"):
+        raise HTTPException(status_code=409, detail="Image garbage collection is already running")
+    background_tasks[:] = [task for task in background_tasks if not task.done()]
+    background_tasks.append(asyncio.create_task(run_image_gc(dry_run=dry_run)))
+    return {"message": "Image garbage collection started", "dry_run": dry_run}
+@api_router.get("/admin/image-gc")
+async def get_image_gc_status(admin_user: dict = Depends(get_admin_user)):
+    return gc_status
+@api_router.post("/admin/suggestions/precompute")
+async def trigger_suggestion_precompute(admin_user: dict = Depends(get_admin_user)):
+    if precompute_status.get("running"):
+        raise HTTPException(status_code=409, detail="Suggestion precompute is already running")
+    background_tasks[:] = [task for task in background_tasks if not task.done()]
+    background_tasks.append(asyncio.create_task(run_suggestion_precompute()))
+    return {"message": "Suggestion precompute started"}
+@api_router.get("/admin/suggestions/precompute")
+async def get_suggestion_precompute_status(admin_user: dict = Depends(get_admin_user)):
+    return precompute_status
 @api_router.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "upstreams": {name: upstream.breaker.state for name, upstream in upstreams.items()}
+    }
+@api_router.get("/admin/profiles")
+async def list_profiles(admin_user: dict = Depends(get_admin_user)):
+    if not PROFILE_DIR.exists():
+        return []
+    names = await asyncio.to_thread(lambda: sorted((path.name for path in PROFILE_DIR.glob("*.folded")), reverse=True))
+    return names
+@api_router.get("/admin/profiles/{name}")
+async def get_profile_file(name: str, admin_user: dict = Depends(get_admin_user)):
+    path = PROFILE_DIR / Path(name).name
+    if path.suffix != ".folded" or not await asyncio.to_thread(path.exists):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain")
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    for cache in ("wardrobe_index", "user", "daily_suggestions"):
+        hits = metrics.counter_value("cache_requests_total", (("cache", cache), ("result", "hit")))
+        misses = metrics.counter_value("cache_requests_total", (("cache", cache), ("result", "miss")))
+        metrics.set("cache_hit_ratio", hits / (hits + misses) if hits + misses else 0.0, (("cache", cache),))
+    metrics.set("wardrobe_index_cache_entries", len(wardrobe_indexes.indexes))
+    metrics.set("wardrobe_index_cache_bytes", sum(index.nbytes() for index in wardrobe_indexes.indexes.values()))
+    for name, upstream in upstreams.items():
+        metrics.set("upstream_circuit_open", 1 if upstream.breaker.state == "open" else 0, (("upstream", name),))
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
 @api_router.get("/")
 async def root():
     return {"message": "Smart Wardrobe API is running"}
@@ -1189,9 +3711,79 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": "Internal server error"}
     )
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+@app.on_event("startup")
+async def initialize_services():
+    if FAST_STARTUP:
+        init_services()
+async def warm_up():
+    started = time.perf_counter()
+    for name in LAZY_MODULES:
+        await asyncio.to_thread(lazy_import, name)
+    get_http_client()
+    if os.environ.get("OPENROUTER_API_KEY"):
+        get_ai_client(os.environ["OPENROUTER_API_KEY"])
+    metrics.set("startup_warmup_seconds", time.perf_counter() - started)
+    logging.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.0f}ms")
+async def ensure_indexes():
+    try:
+        await db.image_blobs.create_index("sha256", unique=True)
+        await db.image_blobs.create_index("image_id")
+        await db.image_blobs.create_index([("storage_type", 1), ("last_accessed", 1)])
+        await db.outfits.create_index("image_hash")
+        await db.outfits.create_index([("user_id", 1), ("version", 1)])
+        await db.outfit_tombstones.create_index([("user_id", 1), ("version", 1)])
+        await db.wardrobe_versions.create_index("user_id", unique=True)
+        await db.users.create_index("last_active_date")
+        await db.group_stats.create_index("group_id", unique=True)
+        await db.shared_outfits_to_group.create_index([("group_id", 1), ("outfit_id", 1)])
+        await db.outfit_ratings.create_index([("group_id", 1), ("outfit_id", 1)])
+        await db.daily_suggestions.create_index([("user_id", 1), ("date", 1)], unique=True)
+        await db.daily_suggestions.create_index("date")
+        await db.daily_suggestions.create_index("expires_at", expireAfterSeconds=0)
+        await db.job_leases.create_index("expires_at", expireAfterSeconds=0)
+        if RATE_LIMIT_STORE == "mongo":
+            await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+    except Exception as e:
+        logging.warning(f"Could not create image_blobs index: {e}")
+@app.on_event("startup")
+async def create_indexes():
+    if FAST_STARTUP:
+        background_tasks.append(asyncio.create_task(ensure_indexes()))
+    else:
+        await ensure_indexes()
+@app.on_event("startup")
+async def start_background_tasks():
+    bus_task = await invalidation_bus.start()
+    if bus_task is not None:
+        background_tasks.append(bus_task)
+    if IMAGE_STORE_COLD in image_stores:
+        background_tasks.append(asyncio.create_task(image_tier_migrator()))
+    if IMAGE_GC_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(image_gc_scheduler()))
+    if SUGGESTION_PRECOMPUTE_ENABLED:
+        background_tasks.append(asyncio.create_task(suggestion_precompute_scheduler()))
+    if GROUP_STATS_RECONCILE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(group_stats_reconciler()))
+    if METRICS_ENABLED:
+        background_tasks.append(asyncio.create_task(event_loop_lag_monitor()))
+    if LOOP_STALL_THRESHOLD_MS > 0:
+        background_tasks.append(asyncio.create_task(LoopStallDetector(LOOP_STALL_THRESHOLD_MS / 1000).beat()))
+    if FAST_STARTUP and STARTUP_WARMUP:
+        background_tasks.append(asyncio.create_task(warm_up()))
+@app.on_event("startup")
+async def record_startup_complete():
+    ready = time.perf_counter() - IMPORT_STARTED
+    metrics.set("startup_ready_seconds", ready)
+    logging.info(f"Startup complete in {ready * 1000:.0f}ms (import {metrics.gauges[('startup_import_seconds', ())] * 1000:.0f}ms, fast startup {'on' if FAST_STARTUP else 'off'})")
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    mongo_client.close()
+    for task in background_tasks:
+        task.cancel()
+    if http_client is not None:
+        await http_client.aclose()
+    if mongo_client is not None:
+        mongo_client.close()
+metrics.set("startup_import_seconds", time.perf_counter() - IMPORT_STARTED)
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
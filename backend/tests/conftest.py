@@ -0,0 +1,33 @@
+import os
+import sys
+from pathlib import Path
+import httpx
+import pytest
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("IMAGE_GC_INTERVAL_SECONDS", "0")
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    from mongomock_motor import AsyncMongoMockClient
+    import server as module
+    monkeypatch.setattr(module, "db", AsyncMongoMockClient()["test"])
+    monkeypatch.setattr(module, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(module, "IMAGE_STORE_PRIMARY", "local")
+    monkeypatch.setitem(module.image_stores, "local", module.LocalImageStore(tmp_path))
+    module.wardrobe_indexes.indexes.clear()
+    return module
+@pytest.fixture
+async def client(server):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+        yield client
+@pytest.fixture
+def register(client):
+    async def register(username: str) -> dict:
+        response = await client.post("/api/auth/register", json={"username": username, "email": f"{username}@example.com", "password": "password", "gender": "female"})
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['token']}"}
+    return register
@@ -0,0 +1,11 @@
+import pytest
+pytestmark = pytest.mark.anyio
+async def test_admin_routes_are_keyed_on_user_id(server, client, register, monkeypatch):
+    admin = await register("admin")
+    admin_id = (await server.db.users.find_one({"username": "admin"}))["id"]
+    monkeypatch.setattr(server, "ADMIN_USER_IDS", {admin_id})
+    assert (await client.get("/api/admin/image-gc", headers=admin)).status_code == 200
+    intruder = await register("intruder")
+    assert (await client.put("/api/profile", data={"username": "root"}, headers=intruder)).status_code == 200
+    monkeypatch.setattr(server, "ADMIN_USER_IDS", {admin_id, "root"})
+    assert (await client.get("/api/admin/image-gc", headers=intruder)).status_code == 403
@@ -0,0 +1,78 @@
+import itertools
+import random
+import numpy as np
+import pytest
+import server
+GARMENTS = ["shirt", "tee", "kurta", "jeans", "skirt", "chinos", "dress", "saree", "sneakers", "boots", "loafers", "heels", "blazer", "cardigan", "scarf"]
+COLORS = ["red", "navy", "black", "white", "olive", "mustard", "pink", "beige", "teal", "grey", "brown"]
+def wardrobe(size: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"o{i}",
+            "name": f"{rng.choice(COLORS)} {rng.choice(GARMENTS)} {i}",
+            "category": rng.choice(server.RECOMMENDER_CATEGORIES),
+            "season": rng.choice(server.RECOMMENDER_SEASONS),
+            "color": rng.choice(COLORS),
+            "usage_count": rng.randint(0, 30),
+            "last_used": None,
+        }
+        for i in range(size)
+    ]
+def compatibility(a: tuple, b: tuple) -> float:
+    return float(server.COLOR_HARMONY[a[2], b[2]] * server.SEASON_OVERLAP[a[3], b[3]] * server.STYLE_HARMONY[a[1], b[1]])
+def look_score(signatures: list, item_scores: list) -> float:
+    pairs = list(itertools.combinations(signatures, 2))
+    harmony = sum(compatibility(a, b) for a, b in pairs) / len(pairs)
+    return server.COMBINATION_HARMONY_WEIGHT * harmony + (1 - server.COMBINATION_HARMONY_WEIGHT) * sum(item_scores) / len(item_scores)
+def brute_force(outfits: list, scores: np.ndarray, positions: dict, templates: list) -> list:
+    best = {}
+    for outfit in outfits:
+        signature = server.CombinationIndex.signature(outfit)
+        if signature is not None:
+            best[signature] = max(best.get(signature, -np.inf), float(scores[positions[outfit["id"]]]))
+    by_slot = {slot: [signature for signature in best if signature[0] == server.GARMENT_SLOT_NAMES.index(slot)] for slot in server.GARMENT_SLOT_NAMES}
+    looks = []
+    for template in templates:
+        for combo in itertools.product(*(by_slot[slot] for slot in template)):
+            looks.append(look_score(list(combo), [best[signature] for signature in combo]))
+    return sorted(looks, reverse=True)
+@pytest.mark.parametrize("size,seed", [(12, 1), (40, 2), (80, 3)])
+@pytest.mark.parametrize("layered", [False, True])
+def test_top_looks_match_brute_force(size, seed, layered):
+    outfits = wardrobe(size, seed)
+    index = server.WardrobeIndex(outfits)
+    now = server.datetime.now(server.timezone.utc)
+    scores = server.score_wardrobe(index.features(now), 8.0 if layered else 24.0, now)
+    templates = server.LOOK_TEMPLATES + (server.LAYERED_LOOK_TEMPLATES if layered else [])
+    limit = 5
+    looks = index.combination_index().top_looks(scores, index.positions, templates, limit)
+    expected = brute_force(outfits, scores, index.positions, templates)[:limit]
+    assert len(looks) == len(expected)
+    np.testing.assert_allclose([look[0] for look in looks], expected, rtol=1e-5, atol=1e-6)
+    by_id = {outfit["id"]: outfit for outfit in outfits}
+    score, slots, outfit_ids = looks[0]
+    assert tuple(slots) in templates
+    assert [server.garment_slot(by_id[outfit_id]) for outfit_id in outfit_ids] == list(slots)
+    signatures = [server.CombinationIndex.signature(by_id[outfit_id]) for outfit_id in outfit_ids]
+    assert look_score(signatures, [float(scores[index.positions[outfit_id]]) for outfit_id in outfit_ids]) == pytest.approx(score, rel=1e-5, abs=1e-6)
+def test_incremental_updates_match_rebuild():
+    outfits = wardrobe(120, 4)
+    index = server.WardrobeIndex(outfits)
+    combinations = index.combination_index()
+    for outfit in outfits[:60]:
+        index.remove(outfit["id"])
+    for outfit in wardrobe(160, 5)[120:]:
+        index.upsert(outfit)
+    fresh = server.CombinationIndex(index.outfits)
+    assert sorted(combinations.keys) == sorted(fresh.keys)
+    assert {key: combinations.members[combinations.rows[key]] for key in combinations.keys} == {key: fresh.members[fresh.rows[key]] for key in fresh.keys}
+    for a in fresh.keys:
+        for b in fresh.keys:
+            assert combinations.matrix[combinations.rows[a], combinations.rows[b]] == pytest.approx(fresh.matrix[fresh.rows[a], fresh.rows[b]])
+def test_wardrobe_without_a_full_look_has_no_combinations():
+    outfits = [{"id": "a", "name": "Blue shirt", "category": "casual", "season": "all", "color": "blue", "usage_count": 0, "last_used": None}]
+    index = server.WardrobeIndex(outfits)
+    now = server.datetime.now(server.timezone.utc)
+    scores = server.score_wardrobe(index.features(now), None, now)
+    assert index.combination_index().top_looks(scores, index.positions, server.LOOK_TEMPLATES, 5) == []
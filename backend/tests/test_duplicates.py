@@ -0,0 +1,64 @@
+import io
+import random
+import pytest
+from PIL import Image, ImageDraw
+import server
+def hashed_outfits(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    bases = [rng.getrandbits(64) for _ in range(count // 4)]
+    outfits = []
+    for i in range(count):
+        value = rng.choice(bases)
+        for bit in rng.sample(range(64), rng.randint(0, 10)):
+            value ^= 1 << bit
+        outfits.append({"id": f"o{i}", "image_dhash": f"{value:016x}"})
+    return outfits
+def brute_force_near(outfits: list, value: int, max_distance: int) -> list:
+    matches = []
+    for outfit in outfits:
+        other = int(outfit["image_dhash"], 16)
+        if other and server.hamming_distance(value, other) <= max_distance:
+            matches.append((server.hamming_distance(value, other), outfit["id"]))
+    return sorted(matches)
+@pytest.mark.parametrize("max_distance", range(server.DUPLICATE_SEARCH_LIMIT + 1))
+def test_near_matches_brute_force(max_distance):
+    outfits = hashed_outfits(400, max_distance)
+    index = server.DuplicateIndex(outfits)
+    rng = random.Random(100 + max_distance)
+    queries = [int(outfit["image_dhash"], 16) for outfit in rng.sample(outfits, 50)] + [rng.getrandbits(64) for _ in range(20)]
+    for value in queries:
+        assert index.near(value, max_distance) == brute_force_near(outfits, value, max_distance)
+def test_groups_are_connected_components():
+    outfits = hashed_outfits(200, 7)
+    index = server.DuplicateIndex(outfits)
+    parent = {outfit["id"]: outfit["id"] for outfit in outfits}
+    def find(outfit_id):
+        while parent[outfit_id] != outfit_id:
+            outfit_id = parent[outfit_id]
+        return outfit_id
+    for i, a in enumerate(outfits):
+        for b in outfits[i + 1:]:
+            if server.hamming_distance(int(a["image_dhash"], 16), int(b["image_dhash"], 16)) <= server.DUPLICATE_MAX_DISTANCE:
+                parent[find(b["id"])] = find(a["id"])
+    expected = {}
+    for outfit in outfits:
+        expected.setdefault(find(outfit["id"]), set()).add(outfit["id"])
+    assert sorted(map(sorted, index.groups())) == sorted(sorted(members) for members in expected.values() if len(members) > 1)
+def test_remove_and_flat_images_are_not_matched():
+    index = server.DuplicateIndex([{"id": "a", "image_dhash": "00000000000000ff"}, {"id": "flat", "image_dhash": "0000000000000000"}])
+    assert index.near(0xff, 0) == [(0, "a")]
+    assert "flat" not in index.hashes
+    index.remove("a")
+    assert index.near(0xff, server.DUPLICATE_SEARCH_LIMIT) == []
+def test_resized_photo_stays_within_threshold():
+    image = Image.new("RGB", (320, 240), (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 320, 40):
+        draw.rectangle([i, i // 2, i + 25, i // 2 + 90], fill=(i % 255, 80, 160))
+    def encoded(img, size, quality):
+        output = io.BytesIO()
+        img.resize(size).save(output, "JPEG", quality=quality)
+        return output.getvalue()
+    original = int(server.image_dhash_from_bytes(encoded(image, (320, 240), 95)), 16)
+    resized = int(server.image_dhash_from_bytes(encoded(image, (160, 120), 60)), 16)
+    assert server.hamming_distance(original, resized) <= server.DUPLICATE_MAX_DISTANCE
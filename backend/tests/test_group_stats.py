@@ -0,0 +1,71 @@
+import pytest
+pytestmark = pytest.mark.anyio
+def without_timestamps(stats: dict) -> dict:
+    return {key: value for key, value in stats.items() if key not in ("updated_at", "reconciled_at")}
+async def add_outfits(client, headers: dict, names: list) -> list:
+    ids = []
+    for name in names:
+        response = await client.post("/api/outfits", data={"name": name, "category": "casual", "season": "all", "color": "red"}, headers=headers)
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["id"])
+    return ids
+async def test_incremental_stats_match_reconcile(server, client, register):
+    owner = await register("owner")
+    member = await register("member")
+    outsider = await register("outsider")
+    group = (await client.post("/api/groups/create", json={"name": "Friends"}, headers=owner)).json()
+    assert (await client.post("/api/groups/join", json={"invite_code": group["invite_code"]}, headers=member)).status_code == 200
+    mine = await add_outfits(client, owner, ["Red shirt", "Blue jeans", "Green dress"])
+    theirs = await add_outfits(client, member, ["Black boots"])
+    for outfit_id in mine:
+        assert (await client.post(f"/api/groups/{group['id']}/share", data={"outfit_id": outfit_id}, headers=owner)).status_code == 200
+    assert (await client.post(f"/api/groups/{group['id']}/share", data={"outfit_id": theirs[0]}, headers=member)).status_code == 200
+    for outfit_id, rating, headers in [(mine[0], 5, member), (mine[1], 3, member), (mine[1], 4, member), (mine[2], 2, member), (mine[2], 2, member), (theirs[0], 1, owner)]:
+        response = await client.post(f"/api/groups/{group['id']}/outfits/{outfit_id}/rate", json={"rating": rating}, headers=headers)
+        assert response.status_code == 200, response.text
+    incremental = (await client.get(f"/api/groups/{group['id']}/stats", headers=owner)).json()
+    assert incremental["shares_count"] == 4
+    assert incremental["ratings_count"] == 4
+    assert incremental["rating_distribution"] == {"1": 1, "2": 1, "3": 0, "4": 1, "5": 1}
+    assert incremental["average_rating"] == 3.0
+    assert [entry["name"] for entry in incremental["top_rated"]] == ["Red shirt", "Blue jeans", "Green dress", "Black boots"]
+    assert [(entry["username"], entry["shares"]) for entry in incremental["top_sharers"]] == [("owner", 3), ("member", 1)]
+    assert sum(week["shares"] for week in incremental["weekly_activity"]) == 4
+    stored = await server.db.group_stats.find_one({"group_id": group["id"]}, {"_id": 0})
+    reconciled = await server.reconcile_group_stats(group["id"])
+    assert without_timestamps(stored) == without_timestamps(reconciled)
+    assert without_timestamps((await client.get(f"/api/groups/{group['id']}/stats", headers=member)).json()) == without_timestamps(incremental)
+    assert (await client.get(f"/api/groups/{group['id']}/stats", headers=outsider)).status_code == 403
+    assert (await client.get("/api/groups/missing/stats", headers=owner)).status_code == 404
+async def test_missing_rollup_is_rebuilt(server, client, register):
+    owner = await register("owner")
+    group = (await client.post("/api/groups/create", json={"name": "Solo"}, headers=owner)).json()
+    first, second = await add_outfits(client, owner, ["Red shirt", "Blue jeans"])
+    await client.post(f"/api/groups/{group['id']}/share", data={"outfit_id": first}, headers=owner)
+    await server.db.group_stats.delete_one({"group_id": group["id"]})
+    await client.post(f"/api/groups/{group['id']}/share", data={"outfit_id": second}, headers=owner)
+    stats = (await client.get(f"/api/groups/{group['id']}/stats", headers=owner)).json()
+    assert stats["shares_count"] == 2
+    assert stats["top_sharers"] == [{"user_id": stats["top_sharers"][0]["user_id"], "username": "owner", "shares": 2}]
+async def test_deleted_and_renamed_outfits_update_the_rollup(server, client, register):
+    owner = await register("owner")
+    member = await register("member")
+    group = (await client.post("/api/groups/create", json={"name": "Friends"}, headers=owner)).json()
+    await client.post("/api/groups/join", json={"invite_code": group["invite_code"]}, headers=member)
+    kept, removed = await add_outfits(client, owner, ["Red shirt", "Blue jeans"])
+    for outfit_id in (kept, removed):
+        await client.post(f"/api/groups/{group['id']}/share", data={"outfit_id": outfit_id}, headers=owner)
+    await client.post(f"/api/groups/{group['id']}/outfits/{kept}/rate", json={"rating": 4}, headers=member)
+    await client.post(f"/api/groups/{group['id']}/outfits/{removed}/rate", json={"rating": 5}, headers=member)
+    assert (await client.delete(f"/api/outfits/{removed}", headers=owner)).status_code == 200
+    renamed = await client.put(f"/api/outfits/{kept}", data={"name": "Crimson shirt", "category": "casual", "season": "all", "color": "red"}, headers=owner)
+    assert renamed.status_code == 200, renamed.text
+    stats = (await client.get(f"/api/groups/{group['id']}/stats", headers=owner)).json()
+    assert stats["shares_count"] == 1
+    assert stats["ratings_count"] == 1
+    assert stats["rating_distribution"]["5"] == 0
+    assert [entry["name"] for entry in stats["top_rated"]] == ["Crimson shirt"]
+    assert [entry["shares"] for entry in stats["top_sharers"]] == [1]
+    stored = await server.db.group_stats.find_one({"group_id": group["id"]}, {"_id": 0})
+    reconciled = await server.reconcile_group_stats(group["id"])
+    assert without_timestamps(stored) == without_timestamps(reconciled)
@@ -0,0 +1,86 @@
+import io
+import pytest
+from PIL import Image
+pytestmark = pytest.mark.anyio
+def png(color=(200, 40, 40)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(output, "PNG")
+    return output.getvalue()
+async def create_outfit(client, headers: dict, name: str, image: bytes = None, image_url: str = None) -> dict:
+    data = {"name": name, "category": "casual", "season": "all", "color": "red"}
+    if image_url:
+        data["image_url"] = image_url
+    files = {"image": ("photo.png", image, "image/png")} if image else None
+    response = await client.post("/api/outfits", data=data, files=files, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()
+async def blob_ref_counts(server) -> list:
+    return [blob["ref_count"] async for blob in server.db.image_blobs.find({}, {"_id": 0})]
+async def test_blob_ref_count_follows_create_copy_and_delete(server, client, register, tmp_path):
+    owner = await register("owner")
+    friend = await register("friend")
+    first = await create_outfit(client, owner, "First", png())
+    second = await create_outfit(client, owner, "Second", png())
+    assert first["image_url"] == second["image_url"]
+    assert await blob_ref_counts(server) == [2]
+    blob = await server.db.image_blobs.find_one({}, {"_id": 0})
+    stored = tmp_path / blob["locator"]
+    assert stored.exists()
+    token = (await client.post(f"/api/outfits/{first['id']}/share", headers=owner)).json()["share_url"].split("/")[-1]
+    copied = await client.post(f"/api/shared-outfit/{token}/add-to-wardrobe", headers=friend)
+    assert copied.status_code == 200, copied.text
+    assert await blob_ref_counts(server) == [3]
+    assert (await client.delete(f"/api/outfits/{second['id']}", headers=owner)).status_code == 200
+    assert (await client.delete(f"/api/outfits/{first['id']}", headers=owner)).status_code == 200
+    assert await blob_ref_counts(server) == [1]
+    assert stored.exists()
+    assert (await client.delete(f"/api/outfits/{copied.json()['id']}", headers=friend)).status_code == 200
+    assert await blob_ref_counts(server) == []
+    assert not stored.exists()
+async def test_distinct_images_get_separate_blobs(server, client, register):
+    owner = await register("owner")
+    await create_outfit(client, owner, "Red", png((200, 40, 40)))
+    await create_outfit(client, owner, "Blue", png((40, 40, 200)))
+    assert sorted(await blob_ref_counts(server)) == [1, 1]
+async def test_upload_image_file_survives_blob_release(server, client, register, tmp_path):
+    owner = await register("owner")
+    uploaded = await client.post("/api/upload-image", files={"file": ("photo.png", png(), "image/png")}, headers=owner)
+    assert uploaded.status_code == 200, uploaded.text
+    await create_outfit(client, owner, "From upload", image_url=uploaded.json()["image_url"])
+    managed = await create_outfit(client, owner, "Managed", png())
+    assert (await client.delete(f"/api/outfits/{managed['id']}", headers=owner)).status_code == 200
+    assert await blob_ref_counts(server) == []
+    assert (tmp_path / uploaded.json()["filename"]).exists()
+async def test_reupload_during_release_keeps_its_own_file(server, client, register, tmp_path, monkeypatch):
+    owner = await register("owner")
+    first = await create_outfit(client, owner, "First", png())
+    content = (tmp_path / (await server.db.image_blobs.find_one({}))["locator"]).read_bytes()
+    delete_stored_image = server.delete_stored_image
+    async def delete_after_reupload(storage_type, locator):
+        monkeypatch.setattr(server, "delete_stored_image", delete_stored_image)
+        await server.store_image_blob(content, ".png")
+        await delete_stored_image(storage_type, locator)
+    monkeypatch.setattr(server, "delete_stored_image", delete_after_reupload)
+    assert (await client.delete(f"/api/outfits/{first['id']}", headers=owner)).status_code == 200
+    blob = await server.db.image_blobs.find_one({}, {"_id": 0})
+    assert blob["ref_count"] == 1
+    assert (tmp_path / blob["locator"]).read_bytes() == content
+async def test_gc_keeps_images_referenced_after_mark(server, client, register, tmp_path, monkeypatch):
+    owner = await register("owner")
+    await create_outfit(client, owner, "Kept", png((200, 40, 40)))
+    orphan = await server.store_image_blob(png((40, 200, 40)), ".png")
+    (tmp_path / "stray.png").write_bytes(png((90, 90, 90)))
+    collect_image_references = server.collect_image_references
+    async def create_after_mark():
+        refs = await collect_image_references()
+        await create_outfit(client, owner, "Late", png((40, 40, 200)))
+        return refs
+    monkeypatch.setattr(server, "collect_image_references", create_after_mark)
+    monkeypatch.setattr(server, "IMAGE_GC_GRACE_SECONDS", -60)
+    status = await server.run_image_gc(dry_run=False)
+    assert status["error"] is None
+    assert status["deleted"] == 2
+    blobs = [blob async for blob in server.db.image_blobs.find({}, {"_id": 0})]
+    assert len(blobs) == 2
+    assert orphan["sha256"] not in {blob["sha256"] for blob in blobs}
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(blob["locator"] for blob in blobs)
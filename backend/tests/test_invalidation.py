@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+pytestmark = pytest.mark.anyio
+async def eventually(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+async def test_publish_evicts_caches_on_other_workers_through_polling(server, monkeypatch):
+    monkeypatch.setattr(server, "INVALIDATION_POLL_SECONDS", 0.01)
+    workers = {}
+    for name in ["a", "b"]:
+        indexes = server.WardrobeIndexCache(server.WARDROBE_INDEX_MEMORY_BUDGET, 60)
+        users = server.UserCache(60, 100)
+        bus = server.InvalidationBus(server.MongoInvalidationTransport(), worker_id=name)
+        bus.subscribe("wardrobe", indexes.invalidate)
+        bus.subscribe("user", users.invalidate)
+        received = []
+        bus.subscribe("wardrobe", received.append)
+        workers[name] = (bus, indexes, users, received)
+    tasks = [await bus.start() for bus, _, _, _ in workers.values()]
+    try:
+        assert not any(bus.transport.capped for bus, _, _, _ in workers.values())
+        for _, indexes, users, _ in workers.values():
+            await indexes.get("u1")
+            users.put({"id": "u1", "username": "someone"})
+        publisher, a_indexes, a_users, a_received = workers["a"]
+        _, b_indexes, b_users, b_received = workers["b"]
+        await publisher.publish("wardrobe", "u1")
+        await publisher.publish("user", "u1")
+        await eventually(lambda: "u1" not in b_indexes.indexes and b_users.get("u1") is None)
+        assert "u1" in a_indexes.indexes
+        assert a_users.get("u1") is not None
+        await asyncio.sleep(0.05)
+        assert b_received == ["u1"]
+        assert a_received == []
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
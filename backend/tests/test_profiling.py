@@ -0,0 +1,19 @@
+import pytest
+pytestmark = pytest.mark.anyio
+@pytest.fixture
+def profiling(server, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(server, "PROFILE_DIR", tmp_path / "profiles")
+    return server
+async def test_profiling_needs_a_token(profiling, client, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", None)
+    for request in ({"headers": {"X-Profile": "1"}}, {"params": {"profile": "1"}}):
+        response = await client.get("/api/health", **request)
+        assert "x-profile" not in response.headers
+    assert not profiling.PROFILE_DIR.exists()
+async def test_saved_profiles_are_capped(profiling, client, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 3)
+    assert "x-profile" not in (await client.get("/api/health", headers={"X-Profile": "1"})).headers
+    names = [(await client.get("/api/health", headers={"X-Profile": "secret"})).headers["x-profile"] for _ in range(5)]
+    assert sorted(path.name for path in profiling.PROFILE_DIR.iterdir()) == sorted(set(names))[-3:]
@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+pytestmark = pytest.mark.anyio
+@pytest.fixture
+def rate_limited(server, monkeypatch):
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(server, "rate_limit_store", server.MemoryRateLimitStore())
+    return server
+async def test_login_burst_gets_429_with_retry_after(rate_limited, client):
+    statuses = [(await client.post("/api/auth/login", json={"username": "nobody", "password": "wrong"})) for _ in range(11)]
+    assert [response.status_code for response in statuses[:10]] == [401] * 10
+    assert statuses[10].status_code == 429
+    assert 1 <= int(statuses[10].headers["Retry-After"]) <= 60
+async def test_image_loads_do_not_use_the_global_budget(rate_limited, client, register):
+    headers = await register("viewer")
+    for i in range(350):
+        assert (await client.get(f"/api/images/missing-{i}", headers=headers)).status_code != 429
+    assert (await client.get("/api/outfits", headers=headers)).status_code == 200
+def test_memory_store_evicts_least_recently_used_without_full_scans(server, monkeypatch):
+    store = server.MemoryRateLimitStore(max_keys=5)
+    scans = []
+    monkeypatch.setattr(store, "prune", lambda: scans.append(len(store.buckets)))
+    async def hit_all():
+        for i in range(50):
+            await store.hit(f"client-{i}", 10, 60)
+        await store.hit("client-45", 10, 60)
+        await store.hit("client-new", 10, 60)
+    asyncio.run(hit_all())
+    assert list(store.buckets) == ["client-47", "client-48", "client-49", "client-45", "client-new"]
+    assert scans == []
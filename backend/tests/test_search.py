@@ -0,0 +1,51 @@
+import pytest
+import server
+def outfits() -> list:
+    return [
+        {"id": "o1", "name": "Denim Jacket", "category": "casual", "color": "blue"},
+        {"id": "o2", "name": "Linen Shirt", "category": "formal", "color": "white"},
+        {"id": "o3", "name": "Running Shorts", "category": "sport", "color": "black"},
+    ]
+def test_prefix_matches_rank_below_exact_matches():
+    index = server.OutfitSearchIndex(outfits() + [{"id": "o4", "name": "Jack Boots", "category": "casual", "color": "brown"}])
+    scores = index.search("jack")
+    assert set(scores) == {"o1", "o4"}
+    assert scores["o4"] > scores["o1"]
+    assert set(index.search("lin sh")) == {"o2"}
+@pytest.mark.parametrize("query, expected", [("jaket", "o1"), ("shirtt", "o2"), ("runing", "o3"), ("dennim", "o1")])
+def test_typos_still_match(query, expected):
+    assert list(server.OutfitSearchIndex(outfits()).search(query)) == [expected]
+def test_unrelated_query_matches_nothing():
+    index = server.OutfitSearchIndex(outfits())
+    assert index.search("sweater") == {}
+    assert set(index.search("")) == {"o1", "o2", "o3"}
+def test_index_follows_edits_and_deletes():
+    index = server.OutfitSearchIndex(outfits())
+    index.add({"id": "o1", "name": "Wool Coat", "category": "formal", "color": "grey"})
+    assert index.search("denim") == {}
+    assert set(index.search("coat")) == {"o1"}
+    index.remove("o3")
+    assert index.search("running") == {}
+    assert not any("running" in tokens for tokens in index.trigram_tokens.values())
+    assert set(index.search("formal")) == {"o1", "o2"}
+@pytest.mark.anyio
+async def test_search_endpoint_sees_updates_and_deletes(server, client, register):
+    headers = await register("searcher")
+    form = {"category": "casual", "season": "all", "color": "blue"}
+    created = []
+    for name in ["Denim Jacket", "Denim Skirt"]:
+        response = await client.post("/api/outfits", data=dict(form, name=name), headers=headers)
+        assert response.status_code == 201, response.text
+        created.append(response.json()["id"])
+    async def search(q):
+        response = await client.get("/api/outfits/search", params={"q": q}, headers=headers)
+        assert response.status_code == 200, response.text
+        return [result["id"] for result in response.json()["results"]]
+    assert sorted(await search("denm")) == sorted(created)
+    response = await client.put(f"/api/outfits/{created[0]}", data=dict(form, name="Leather Jacket"), headers=headers)
+    assert response.status_code == 200, response.text
+    assert await search("denim") == [created[1]]
+    assert await search("lether") == [created[0]]
+    assert (await client.delete(f"/api/outfits/{created[1]}", headers=headers)).status_code == 200
+    assert await search("denim") == []
+    assert await search("jack") == [created[0]]
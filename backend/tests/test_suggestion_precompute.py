@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+pytestmark = pytest.mark.anyio
+def today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+async def test_job_lease_is_exclusive_until_it_expires(server, monkeypatch):
+    assert await server.acquire_job_lease("job", 60)
+    assert await server.acquire_job_lease("job", 60)
+    monkeypatch.setattr(server, "WORKER_ID", "other-worker")
+    assert not await server.acquire_job_lease("job", 60)
+    await server.db.job_leases.update_one({"_id": "job"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+    assert await server.acquire_job_lease("job", 60)
+    assert (await server.db.job_leases.find_one({"_id": "job"}))["owner"] == "other-worker"
+async def test_precompute_skips_when_another_worker_holds_the_lease(server, monkeypatch):
+    await server.db.job_leases.insert_one({"_id": f"precompute:{today()}", "owner": "other-worker", "expires_at": datetime.now(timezone.utc) + timedelta(hours=1)})
+    await server.db.users.insert_one({"id": "u1", "username": "u1", "last_active_date": today()})
+    calls = []
+    async def precompute(user_id, *args):
+        calls.append(user_id)
+        return 0
+    monkeypatch.setattr(server, "precompute_user_suggestions", precompute)
+    status = await server.run_suggestion_precompute()
+    assert status["skipped_lease"]
+    assert calls == []
+async def test_precompute_skips_users_claimed_by_another_worker(server, monkeypatch):
+    for user_id in ("u1", "u2", "u3"):
+        await server.db.users.insert_one({"id": user_id, "username": user_id, "last_active_date": today()})
+    await server.db.job_leases.insert_one({"_id": f"precompute:{today()}:u2", "owner": "other-worker", "expires_at": datetime.now(timezone.utc) + timedelta(hours=1)})
+    calls = []
+    async def precompute(user_id, *args):
+        calls.append(user_id)
+        return 0
+    monkeypatch.setattr(server, "precompute_user_suggestions", precompute)
+    status = await server.run_suggestion_precompute()
+    assert not status["skipped_lease"]
+    assert sorted(calls) == ["u1", "u3"]
+async def test_using_an_outfit_keeps_precomputed_suggestions(server, client, register):
+    headers = await register("owner")
+    outfit = (await client.post("/api/outfits", data={"name": "Red shirt", "category": "casual", "season": "all", "color": "red"}, headers=headers)).json()
+    user_id = outfit["user_id"]
+    precomputed = {"suggestions": [], "reasoning": "precomputed overnight"}
+    await server.db.daily_suggestions.insert_one({"user_id": user_id, "date": today(), "cell": None, "ai": precomputed, "weather": None})
+    assert (await client.post(f"/api/outfits/{outfit['id']}/use", headers=headers)).status_code == 200
+    assert (await client.post("/api/suggestions/ai", headers=headers)).json()["reasoning"] == "precomputed overnight"
+    await client.post("/api/outfits", data={"name": "Blue jeans", "category": "casual", "season": "all", "color": "blue"}, headers=headers)
+    assert await server.db.daily_suggestions.count_documents({"user_id": user_id}) == 0
@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import server
+pytestmark = pytest.mark.anyio
+def upstream(timeout: float = 1.0) -> server.Upstream:
+    result = server.Upstream("test", timeout)
+    result.breaker = server.CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    return result
+async def succeed():
+    return "ok"
+async def fail():
+    raise RuntimeError("upstream error")
+async def test_breaker_opens_half_opens_and_closes():
+    target = upstream()
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await target.call(fail)
+    assert target.breaker.state == "open"
+    with pytest.raises(server.CircuitOpenError):
+        await target.call(succeed)
+    await asyncio.sleep(0.06)
+    gate = asyncio.Event()
+    async def probe():
+        await gate.wait()
+        return "probe"
+    probing = asyncio.create_task(target.call(probe))
+    await asyncio.sleep(0)
+    assert target.breaker.state == "half_open"
+    with pytest.raises(server.CircuitOpenError):
+        await target.call(succeed)
+    gate.set()
+    assert await probing == "probe"
+    assert target.breaker.state == "closed"
+    assert await target.call(succeed) == "ok"
+async def test_failed_probe_reopens():
+    target = upstream()
+    target.breaker.state, target.breaker.opened_at = "open", 0.0
+    with pytest.raises(RuntimeError):
+        await target.call(fail)
+    assert target.breaker.state == "open"
+    with pytest.raises(server.CircuitOpenError):
+        await target.call(succeed)
+async def test_deadline_raises_timeout_and_counts_as_failure():
+    target = upstream(timeout=0.01)
+    with pytest.raises(TimeoutError):
+        await target.call(asyncio.sleep, 1)
+    assert target.breaker.failures == 1
+    with pytest.raises(TimeoutError):
+        await target.call(asyncio.sleep, 1)
+    assert target.breaker.state == "open"
+async def test_cancelled_probe_does_not_wedge_the_breaker():
+    target = upstream()
+    target.breaker.state, target.breaker.opened_at = "open", 0.0
+    probing = asyncio.create_task(target.call(asyncio.sleep, 1))
+    await asyncio.sleep(0.01)
+    probing.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probing
+    assert target.breaker.state == "open"
+    assert not target.breaker.probe_in_flight
+    await asyncio.sleep(0.06)
+    assert await target.call(succeed) == "ok"
+    assert target.breaker.state == "closed"
+async def test_hedged_request_cancels_the_slow_model(monkeypatch):
+    started = []
+    async def create(model, messages, **kwargs):
+        started.append(model)
+        await asyncio.sleep(1 if model == "slow" else 0)
+        return model
+    monkeypatch.setattr(server, "get_ai_client", lambda api_key: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(server, "AI_MODELS", ["slow", "fast"])
+    monkeypatch.setattr(server, "AI_HEDGE_DELAY_SECONDS", 0.01)
+    slow, fast = upstream(), upstream()
+    slow.breaker.state, slow.breaker.opened_at = "open", 0.0
+    monkeypatch.setitem(server.upstreams, "llm:slow", slow)
+    monkeypatch.setitem(server.upstreams, "llm:fast", fast)
+    assert await server.llm_chat_completion("key", []) == "fast"
+    assert started == ["slow", "fast"]
+    await asyncio.sleep(0.01)
+    assert slow.breaker.state == "open"
+    assert not slow.breaker.probe_in_flight
+    assert fast.breaker.state == "closed"
@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+pytestmark = pytest.mark.anyio
+async def add_outfit(client, headers: dict, name: str) -> dict:
+    response = await client.post("/api/outfits", data={"name": name, "category": "casual", "season": "all", "color": "red"}, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()
+async def test_concurrent_writes_get_distinct_increasing_versions(server, client, register):
+    headers = await register("owner")
+    await asyncio.gather(*(add_outfit(client, headers, f"Outfit {i}") for i in range(10)))
+    versions = sorted([outfit["version"] async for outfit in server.db.outfits.find({}, {"_id": 0, "version": 1})])
+    assert versions == list(range(1, 11))
+    changes = (await client.get("/api/outfits/changes?since=0", headers=headers)).json()
+    assert changes["version"] == 10
+    assert len(changes["upserts"]) == 10
+async def test_version_is_not_advertised_before_earlier_writes_land(server):
+    gate = asyncio.Event()
+    async def slow_write():
+        async with server.wardrobe_write("user") as version:
+            await gate.wait()
+            await server.db.outfits.insert_one({"id": "slow", "user_id": "user", "version": version})
+    async def fast_write():
+        async with server.wardrobe_write("user") as version:
+            await server.db.outfits.insert_one({"id": "fast", "user_id": "user", "version": version})
+    slow = asyncio.create_task(slow_write())
+    await asyncio.sleep(0.01)
+    fast = asyncio.create_task(fast_write())
+    await asyncio.sleep(0.05)
+    assert await server.get_wardrobe_version("user") == 0
+    gate.set()
+    await asyncio.gather(slow, fast)
+    assert await server.get_wardrobe_version("user") == 2
+async def test_changes_report_upserts_and_tombstones(client, register):
+    headers = await register("owner")
+    kept = await add_outfit(client, headers, "Kept")
+    removed = await add_outfit(client, headers, "Removed")
+    since = (await client.get("/api/outfits/changes?since=0", headers=headers)).json()["version"]
+    assert (await client.post(f"/api/outfits/{kept['id']}/use", headers=headers)).status_code == 200
+    assert (await client.delete(f"/api/outfits/{removed['id']}", headers=headers)).status_code == 200
+    changes = (await client.get(f"/api/outfits/changes?since={since}", headers=headers)).json()
+    assert changes["version"] == since + 2
+    assert [outfit["id"] for outfit in changes["upserts"]] == [kept["id"]]
+    assert changes["upserts"][0]["usage_count"] == 1
+    assert changes["deleted"] == [removed["id"]]
+    assert (await client.get(f"/api/outfits/changes?since={changes['version']}", headers=headers)).json() == {"version": changes["version"], "upserts": [], "deleted": []}
+async def test_outfit_list_etag(client, register):
+    headers = await register("owner")
+    await add_outfit(client, headers, "First")
+    listed = await client.get("/api/outfits", headers=headers)
+    etag = listed.headers["ETag"]
+    cached = await client.get("/api/outfits", headers={**headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    await add_outfit(client, headers, "Second")
+    refreshed = await client.get("/api/outfits", headers={**headers, "If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["ETag"] != etag
+    assert len(refreshed.json()) == 2